@@ -0,0 +1,178 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from base import pubsub
+from base.settings import redis
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+local_caches: Dict[str, "LocalCache"] = {}
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL.
+
+    Entries can be grouped under a tag (e.g. a user id) so every entry of
+    that tag is dropped at once when another worker publishes an
+    invalidation for it.
+    """
+
+    def __init__(self, name: str, maxsize: int, max_bytes: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, int, str | None]]" = (
+            OrderedDict()
+        )
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._bytes = 0
+        # bumped per tag on every invalidation; lets a caller skip storing
+        # a value it loaded before an invalidation of its tag landed
+        # meanwhile. The generation covers clears and untagged deletes, and
+        # the tag counters are dropped under a new generation once there
+        # are too many of them.
+        self._generation = 0
+        self._tag_epochs: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        local_caches[name] = self
+
+    def epoch(self, tag: Optional[str] = None) -> Tuple[int, int]:
+        """Snapshot to pass to ``set`` for a value of ``tag`` being loaded."""
+        return self._generation, self._tag_epochs.get(tag, 0) if tag else 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tag: Optional[str] = None,
+        size: Optional[int] = None,
+        epoch: Optional[Tuple[int, int]] = None,
+        ttl: Optional[float] = None,
+    ) -> None:
+        # ttl can only shorten the cache's own ttl for this entry
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if not self.enabled or ttl <= 0:
+            return
+        if epoch is not None and epoch != self.epoch(tag):
+            return
+        size = sys.getsizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + ttl, size, tag)
+        self._bytes += size
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._entries.get(key)
+        tag = entry[3] if entry is not None else None
+        if tag is None:
+            self._generation += 1
+        else:
+            self._bump_tag(tag)
+        if entry is not None:
+            self._remove(key)
+
+    def invalidate_tag(self, tag: str) -> None:
+        self._bump_tag(tag)
+        for key in self._tags.pop(tag, set()):
+            self._remove(key)
+
+    def _bump_tag(self, tag: str) -> None:
+        if tag not in self._tag_epochs and len(self._tag_epochs) >= max(
+            self.maxsize, 1024
+        ):
+            self._generation += 1
+            self._tag_epochs.clear()
+        self._tag_epochs[tag] = self._tag_epochs.get(tag, 0) + 1
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._tag_epochs.clear()
+        self._entries.clear()
+        self._tags.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size, tag = self._entries.pop(key)
+        self._bytes -= size
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def local_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {name: cache.stats() for name, cache in local_caches.items()}
+
+
+def invalidation_message(cache_name: str, tag: str) -> str:
+    return f"{cache_name}:{tag}"
+
+
+async def publish_invalidation(cache_name: str, tag: str) -> None:
+    local_caches[cache_name].invalidate_tag(tag)
+    await redis.publish(INVALIDATION_CHANNEL, invalidation_message(cache_name, tag))
+
+
+def _apply_invalidation(message: dict) -> None:
+    cache_name, _, tag = message["data"].partition(":")
+    cache = local_caches.get(cache_name)
+    if cache is not None:
+        cache.invalidate_tag(tag)
+
+
+async def _clear_local_caches() -> None:
+    for cache in local_caches.values():
+        cache.clear()
+
+
+async def listen_for_invalidations(reconnect_delay: float = 1.0) -> None:
+    """Keep local caches coherent with writes made by other workers."""
+    await pubsub.listen(
+        redis,
+        "Cache invalidation",
+        _apply_invalidation,
+        _clear_local_caches,
+        channels=[INVALIDATION_CHANNEL],
+        reconnect_delay=reconnect_delay,
+    )
@@ -0,0 +1,67 @@
+import zlib
+from typing import Callable, Dict, NamedTuple
+
+from base.settings import CACHE_CODEC, CACHE_COMPRESS_MIN_BYTES
+
+
+class Codec(NamedTuple):
+    tag: bytes
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+# every stored payload starts with its codec tag; untagged payloads are
+# JSON written before tagging existed and are read as raw
+RAW = Codec(b"J", lambda data: data, lambda data: data)
+LEGACY_PREFIXES = (b"{", b"[")
+
+codecs: Dict[str, Codec] = {
+    "raw": RAW,
+    "zlib": Codec(b"Z", lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+else:
+    codecs["zstd"] = Codec(
+        b"S",
+        zstandard.ZstdCompressor(level=3).compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover - optional dependency
+    pass
+else:
+    codecs["lz4"] = Codec(b"L", lz4.frame.compress, lz4.frame.decompress)
+
+if CACHE_CODEC not in codecs:
+    raise RuntimeError(
+        f"CACHE_CODEC={CACHE_CODEC!r} is not available, "
+        f"choose one of: {', '.join(codecs)}"
+    )
+
+codecs_by_tag: Dict[bytes, Codec] = {codec.tag: codec for codec in codecs.values()}
+
+
+def encode_payload(data: bytes, codec_name: str = CACHE_CODEC) -> bytes:
+    codec = codecs[codec_name]
+    if len(data) < CACHE_COMPRESS_MIN_BYTES:
+        codec = RAW
+    return codec.tag + codec.compress(data)
+
+
+def decode_payload(data: bytes) -> bytes | None:
+    """Decode a stored payload, ``None`` if this worker can't read it."""
+    if data.startswith(LEGACY_PREFIXES):
+        return data
+    codec = codecs_by_tag.get(data[:1])
+    if codec is None:
+        return None
+    try:
+        return codec.decompress(data[1:])
+    except Exception:
+        return None
@@ -0,0 +1,121 @@
+"""Tortoise engine for Postgres with a tuned, observable asyncpg pool.
+
+Used as ``"engine": "base.db"`` in TORTOISE_ORM. On top of the stock asyncpg
+client it times every wait for a pooled connection, turns a wait longer
+than ``acquire_timeout`` into a 503 instead of queueing requests forever,
+and exposes the pool's size and usage through ``pool_stats()``.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from tortoise import connections
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+from tortoise.backends.base.config_generator import expand_db_url
+
+from base.enums import Error
+from base.exceptions import ServiceUnavailableError
+
+logger = logging.getLogger("app")
+
+db_pools: Dict[str, "InstrumentedPool"] = {}
+
+
+class InstrumentedPool:
+    """asyncpg pool wrapper covering what Tortoise calls on it."""
+
+    def __init__(self, pool: Any, acquire_timeout: Optional[float]):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self) -> Any:
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ServiceUnavailableError(
+                code="database_busy", message=Error.DATABASE_BUSY.value
+            ) from None
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - started
+        self.acquired += 1
+        return connection
+
+    async def release(self, connection: Any) -> None:
+        await self._pool.release(connection)
+
+    def __getattr__(self, name: str) -> Any:
+        # close, terminate, expire_connections, get_size...
+        return getattr(self._pool, name)
+
+    def stats(self) -> Dict[str, float]:
+        size = self._pool.get_size()
+        return {
+            "size": size,
+            "max_size": self._pool.get_max_size(),
+            "in_use": size - self._pool.get_idle_size(),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds,
+        }
+
+
+class PooledAsyncpgDBClient(AsyncpgDBClient):
+    def __init__(self, *args, acquire_timeout: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquire_timeout = acquire_timeout
+
+    async def create_pool(self, **kwargs) -> InstrumentedPool:
+        pool = InstrumentedPool(
+            await super().create_pool(**kwargs), self.acquire_timeout
+        )
+        db_pools[self.connection_name] = pool
+        return pool
+
+
+client_class = PooledAsyncpgDBClient
+
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    return {name: pool.stats() for name, pool in db_pools.items()}
+
+
+def database_config(url: str, **pool_options: Any) -> Dict[str, Any] | str:
+    """TORTOISE_ORM connection for ``url``, with the pool options for Postgres.
+
+    Other databases (SQLite in tests and benchmarks) keep the plain URL.
+    """
+    config = expand_db_url(url)
+    if config["engine"] != "tortoise.backends.asyncpg":
+        return url
+    config["engine"] = __name__
+    config["credentials"].update(pool_options)
+    return config
+
+
+async def warm_up_databases() -> None:
+    """Open every connection's pool, so min_size connections are ready.
+
+    A database that is down only gets a warning here: requests retry the
+    connection and fail on their own, and the process keeps serving the
+    rest.
+    """
+    for connection in connections.all():
+        try:
+            await connection.execute_query("SELECT 1")
+        except Exception:
+            logger.warning(
+                "Database warm-up failed for %s",
+                connection.connection_name,
+                exc_info=True,
+            )
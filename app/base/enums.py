@@ -7,6 +7,10 @@ class Error(str, Enum):
     USER_EXISTS = "User already exists"
     USER_NOT_FOUND = "User not found"
     INVALID_PASSWORD = "Invalid password"
+    INVALID_CURSOR = "Invalid pagination cursor"
+    INGEST_OVERLOADED = "Too many notifications queued, retry later"
+    STREAM_OVERLOADED = "Too many open streams, retry later"
+    DATABASE_BUSY = "Database is busy, retry later"
 
 
 class NotificationType(str, Enum):
@@ -3,7 +3,6 @@ from typing import Any, Dict
 
 from fastapi import Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
 from pydantic import ValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.status import (
@@ -12,6 +11,7 @@ from starlette.status import (
 )
 
 from base.exceptions import AppException
+from base.serialization import JSONResponse
 
 logger = logging.getLogger("app")
 
@@ -28,7 +28,9 @@ def _error_payload(
 
 
 def _request_id(request: Request) -> str | None:
-    return request.headers.get("X-Request-ID")
+    # set by RequestContextMiddleware, which also validates the header
+    request_id = getattr(request.state, "request_id", None)
+    return request_id or request.headers.get("X-Request-ID")
 
 
 async def app_exception_handler(request: Request, exc: AppException) -> JSONResponse:
@@ -85,7 +87,11 @@ async def pydantic_validation_exception_handler(
 
 
 async def unhandled_exception_handler(request: Request, exc: Exception) -> JSONResponse:
-    logger.exception("Unhandled exception", extra={"path": request.url.path})
+    # runs outside the request context, so the id is passed explicitly
+    logger.exception(
+        "Unhandled exception",
+        extra={"path": request.url.path, "request_id": _request_id(request)},
+    )
     payload = _error_payload(
         code="internal_error",
         message="Internal server error",
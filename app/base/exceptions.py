@@ -33,3 +33,8 @@ class NotFoundError(AppException):
 class ConflictError(AppException):
     def __init__(self, code: str, message: str, details: Optional[Any] = None):
         super().__init__(code=code, message=message, status_code=409, details=details)
+
+
+class ServiceUnavailableError(AppException):
+    def __init__(self, code: str, message: str, details: Optional[Any] = None):
+        super().__init__(code=code, message=message, status_code=503, details=details)
@@ -1,11 +1,208 @@
+"""Structured logging written off the event loop, tagged with request ids.
+
+Records are formatted on the calling thread, where the request id context
+is visible, and handed to a bounded queue; a listener thread does the
+blocking write to stderr. When the queue is full records are dropped and
+counted rather than blocking the caller.
+"""
+
+import atexit
 import logging
-import os
+import queue
+import random
+import re
+import time
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from pydantic_core import to_json
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from base import metrics
+from base.settings import (
+    LOG_FORMAT,
+    LOG_INFO_SAMPLE_RATE,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+)
+
+logger = logging.getLogger("app")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# ids accepted from the X-Request-ID header, anything else gets a new one
+REQUEST_ID_PATTERN = re.compile(r"[\w.:-]{1,128}")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# attributes every record has; anything else came in through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep info and debug records of a ``rate`` share of requests.
+
+    The decision hashes the request id, so a sampled request keeps all of
+    its records; records outside a request are sampled one by one.
+    Warnings and above always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._threshold = int(rate * 2**32)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno > logging.INFO:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) < self._threshold
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return to_json(payload, fallback=str).decode()
 
 
-def setup_logging() -> None:
-    level_name = os.getenv("LOG_LEVEL", "INFO").upper()
-    level = getattr(logging, level_name, logging.INFO)
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def setup_logging() -> QueueListener:
+    global _queue_handler
+    level = getattr(logging, LOG_LEVEL, logging.INFO)
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RequestIdFilter())
+    if LOG_INFO_SAMPLE_RATE < 1:
+        handler.addFilter(SamplingFilter(LOG_INFO_SAMPLE_RATE))
+    handler.setFormatter(
+        logging.Formatter(TEXT_FORMAT) if LOG_FORMAT == "text" else JsonFormatter()
     )
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    root.setLevel(level)
+    _queue_handler = handler
+
+    listener = QueueListener(handler.queue, logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def logging_stats() -> Dict[str, int]:
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+    }
+
+
+class RequestContextMiddleware:
+    """Give every HTTP request an id and warn about slow requests.
+
+    The id comes from a valid X-Request-ID header or is generated, is
+    available to every record logged while the request runs and is echoed
+    in the response header. ``slow_request_seconds`` of 0 turns the slow
+    request warning off.
+    """
+
+    def __init__(self, app: ASGIApp, slow_request_seconds: float = 0.0):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = _incoming_request_id(scope) or uuid4().hex
+        # for exception handlers that run outside this middleware
+        scope.setdefault("state", {})["request_id"] = request_id
+        header = (b"x-request-id", request_id.encode())
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        with metrics.request_scope() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                elapsed = time.perf_counter() - started
+                slow = self.slow_request_seconds
+                if slow and elapsed >= slow:
+                    route = scope.get("route")
+                    logger.warning(
+                        "Slow request",
+                        extra={
+                            "method": scope["method"],
+                            "route": getattr(route, "path", scope["path"]),
+                            "status": status,
+                            "duration_ms": round(elapsed * 1000, 1),
+                            "db_queries": stats.db_queries,
+                            "db_ms": round(stats.db_seconds * 1000, 1),
+                            "redis_calls": stats.redis_calls,
+                            "redis_ms": round(stats.redis_seconds * 1000, 1),
+                        },
+                    )
+                request_id_var.reset(token)
+
+
+def _incoming_request_id(scope: Scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            request_id = value.decode("latin-1")
+            if REQUEST_ID_PATTERN.fullmatch(request_id):
+                return request_id
+            return None
+    return None
@@ -0,0 +1,419 @@
+"""Request, database and Redis timings exported in the Prometheus text format.
+
+Nothing is timed until ``track()`` runs, either for the metrics themselves
+(``enable()``, METRICS_ENABLED) or for the slow request and query warnings:
+the Tortoise hooks are only installed by main.py in that case, and the Redis
+clients skip the timer while the flag is off.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from redis.asyncio import BlockingConnectionPool
+from redis.asyncio.client import Pipeline
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CALL_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger("app")
+
+# exported at /metrics
+enabled = False
+# queries and Redis calls are timed; on for metrics and slow logging
+tracking = False
+# queries taking longer are logged, 0 disables it
+slow_query_seconds = 0.0
+SLOW_QUERY_MAX_CHARS = 1000
+
+
+def track() -> None:
+    global tracking
+    tracking = True
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+    track()
+
+
+def log_slow_queries(seconds: float) -> None:
+    global slow_query_seconds
+    slow_query_seconds = seconds
+    track()
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket..., sum, count]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                le = _labels(labels + (("le", _number(bound)),))
+                yield f"{self.name}_bucket{le} {_number(count)}"
+            le = _labels(labels + (("le", "+Inf"),))
+            yield f"{self.name}_bucket{le} {_number(series[-1])}"
+            yield f"{self.name}_sum{_labels(labels)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(labels)} {_number(series[-1])}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(labels)} {_number(value)}"
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from the request reaching the app to the end of the response.",
+    LATENCY_BUCKETS,
+)
+request_db_queries = Histogram(
+    "http_request_db_queries", "Database queries run per request.", CALL_BUCKETS
+)
+request_db_seconds = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database queries per request.",
+    LATENCY_BUCKETS,
+)
+request_redis_calls = Histogram(
+    "http_request_redis_calls",
+    "Redis round trips per request, a pipeline counts once.",
+    CALL_BUCKETS,
+)
+request_redis_seconds = Histogram(
+    "http_request_redis_seconds",
+    "Time spent waiting on Redis per request.",
+    LATENCY_BUCKETS,
+)
+db_queries = Counter("db_queries_total", "Database queries, in and out of requests.")
+db_seconds = Counter("db_query_seconds_total", "Time spent in database queries.")
+redis_calls = Counter("redis_calls_total", "Redis round trips, in and out of requests.")
+redis_seconds = Counter("redis_call_seconds_total", "Time spent waiting on Redis.")
+
+metrics = [
+    request_seconds,
+    request_db_queries,
+    request_db_seconds,
+    request_redis_calls,
+    request_redis_seconds,
+    db_queries,
+    db_seconds,
+    redis_calls,
+    redis_seconds,
+]
+
+# name -> callable returning {key: value} or {label: {key: value}}, like
+# local_cache_stats(); exported as untyped app_<name>_<key> samples
+stats_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_stats(name: str, source: Callable[[], Dict[str, Any]]) -> None:
+    stats_sources[name] = source
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "redis_calls", "redis_seconds")
+
+    def __init__(self) -> None:
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+# set while a query runs so nested executor calls are counted once
+_in_query: ContextVar[bool] = ContextVar("in_query", default=False)
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestStats]:
+    """Account queries and Redis calls to the current request.
+
+    Nested scopes share the outermost one's stats.
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        yield stats
+        return
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def record_query(seconds: float, query: Any = None) -> None:
+    db_queries.inc()
+    db_seconds.inc(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += seconds
+    if slow_query_seconds and seconds >= slow_query_seconds:
+        logger.warning(
+            "Slow query",
+            extra={
+                "duration_ms": round(seconds * 1000, 1),
+                "query": str(query)[:SLOW_QUERY_MAX_CHARS],
+            },
+        )
+
+
+def record_redis(seconds: float) -> None:
+    redis_calls.inc()
+    redis_seconds.inc(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_calls += 1
+        stats.redis_seconds += seconds
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and label it by its route template.
+
+    Unmatched paths share one label so scanners can't grow the series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not enabled:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with request_scope() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                labels = (
+                    ("method", scope["method"]),
+                    ("route", getattr(route, "path", "unmatched")),
+                    ("status", str(status)),
+                )
+                request_seconds.observe(elapsed, labels)
+                labels = labels[:2]
+                request_db_queries.observe(stats.db_queries, labels)
+                request_db_seconds.observe(stats.db_seconds, labels)
+                request_redis_calls.observe(stats.redis_calls, labels)
+                request_redis_seconds.observe(stats.redis_seconds, labels)
+
+
+def _timed_query(method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not tracking or _in_query.get():
+            return await method(self, *args, **kwargs)
+        token = _in_query.set(True)
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            record_query(time.perf_counter() - started, args[0] if args else None)
+            _in_query.reset(token)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+QUERY_METHODS = (
+    "execute_query",
+    "execute_query_dict",
+    "execute_insert",
+    "execute_many",
+    "execute_script",
+)
+
+
+def instrument_tortoise() -> None:
+    """Time queries on every Tortoise client class, including transactions.
+
+    Called after Tortoise.init so the backend modules are imported.
+    """
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+    pending = [BaseDBAsyncClient]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        for name in QUERY_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "__metrics_wrapped__", False):
+                setattr(cls, name, _timed_query(method))
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        if not tracking:
+            return await super().execute(raise_on_error)
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record_redis(time.perf_counter() - started)
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Bounded Redis pool that waits up to ``timeout`` for a free connection.
+
+    Time spent waiting, including connecting a new connection, is summed
+    up for ``stats()``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+
+    async def get_connection(self, *args, **kwargs):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - started
+        self.acquired += 1
+        return connection
+
+    async def warm_up(self, size: int) -> None:
+        """Open ``size`` connections now instead of on the first requests."""
+        size = min(size, self.max_connections)
+        opened = await asyncio.gather(
+            *(self.get_connection() for _ in range(size)), return_exceptions=True
+        )
+        errors = [error for error in opened if isinstance(error, BaseException)]
+        for connection in opened:
+            if not isinstance(connection, BaseException):
+                await self.release(connection)
+        if errors:
+            raise errors[0]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_size": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            "idle": len(self._available_connections),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "wait_seconds": self.wait_seconds,
+        }
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """``redis.asyncio.Redis`` that records each round trip while tracking."""
+
+    async def execute_command(self, *args, **options):
+        if not tracking:
+            return await super().execute_command(*args, **options)
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis(time.perf_counter() - started)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[str] = None
+    ) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for name, source in stats_sources.items():
+        for key, value in source().items():
+            if isinstance(value, dict):
+                for stat, number in value.items():
+                    labels = _labels((("name", str(key)),))
+                    lines.append(f"app_{name}_{stat}{labels} {_number(number)}")
+            else:
+                lines.append(f"app_{name}_{key} {_number(value)}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(
+        render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
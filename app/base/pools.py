@@ -0,0 +1,29 @@
+import asyncio
+import logging
+from typing import Dict
+
+from base.db import warm_up_databases
+from base.settings import cache_redis, redis
+
+logger = logging.getLogger("app")
+
+redis_clients = {"redis": redis, "cache_redis": cache_redis}
+
+
+async def warm_up_redis(size: int) -> None:
+    for name, client in redis_clients.items():
+        try:
+            await client.connection_pool.warm_up(size)
+        except Exception:
+            logger.warning("Redis warm-up failed for %s", name, exc_info=True)
+
+
+async def warm_up_pools(redis_size: int) -> None:
+    """Connect to Postgres and Redis before the first request needs it."""
+    await asyncio.gather(warm_up_databases(), warm_up_redis(redis_size))
+
+
+def redis_pool_stats() -> Dict[str, Dict[str, float]]:
+    return {
+        name: client.connection_pool.stats() for name, client in redis_clients.items()
+    }
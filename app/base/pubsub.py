@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Sequence
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger("app")
+
+MESSAGE_TYPES = ("message", "pmessage")
+
+
+async def listen(
+    client: Redis,
+    name: str,
+    on_message: Callable[[dict], None],
+    on_subscribe: Callable[[], Awaitable[None]],
+    channels: Sequence[str] = (),
+    patterns: Sequence[str] = (),
+    resync_interval: Optional[float] = None,
+    reconnect_delay: float = 1.0,
+) -> None:
+    """Pass the messages of a Redis subscription to ``on_message`` forever.
+
+    Messages published while not subscribed are lost, so ``on_subscribe``
+    runs after every (re)subscription to catch up from the source of
+    truth, and also every ``resync_interval`` seconds when given, in case
+    one was missed anyway. When the connection fails the error is logged
+    and the subscription is set up again after ``reconnect_delay``.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        pubsub = client.pubsub()
+        try:
+            if channels:
+                await pubsub.subscribe(*channels)
+            if patterns:
+                await pubsub.psubscribe(*patterns)
+            await on_subscribe()
+            deadline = (
+                None if resync_interval is None else loop.time() + resync_interval
+            )
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=timeout
+                )
+                if message is not None and message["type"] in MESSAGE_TYPES:
+                    on_message(message)
+                if deadline is not None and loop.time() >= deadline:
+                    await on_subscribe()
+                    deadline = loop.time() + resync_interval
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s listener failed, reconnecting", name)
+            await asyncio.sleep(reconnect_delay)
+        finally:
+            await pubsub.aclose()
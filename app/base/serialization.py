@@ -0,0 +1,65 @@
+"""JSON encoding for API responses and JSON read back from the cache.
+
+orjson is used when JSON_LIBRARY is ``orjson`` (the default), the stdlib
+otherwise. Both write compact UTF-8 with ISO 8601 datetimes and fall back
+to ``str()`` for values they can't encode, such as the exceptions in
+validation error contexts.
+
+Pydantic models are not passed through here: FastAPI turns response
+models into plain data first, and cached items are written by
+pydantic-core directly.
+"""
+
+import json
+from datetime import date, time
+from typing import Any, Callable, Dict
+
+from fastapi.responses import JSONResponse as StarletteJSONResponse
+
+from base.settings import JSON_LIBRARY
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+dumpers: Dict[str, Callable[[Any], bytes]] = {"json": _stdlib_dumps}
+loaders: Dict[str, Callable[[bytes | str], Any]] = {"json": json.loads}
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+else:
+    dumpers["orjson"] = lambda obj: orjson.dumps(
+        obj, default=_default, option=orjson.OPT_NON_STR_KEYS
+    )
+    loaders["orjson"] = orjson.loads
+
+if JSON_LIBRARY not in dumpers:
+    raise RuntimeError(
+        f"JSON_LIBRARY={JSON_LIBRARY!r} is not available, "
+        f"choose one of: {', '.join(dumpers)}"
+    )
+
+dumps = dumpers[JSON_LIBRARY]
+loads = loaders[JSON_LIBRARY]
+
+
+class JSONResponse(StarletteJSONResponse):
+    """The app's default response class, rendered with ``dumps``."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
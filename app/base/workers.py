@@ -0,0 +1,88 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+
+from base.exceptions import ServiceUnavailableError
+
+T = TypeVar("T")
+
+worker_pools: Dict[str, "WorkerPool"] = {}
+
+
+class WorkerPool:
+    """Bounded thread pool for blocking CPU work called from async code.
+
+    At most ``size`` calls run at once and at most ``max_queue`` wait for a
+    slot, each for up to ``queue_timeout`` seconds; calls beyond that are
+    rejected with a 503 instead of piling up behind a saturated pool.
+    """
+
+    def __init__(
+        self, name: str, size: int, max_queue: int, queue_timeout: float
+    ) -> None:
+        self.name = name
+        self.size = size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix=f"{name}-worker"
+        )
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.busy = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        worker_pools[name] = self
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # a semaphore belongs to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    def _reject(self) -> ServiceUnavailableError:
+        self.rejected += 1
+        return ServiceUnavailableError(
+            code=f"{self.name}_overloaded", message="Server is busy, retry later"
+        )
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        slots = self._semaphore()
+        if slots.locked() and self.waiting >= self.max_queue:
+            raise self._reject()
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject() from None
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - started
+        self.busy += 1
+        try:
+            return await self._loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.busy -= 1
+            self.completed += 1
+            slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": self.size,
+            "busy": self.busy,
+            "waiting": self.waiting,
+            "saturation": self.busy / self.size if self.size else 0.0,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_seconds,
+        }
+
+
+def worker_pool_stats() -> Dict[str, Dict[str, float]]:
+    return {name: pool.stats() for name, pool in worker_pools.items()}
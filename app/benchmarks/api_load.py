@@ -0,0 +1,144 @@
+"""Closed-loop load on the full app in process, with seeded users and feeds.
+
+``--concurrency`` clients send requests back to back over an ASGI transport
+until ``--requests`` of a scenario are done, after an untimed warm-up:
+  feed    GET /notifications/ for random users, mostly the first page, some
+          deeper pages inside the cached window and some past it
+  login   POST /auth/login, bound by bcrypt at ``--bcrypt-rounds``
+
+The app is main.app with its middleware, lifespan and background tasks, so
+latency includes routing, auth and serialization but no network.
+
+Usage (from app/): python -m benchmarks.api_load [options]
+See benchmarks/harness.py for the shared options.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from typing import Awaitable, Callable, List
+
+import bcrypt
+from httpx import ASGITransport, AsyncClient, Response
+from tortoise import Tortoise
+
+from base.db import database_config
+from base.settings import DB_POOL_OPTIONS, NOTIFICATIONS_CACHE_WINDOW, TORTOISE_ORM
+from benchmarks import harness
+from main import app
+from user.models import User
+from user.services import UserService
+
+PASSWORD = "StrongPass1!"
+
+
+async def run(
+    client: AsyncClient,
+    send: Callable[[AsyncClient], Awaitable[Response]],
+    concurrency: int,
+    requests: int,
+    warmup: int,
+) -> harness.Summary:
+    timings: List[float] = []
+    errors = 0
+    remaining = warmup
+
+    async def worker(record: bool) -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await send(client)
+            if record:
+                timings.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+
+    await asyncio.gather(*(worker(False) for _ in range(concurrency)))
+    remaining = requests
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(True) for _ in range(concurrency)))
+    return harness.summarize(timings, time.perf_counter() - started, errors)
+
+
+async def main(args: argparse.Namespace) -> int:
+    # register_tortoise keeps a reference to this dict, init reads it later
+    TORTOISE_ORM["connections"]["default"] = database_config(
+        harness.database_url(args.database), **DB_POOL_OPTIONS
+    )
+    harness.use_redis(args.redis)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    transport = ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        await Tortoise.generate_schemas(safe=True)
+        password_hash = bcrypt.hashpw(
+            PASSWORD.encode(), bcrypt.gensalt(args.bcrypt_rounds)
+        ).decode()
+        uids = await harness.seed(rng, args.users, args.feed, password_hash)
+        usernames = dict(await User.filter(id__in=uids).values_list("id", "username"))
+        tokens = {
+            uid: UserService.create_token_pair(uid)["access_token"] for uid in uids
+        }
+        limit = 20
+        window = range(0, max(NOTIFICATIONS_CACHE_WINDOW - limit, 0) + 1, limit)
+        deep = range(NOTIFICATIONS_CACHE_WINDOW, max(args.feed, 1), limit)
+
+        async def feed(client: AsyncClient) -> Response:
+            uid = rng.choice(uids)
+            roll = rng.random()
+            if roll < 0.8 or not window:
+                offset = 0
+            elif roll < 0.95 or not deep:
+                offset = rng.choice(window)
+            else:
+                offset = rng.choice(deep)
+            return await client.get(
+                "/notifications/",
+                params={"offset": offset, "limit": limit},
+                headers={"Authorization": f"Bearer {tokens[uid]}"},
+            )
+
+        async def login(client: AsyncClient) -> Response:
+            return await client.post(
+                "/auth/login",
+                json={"username": usernames[rng.choice(uids)], "password": PASSWORD},
+            )
+
+        scenarios = {"feed": feed, "login": login}
+        results = {}
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in args.scenario or ("feed", "login"):
+                results[name] = await run(
+                    client,
+                    scenarios[name],
+                    args.concurrency,
+                    args.requests,
+                    args.warmup,
+                )
+        await User.filter(id__in=uids).delete()
+
+    print(
+        f"users={args.users} feed={args.feed} concurrency={args.concurrency} "
+        f"requests={args.requests} redis={args.redis}"
+    )
+    for name, summary in results.items():
+        harness.report(name, summary)
+    return harness.finish(results, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario", action="append", choices=("feed", "login"), default=None
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--feed", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    harness.add_arguments(parser)
+    sys.exit(asyncio.run(main(parser.parse_args())))
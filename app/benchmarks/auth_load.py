@@ -0,0 +1,90 @@
+"""Feed latency while logins are hammered, bcrypt inline vs in the pool.
+
+Each mode runs ``logins`` concurrent login loops against a small app and
+samples GET /notifications (a cached raw body) meanwhile.
+
+Usage (from app/): python -m benchmarks.auth_load [logins] [samples] [rounds]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+import bcrypt
+from fastapi import FastAPI, Response
+from httpx import ASGITransport, AsyncClient
+
+from base.workers import WorkerPool
+from benchmarks.cache_hit_latency import build_body
+
+
+def build_app(password_hash: bytes, pool: WorkerPool) -> FastAPI:
+    app = FastAPI()
+    body = build_body(20)
+
+    @app.post("/login/inline")
+    async def login_inline():
+        assert bcrypt.checkpw(b"StrongPass1!", password_hash)
+
+    @app.post("/login/pooled")
+    async def login_pooled():
+        assert await pool.run(bcrypt.checkpw, b"StrongPass1!", password_hash)
+
+    @app.get("/notifications")
+    async def notifications():
+        return Response(content=body, media_type="application/json")
+
+    return app
+
+
+async def hammer(client: AsyncClient, path: str, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        await client.post(path)
+        # the in-process transport may never suspend; a network would
+        await asyncio.sleep(0)
+
+
+async def sample(client: AsyncClient, samples: int, interval: float = 0.005) -> list:
+    # open loop: latency counts from when each request was due, so time
+    # spent waiting for a blocked event loop is included
+    timings = []
+    due = time.perf_counter()
+    for _ in range(samples):
+        due += interval
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await client.get("/notifications")
+        timings.append((time.perf_counter() - due) * 1000)
+        assert response.status_code == 200
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"{name:<8} p50={quantiles[49]:.2f}ms p99={quantiles[98]:.2f}ms")
+
+
+async def main(logins: int, samples: int, rounds: int) -> None:
+    password_hash = bcrypt.hashpw(b"StrongPass1!", bcrypt.gensalt(rounds))
+    pool = WorkerPool("bench", size=4, max_queue=logins, queue_timeout=30)
+    app = build_app(password_hash, pool)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"logins={logins} samples={samples} bcrypt rounds={rounds}")
+        report("idle", await sample(client, samples))
+        for mode in ("inline", "pooled"):
+            stop = asyncio.Event()
+            workers = [
+                asyncio.create_task(hammer(client, f"/login/{mode}", stop))
+                for _ in range(logins)
+            ]
+            report(mode, await sample(client, samples))
+            stop.set()
+            await asyncio.gather(*workers)
+        print(f"pool     {pool.stats()}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [8, 100, 8]
+    asyncio.run(main(*(args + defaults[len(args) :])))
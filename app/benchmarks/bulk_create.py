@@ -0,0 +1,87 @@
+"""Notification insert throughput, one create per item vs one bulk batch.
+
+Measures the database side only (rows and counters); the cache side of a
+batch is a pipelined version bump per 500 affected users.
+
+Usage (from app/): python -m benchmarks.bulk_create [database_url] [users]
+Defaults to a throwaway SQLite file; pass a postgres:// URL for real numbers.
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tortoise import Tortoise
+
+from base.enums import NotificationType
+from notification.models import Notification, NotificationCounter
+from notification.services_db import create_notification, create_notifications_bulk
+from user.models import User
+
+BATCH_SIZES = (1, 100, 10_000)
+
+
+async def setup(db_url: str, users: int) -> list:
+    await Tortoise.init(
+        db_url=db_url,
+        modules={"models": ["user.models", "notification.models"]},
+        use_tz=True,
+    )
+    await Tortoise.generate_schemas(safe=True)
+    await User.bulk_create(
+        [
+            User(username=f"bench_{i}", password="x", avatar_url=None)
+            for i in range(users)
+        ]
+    )
+    return await User.all().order_by("id")
+
+
+async def reset() -> None:
+    await Notification.all().delete()
+    await NotificationCounter.all().delete()
+
+
+async def one_by_one(users: list, size: int) -> float:
+    started = time.perf_counter()
+    for i in range(size):
+        await create_notification(users[i % len(users)].id, NotificationType.LIKE, "hi")
+    return time.perf_counter() - started
+
+
+async def bulk(users: list, size: int) -> float:
+    items = [
+        (users[i % len(users)].id, NotificationType.LIKE, "hi", None, None)
+        for i in range(size)
+    ]
+    started = time.perf_counter()
+    await create_notifications_bulk(items)
+    return time.perf_counter() - started
+
+
+async def main(db_url: str, users: int) -> None:
+    targets = await setup(db_url, users)
+    try:
+        print(f"users={users}")
+        for size in BATCH_SIZES:
+            for name, run in (("single", one_by_one), ("bulk", bulk)):
+                await reset()
+                elapsed = await run(targets, size)
+                print(
+                    f"  items={size:<6} {name:<6} {elapsed * 1000:>9.1f}ms "
+                    f"{size / elapsed:>9.0f} items/s"
+                )
+    finally:
+        await reset()
+        await User.filter(username__startswith="bench_").delete()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    else:
+        url = f"sqlite://{Path(tempfile.mkdtemp()) / 'bench.sqlite3'}"
+    asyncio.run(main(url, int(sys.argv[2]) if len(sys.argv) > 2 else 1000))
@@ -0,0 +1,36 @@
+"""Size and encode/decode time of a cached notification page per codec.
+
+Usage (from app/): python -m benchmarks.cache_codec [iterations]
+"""
+
+import sys
+import time
+
+from base.codec import codecs, decode_payload, encode_payload
+from benchmarks.cache_hit_latency import build_body
+
+
+def timed(func, arg, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main(iterations: int) -> None:
+    for limit in (20, 100):
+        body = build_body(limit).encode()
+        print(f"limit={limit} raw body={len(body)} bytes")
+        for name in codecs:
+            encoded = encode_payload(body, name)
+            encode_us = timed(lambda data: encode_payload(data, name), body, iterations)
+            decode_us = timed(decode_payload, encoded, iterations)
+            print(
+                f"  {name:<5} {len(encoded):>6} bytes "
+                f"({len(encoded) / len(body):.0%}) "
+                f"encode={encode_us:.1f}us decode={decode_us:.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
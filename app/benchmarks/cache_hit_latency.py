@@ -0,0 +1,92 @@
+"""Latency of a notification page cache hit, legacy path vs raw body.
+
+legacy: json.loads + model_validate per item + response_model serialization
+raw:    the cached body is returned as the response as is
+
+Usage (from app/): python -m benchmarks.cache_hit_latency [limit] [iterations]
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Response
+from httpx import ASGITransport, AsyncClient
+
+from notification.schemas import Page, PageMeta
+from user.schemas import NotificationInstanceSchema, UserMetaSchema
+
+
+def build_body(limit: int) -> str:
+    data = [
+        NotificationInstanceSchema(
+            id=i,
+            type="like",
+            text=f"notification {i}",
+            created_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            user=UserMetaSchema(username="user_1", avatar_url="https://a/1.png"),
+        )
+        for i in range(limit)
+    ]
+    meta = PageMeta(
+        offset=0,
+        limit=limit,
+        total_items=10 * limit,
+        total_pages=10,
+        has_next=True,
+        has_prev=False,
+    )
+    return Page[NotificationInstanceSchema](data=data, meta=meta).model_dump_json()
+
+
+def build_app(body: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/legacy", response_model=Page[NotificationInstanceSchema])
+    async def legacy():
+        payload = json.loads(body)
+        data = [
+            NotificationInstanceSchema.model_validate(item) for item in payload["data"]
+        ]
+        return Page(data=data, meta=PageMeta.model_validate(payload["meta"]))
+
+    @app.get("/raw", response_model=Page[NotificationInstanceSchema])
+    async def raw():
+        return Response(content=body, media_type="application/json")
+
+    return app
+
+
+async def measure(client: AsyncClient, path: str, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = await client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"{name:<8} p50={quantiles[49]:.3f}ms p99={quantiles[98]:.3f}ms")
+
+
+async def main(limit: int, iterations: int) -> None:
+    app = build_app(build_body(limit))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/legacy", "/raw"):
+            await measure(client, path, 50)
+        print(f"limit={limit} iterations={iterations}")
+        report("legacy", await measure(client, "/legacy", iterations))
+        report("raw", await measure(client, "/raw", iterations))
+
+
+if __name__ == "__main__":
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    asyncio.run(main(limit, iterations))
@@ -0,0 +1,190 @@
+"""Shared setup and reporting for the seeded notification API benchmarks.
+
+The database is a throwaway SQLite file unless a postgres:// URL is passed.
+Redis is the in-memory fake the tests use unless ``--redis server`` is
+passed, in which case REDIS_HOST/REDIS_PORT are used as in the app. Users,
+feeds and request mixes come from a seeded RNG, so two runs on the same
+machine do the same work.
+
+Results are throughput plus p50/p95/p99 latency per case. ``--save`` stores
+them as JSON and ``--baseline`` compares against a stored file. The exit
+status is 1 when a case's p95 or throughput is worse than the baseline by
+more than ``--tolerance``.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from tortoise import Tortoise
+
+from base.enums import NotificationType
+from notification.services_db import create_notifications_bulk
+from user.cache import UserStatus
+from user.models import User
+
+Summary = Dict[str, float]
+
+SEED_BATCH_SIZE = 5000
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--database", help="database URL, a temp SQLite by default")
+    parser.add_argument("--redis", choices=("fake", "server"), default="fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", type=Path, help="write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+
+
+def database_url(url: Optional[str]) -> str:
+    return url or f"sqlite://{Path(tempfile.mkdtemp()) / 'bench.sqlite3'}"
+
+
+async def init_db(db_url: str) -> None:
+    await Tortoise.init(
+        db_url=db_url,
+        modules={"models": ["user.models", "notification.models"]},
+        use_tz=True,
+    )
+    await Tortoise.generate_schemas(safe=True)
+
+
+def use_redis(kind: str) -> None:
+    """Point every module that talks to Redis at the in-memory fake."""
+    if kind != "fake":
+        return
+    from base import cache as base_cache
+    from base import pools
+    from notification import cache as notification_cache
+    from notification import ingest as notification_ingest
+    from notification import stream as notification_stream
+    from tests.conftest import FakeRedis
+    from user import cache as user_cache
+    from user import revocation as user_revocation
+
+    fake = FakeRedis()
+    notification_cache.cache_redis = fake
+    base_cache.redis = fake
+    notification_ingest.redis = fake
+    notification_stream.cache_redis = fake
+    user_cache.cache_redis = fake
+    user_revocation.redis = fake
+    # nothing to warm up or report on for the fake
+    pools.redis_clients = {}
+
+
+async def seed(
+    rng: random.Random, users: int, feed_size: int, password_hash: str = "x"
+) -> List[int]:
+    """Create ``users`` users with ``feed_size`` notifications each.
+
+    Actors are other seeded users, so feed items carry real actor snapshots.
+    """
+    prefix = f"bench_{rng.getrandbits(32):08x}"
+    await User.bulk_create(
+        [
+            User(
+                username=f"{prefix}_{i}",
+                password=password_hash,
+                avatar_url=f"https://example.com/avatars/{i}.png",
+            )
+            for i in range(users)
+        ]
+    )
+    created = await User.filter(username__startswith=prefix).order_by("id")
+    statuses = [
+        UserStatus(user.id, user.username, user.avatar_url, False) for user in created
+    ]
+    types = list(NotificationType)
+    items = []
+    for status in statuses:
+        for i in range(feed_size):
+            items.append(
+                (
+                    status.id,
+                    rng.choice(types),
+                    f"notification {i} for {status.username}",
+                    None,
+                    rng.choice(statuses),
+                )
+            )
+            if len(items) >= SEED_BATCH_SIZE:
+                await create_notifications_bulk(items)
+                items = []
+    if items:
+        await create_notifications_bulk(items)
+    return [status.id for status in statuses]
+
+
+async def measure(
+    iterations: int,
+    call: Callable[[], Awaitable[object]],
+    before: Optional[Callable[[], Awaitable[object]]] = None,
+) -> Summary:
+    """Time ``call`` one iteration at a time; ``before`` runs untimed."""
+    timings = []
+    for _ in range(iterations):
+        if before is not None:
+            await before()
+        started = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings, sum(timings))
+
+
+def summarize(timings: List[float], elapsed: float, errors: int = 0) -> Summary:
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "throughput": len(timings) / elapsed if elapsed else 0.0,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def report(name: str, summary: Summary) -> None:
+    errors = f" errors={summary['errors']}" if summary["errors"] else ""
+    print(
+        f"{name:<24} {summary['throughput']:>10.0f}/s "
+        f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms "
+        f"p99={summary['p99_ms']:.3f}ms{errors}"
+    )
+
+
+def compare(
+    results: Dict[str, Summary], baseline: Dict[str, Summary], tolerance: float
+) -> List[str]:
+    """Print the change per case and return the cases that regressed."""
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        throughput = summary["throughput"] / base["throughput"] - 1
+        p95 = summary["p95_ms"] / base["p95_ms"] - 1
+        regressed = throughput < -tolerance or p95 > tolerance
+        print(
+            f"{name:<24} throughput {throughput:+.1%} p95 {p95:+.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def finish(results: Dict[str, Summary], args: argparse.Namespace) -> int:
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if not args.baseline:
+        return 0
+    print(f"vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    baseline = json.loads(args.baseline.read_text())
+    return 1 if compare(results, baseline, args.tolerance) else 0
@@ -0,0 +1,120 @@
+"""Response rendering with the stdlib json vs orjson, on large pages.
+
+page    a response_model=Page[NotificationInstanceSchema] endpoint returning
+        the validated page, as FastAPI serializes it and the response class
+        renders it
+error   a 422 with one validation error per item, as the error handlers
+        build it
+loads   reading every cached item back, like cursors and window edits do
+
+Usage (from app/): python -m benchmarks.json_render [limit] [iterations]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from pydantic_core import to_json
+
+from base import serialization
+from notification.schemas import Page, PageMeta
+from user.schemas import ActorSchema, NotificationInstanceSchema, UserMetaSchema
+
+
+def build_page(limit: int) -> Page[NotificationInstanceSchema]:
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    data = [
+        NotificationInstanceSchema(
+            id=i,
+            type="like",
+            text=f"notification {i}",
+            created_at=created_at - timedelta(seconds=i),
+            user=UserMetaSchema(username="user_1", avatar_url="https://a/1.png"),
+            actor=ActorSchema(id=i, username=f"user_{i}", avatar_url=None),
+        )
+        for i in range(limit)
+    ]
+    meta = PageMeta(
+        offset=0,
+        limit=limit,
+        total_items=10 * limit,
+        total_pages=10,
+        has_next=True,
+        has_prev=False,
+    )
+    return Page[NotificationInstanceSchema](data=data, meta=meta)
+
+
+def build_app(library: str, page: Page[NotificationInstanceSchema]) -> FastAPI:
+    dumps = serialization.dumpers[library]
+
+    class Response(serialization.JSONResponse):
+        def render(self, content) -> bytes:
+            return dumps(content)
+
+    app = FastAPI(default_response_class=Response)
+    errors = [
+        {"type": "value_error", "loc": ["body", i], "ctx": {"error": ValueError(i)}}
+        for i in range(len(page.data))
+    ]
+
+    @app.get("/page", response_model=Page[NotificationInstanceSchema])
+    async def get_page():
+        return page
+
+    @app.get("/error")
+    async def get_error():
+        return Response(status_code=422, content={"error": {"details": errors}})
+
+    return app
+
+
+async def measure(client: AsyncClient, path: str, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def measure_loads(library: str, items: list, iterations: int) -> list:
+    loads = serialization.loaders[library]
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        for item in items:
+            loads(item)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"{name:<14} p50={quantiles[49]:.3f}ms p99={quantiles[98]:.3f}ms")
+
+
+async def main(limit: int, iterations: int) -> None:
+    page = build_page(limit)
+    items = [to_json(item) for item in page.data]
+    print(f"limit={limit} iterations={iterations}")
+    for library in sorted(serialization.dumpers):
+        transport = ASGITransport(app=build_app(library, page))
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in ("/page", "/error"):
+                await measure(client, path, 50)
+                report(f"{library} {path[1:]}", await measure(client, path, iterations))
+        report(f"{library} loads", measure_loads(library, items, iterations))
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+        )
+    )
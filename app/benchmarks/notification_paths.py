@@ -0,0 +1,94 @@
+"""NotificationService feed paths and page serialization, one call at a time.
+
+Cases, all for one seeded user with a large feed:
+  local_hit     page served from this worker's copy
+  window_hit    local copy dropped, page sliced from the cached Redis window
+  window_miss   feed version bumped, window rebuilt from the database
+  page_hit      offset past the window, page cached on its own in Redis
+  page_miss     the same page after a version bump
+  validate      get_notifications on a local hit (parse + model validation)
+  serialize     Page[NotificationInstanceSchema] of validated items to JSON
+
+Usage (from app/): python -m benchmarks.notification_paths [options]
+See benchmarks/harness.py for the shared options.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+
+from tortoise import Tortoise
+
+from base.settings import NOTIFICATIONS_CACHE_WINDOW
+from benchmarks import harness
+from notification.schemas import GetNotificationsSchema, Page
+from notification.services import NotificationService, notification_pages
+from user.schemas import NotificationInstanceSchema
+
+
+async def main(args: argparse.Namespace) -> int:
+    await harness.init_db(harness.database_url(args.database))
+    harness.use_redis(args.redis)
+    try:
+        (uid,) = await harness.seed(random.Random(args.seed), 1, args.feed)
+        window = GetNotificationsSchema(offset=0, limit=args.limit)
+        deep = GetNotificationsSchema(
+            offset=NOTIFICATIONS_CACHE_WINDOW, limit=args.limit
+        )
+        iterations = args.iterations
+
+        async def page(params: GetNotificationsSchema):
+            return await NotificationService.get_notifications_page(uid, params)
+
+        async def drop_local():
+            notification_pages.clear()
+
+        async def bump():
+            await NotificationService._bump_notifications_cache(uid)
+
+        data, meta = await NotificationService.get_notifications(uid, window)
+        body = Page[NotificationInstanceSchema](data=data, meta=meta)
+
+        async def serialize():
+            body.model_dump_json()
+
+        # warm every cache level once before timing hits
+        await page(window)
+        await page(deep)
+        results = {
+            "local_hit": await harness.measure(iterations, lambda: page(window)),
+            "window_hit": await harness.measure(
+                iterations, lambda: page(window), drop_local
+            ),
+            "window_miss": await harness.measure(
+                iterations, lambda: page(window), bump
+            ),
+            "page_hit": await harness.measure(
+                iterations, lambda: page(deep), drop_local
+            ),
+            "page_miss": await harness.measure(iterations, lambda: page(deep), bump),
+            "validate": await harness.measure(
+                iterations, lambda: NotificationService.get_notifications(uid, window)
+            ),
+            "serialize": await harness.measure(iterations, serialize),
+        }
+    finally:
+        await Tortoise.close_connections()
+
+    print(
+        f"feed={args.feed} limit={args.limit} iterations={iterations} "
+        f"redis={args.redis}"
+    )
+    for name, summary in results.items():
+        harness.report(name, summary)
+    return harness.finish(results, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feed", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=500)
+    harness.add_arguments(parser)
+    sys.exit(asyncio.run(main(parser.parse_args())))
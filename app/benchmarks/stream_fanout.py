@@ -0,0 +1,66 @@
+"""Concurrent /notifications/stream connections one worker can hold.
+
+Opens N idle connections on the in-process hub, each with a task waiting on
+its buffer like a real stream, then dispatches one event to every user and
+measures memory per connection and the time until all of them got it.
+Redis and the database are not involved.
+
+Usage (from app/): python -m benchmarks.stream_fanout [connections] [buffer]
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from notification.stream import StreamHub
+
+ITEM = (
+    b'{"id":1,"type":"like","text":"hi","created_at":"2024-01-01T00:00:00Z",'
+    b'"user":{"username":"user_1","avatar_url":null}}'
+)
+
+
+async def consume(hub: StreamHub, uid: int, buffer: int, received: list) -> None:
+    subscriber = hub.subscribe(uid, buffer)
+    try:
+        await subscriber.queue.get()
+        received.append(time.perf_counter())
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+async def main(connections: int, buffer: int) -> None:
+    hub = StreamHub()
+    received: list = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [
+        asyncio.create_task(consume(hub, uid, buffer, received))
+        for uid in range(connections)
+    ]
+    await asyncio.sleep(0)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for uid in range(connections):
+        hub.dispatch(uid, ITEM)
+    dispatched = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    delivered = max(received) - started
+
+    print(f"connections={connections} buffer={buffer}")
+    print(f"memory {held / connections / 1024:.2f}KiB/connection")
+    print(f"dispatch {dispatched / connections * 1_000_000:.2f}us/event")
+    print(f"all delivered in {delivered * 1000:.1f}ms")
+    print(f"hub {hub.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 10_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+        )
+    )
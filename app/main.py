@@ -1,3 +1,8 @@
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,6 +10,9 @@ from pydantic import ValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from tortoise.contrib.fastapi import register_tortoise
 
+from base import metrics
+from base.cache import listen_for_invalidations, local_cache_stats
+from base.db import pool_stats
 from base.error_handlers import (
     app_exception_handler,
     http_exception_handler,
@@ -13,14 +21,91 @@ from base.error_handlers import (
     validation_exception_handler,
 )
 from base.exceptions import AppException
-from base.logging import setup_logging
-from base.settings import TORTOISE_ORM
+from base.logging import RequestContextMiddleware, logging_stats, setup_logging
+from base.pools import redis_pool_stats, warm_up_pools
+from base.serialization import JSONResponse
+from base.settings import (
+    AUTH_REVOCATION_RESYNC_INTERVAL,
+    LOG_SLOW_QUERY_MS,
+    LOG_SLOW_REQUEST_MS,
+    METRICS_ENABLED,
+    NOTIFICATION_COUNTER_RECONCILE_INTERVAL,
+    NOTIFICATIONS_INGEST_BATCH_SIZE,
+    NOTIFICATIONS_INGEST_BLOCK_MS,
+    NOTIFICATIONS_INGEST_CLAIM_IDLE_MS,
+    NOTIFICATIONS_MAX_PER_USER,
+    NOTIFICATIONS_PRUNE_INTERVAL,
+    NOTIFICATIONS_RETENTION_DAYS,
+    NOTIFICATIONS_WRITE_BEHIND,
+    REDIS_POOL_WARMUP,
+    TORTOISE_ORM,
+)
+from base.workers import worker_pool_stats
+from notification.ingest import ingest_backlog, ingest_metrics
 from notification.router import notification_router
+from notification.services import page_cache_metrics
+from notification.stream import hub, listen_for_events
+from notification.tasks import (
+    run_counter_reconciliation,
+    run_ingest_consumer,
+    run_notification_pruning,
+)
+from user.revocation import listen_for_revocations
 from user.router import auth_router
 
 setup_logging()
 
-app = FastAPI(redoc_url=None)
+
+@asynccontextmanager
+async def lifespan(app_instance: FastAPI):
+    if metrics.tracking:
+        # Tortoise is initialised by now, its client classes are importable
+        metrics.instrument_tortoise()
+    # before the first request instead of during it
+    await warm_up_pools(REDIS_POOL_WARMUP)
+    tasks = [
+        asyncio.create_task(listen_for_invalidations()),
+        asyncio.create_task(listen_for_revocations(AUTH_REVOCATION_RESYNC_INTERVAL)),
+        asyncio.create_task(listen_for_events()),
+    ]
+    if NOTIFICATION_COUNTER_RECONCILE_INTERVAL > 0:
+        tasks.append(
+            asyncio.create_task(
+                run_counter_reconciliation(NOTIFICATION_COUNTER_RECONCILE_INTERVAL)
+            )
+        )
+    if NOTIFICATIONS_PRUNE_INTERVAL > 0 and (
+        NOTIFICATIONS_RETENTION_DAYS > 0 or NOTIFICATIONS_MAX_PER_USER > 0
+    ):
+        tasks.append(
+            asyncio.create_task(
+                run_notification_pruning(
+                    NOTIFICATIONS_PRUNE_INTERVAL,
+                    NOTIFICATIONS_RETENTION_DAYS,
+                    NOTIFICATIONS_MAX_PER_USER,
+                )
+            )
+        )
+    if NOTIFICATIONS_WRITE_BEHIND:
+        tasks.append(
+            asyncio.create_task(
+                run_ingest_consumer(
+                    f"{socket.gethostname()}-{os.getpid()}",
+                    NOTIFICATIONS_INGEST_BATCH_SIZE,
+                    NOTIFICATIONS_INGEST_BLOCK_MS,
+                    NOTIFICATIONS_INGEST_CLAIM_IDLE_MS / 1000,
+                )
+            )
+        )
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+app = FastAPI(redoc_url=None, lifespan=lifespan, default_response_class=JSONResponse)
 
 register_tortoise(
     app,
@@ -35,6 +120,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
+)
+
+if METRICS_ENABLED:
+    metrics.enable()
+    metrics.register_stats("logging", logging_stats)
+    metrics.register_stats("db_pool", pool_stats)
+    metrics.register_stats("redis_pool", redis_pool_stats)
+    metrics.register_stats("local_cache", local_cache_stats)
+    metrics.register_stats("worker_pool", worker_pool_stats)
+    metrics.register_stats("notification_stream", hub.stats)
+    metrics.register_stats(
+        "notification_ingest", lambda: {**ingest_metrics, **ingest_backlog}
+    )
+    metrics.register_stats("notification_page_cache", lambda: page_cache_metrics)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.metrics_router, prefix="/metrics", tags=["metrics"])
+if LOG_SLOW_QUERY_MS > 0:
+    metrics.log_slow_queries(LOG_SLOW_QUERY_MS / 1000)
+if LOG_SLOW_REQUEST_MS > 0:
+    # the slow request warning reports the request's queries and Redis calls
+    metrics.track()
+# outermost, so the id is set before any other middleware logs
+app.add_middleware(
+    RequestContextMiddleware, slow_request_seconds=LOG_SLOW_REQUEST_MS / 1000
 )
 
 app.add_exception_handler(AppException, app_exception_handler)
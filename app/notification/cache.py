@@ -0,0 +1,393 @@
+"""Redis layout of the notification feed cache.
+
+Per user there is one hash, ``notifications:{uid}``, holding:
+
+- ``ver``: random token replaced on every write;
+- ``feed``, ``total``, ``size``: the version the feed window was built
+  for, the user's total at that time and the number of rows in the window;
+- ``page:...``: pages outside the window, each tagged with its version.
+
+The window itself is the list ``notifications:{uid}:feed`` with the newest
+rows, one encoded item per element, newest first.
+
+``notifications:{uid}:unread`` holds the user's unread count. Unlike the
+feed it isn't versioned: writers move it by the number of rows they
+changed, and a missing key is seeded from the database on the next read.
+Writers also bump ``notifications:{uid}:unread:gen``, and a seed is only
+stored if no write happened since the reader looked, so a count read
+before a write can't outlive it.
+"""
+
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from uuid import uuid4
+
+from redis.asyncio.client import Pipeline
+from redis.exceptions import WatchError
+
+from base.cache import INVALIDATION_CHANNEL, invalidation_message
+from base.codec import decode_payload, encode_payload
+from base.serialization import loads
+from base.settings import cache_redis
+from notification.cursor import item_cursor
+
+NOTIFICATIONS_CACHE_TTL = 60 * 60
+WINDOW_UPDATE_RETRIES = 3
+VERSION = "ver"
+FEED_VERSION = "feed"
+FEED_TOTAL = "total"
+FEED_SIZE = "size"
+PAGE_PREFIX = b"page:"
+
+
+class FeedWindow(NamedTuple):
+    # items[0] is the row at position ``start`` of the feed
+    items: List[bytes]
+    start: int
+    total: int
+    size: int
+    fresh: bool
+
+    def covers(self, offset: int, limit: int) -> bool:
+        return offset + limit <= self.size or self.size == self.total
+
+
+def _hash_key(uid: int) -> str:
+    return f"notifications:{uid}"
+
+
+def _feed_key(uid: int) -> str:
+    return f"notifications:{uid}:feed"
+
+
+def _unread_key(uid: int) -> str:
+    return f"notifications:{uid}:unread"
+
+
+def _unread_generation_key(uid: int) -> str:
+    return f"notifications:{uid}:unread:gen"
+
+
+def _lock_key(uid: int, name: str) -> str:
+    return f"notifications:lock:{uid}:{name}"
+
+
+async def get_page(uid: int, field: str) -> Tuple[bytes, bytes | None, bool]:
+    """Return the current version, the cached page and whether it is fresh.
+
+    Version and page are read together, so a hit costs one round trip.
+    A page left over from an older version comes back as stale.
+    """
+    version, entry = await cache_redis.hmget(_hash_key(uid), VERSION, field)
+    version = version or b"0"
+    if not entry:
+        return version, None, False
+    entry_version, _, payload = entry.partition(b"\n")
+    body = decode_payload(payload)
+    if body is None:
+        return version, None, False
+    return version, body, entry_version == version
+
+
+async def set_page(uid: int, field: str, version: bytes, body: bytes) -> None:
+    key = _hash_key(uid)
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        pipe.hset(key, field, version + b"\n" + encode_payload(body))
+        pipe.expire(key, NOTIFICATIONS_CACHE_TTL)
+        await pipe.execute()
+
+
+async def get_window(
+    uid: int, start: int, stop: int
+) -> Tuple[bytes, FeedWindow | None]:
+    """Return the current version and rows ``start:stop`` of the feed window.
+
+    Both come from one pipelined round trip; the window is ``None`` when it
+    has not been built or can't be decoded.
+    """
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        pipe.hmget(_hash_key(uid), VERSION, FEED_VERSION, FEED_TOTAL, FEED_SIZE)
+        pipe.lrange(_feed_key(uid), start, stop - 1)
+        (version, feed_version, total, size), entries = await pipe.execute()
+    version = version or b"0"
+    if feed_version is None or total is None or size is None:
+        return version, None
+    size = int(size)
+    # a list that expired apart from its hash comes back short
+    if len(entries) != max(0, min(stop, size) - start):
+        return version, None
+    items = [decode_payload(entry) for entry in entries]
+    if any(item is None for item in items):
+        return version, None
+    return version, FeedWindow(
+        items=items,
+        start=start,
+        total=int(total),
+        size=size,
+        fresh=feed_version == version,
+    )
+
+
+async def set_window(uid: int, version: bytes, items: List[bytes], total: int) -> None:
+    key = _hash_key(uid)
+    feed_key = _feed_key(uid)
+    async with cache_redis.pipeline(transaction=True) as pipe:
+        pipe.delete(feed_key)
+        if items:
+            pipe.rpush(feed_key, *(encode_payload(item) for item in items))
+        pipe.hset(
+            key,
+            mapping={FEED_VERSION: version, FEED_TOTAL: total, FEED_SIZE: len(items)},
+        )
+        pipe.expire(key, NOTIFICATIONS_CACHE_TTL)
+        pipe.expire(feed_key, NOTIFICATIONS_CACHE_TTL)
+        await pipe.execute()
+
+
+def _queue_bump(pipe: Pipeline, uid: int, cache_name: str, keep_stale: bool) -> None:
+    key = _hash_key(uid)
+    if not keep_stale:
+        pipe.delete(key, _feed_key(uid))
+    pipe.hset(key, VERSION, uuid4().hex.encode())
+    pipe.expire(key, NOTIFICATIONS_CACHE_TTL)
+    pipe.publish(INVALIDATION_CHANNEL, invalidation_message(cache_name, str(uid)))
+
+
+async def bump(uid: int, cache_name: str, keep_stale: bool) -> None:
+    """Move the user's cache to a fresh random version.
+
+    A random token (not a counter) means a reader that started before this
+    write can never store its result under the new version. The previous
+    pages and window are only kept when they may be served stale.
+    """
+    async with cache_redis.pipeline(transaction=True) as pipe:
+        _queue_bump(pipe, uid, cache_name, keep_stale)
+        await pipe.execute()
+
+
+async def bump_many(
+    uids: Iterable[int], cache_name: str, keep_stale: bool, batch_size: int = 500
+) -> None:
+    """``bump`` for many users, one round trip per ``batch_size`` users."""
+    uids = list(uids)
+    for start in range(0, len(uids), batch_size):
+        async with cache_redis.pipeline(transaction=True) as pipe:
+            for uid in uids[start : start + batch_size]:
+                _queue_bump(pipe, uid, cache_name, keep_stale)
+            await pipe.execute()
+
+
+# queues the list changes of a window update and returns the new
+# (total, size), or None when the window can't be updated in place
+WindowChange = Callable[
+    [Pipeline, int, int],
+    Awaitable[Optional[Tuple[Callable[[Pipeline], None], int, int]]],
+]
+
+
+async def _update_window(
+    uid: int, change: WindowChange, cache_name: str, keep_stale: bool
+) -> None:
+    """Apply ``change`` to a fresh window and move it to a new version.
+
+    Runs as an optimistic WATCH/MULTI transaction, so concurrent writers and
+    window rebuilds can't interleave with it. Other cached pages are
+    invalidated by the version change as on ``bump``. When the window is
+    stale, can't be changed in place or keeps conflicting, the whole user
+    cache is bumped instead.
+    """
+    key = _hash_key(uid)
+    feed_key = _feed_key(uid)
+    async with cache_redis.pipeline(transaction=True) as pipe:
+        for _ in range(WINDOW_UPDATE_RETRIES):
+            try:
+                await pipe.watch(key, feed_key)
+                version, feed_version, total, size = await pipe.hmget(
+                    key, VERSION, FEED_VERSION, FEED_TOTAL, FEED_SIZE
+                )
+                if feed_version is None or feed_version != (version or b"0"):
+                    break
+                changed = await change(pipe, int(total), int(size))
+                if changed is None:
+                    break
+                queue, total, size = changed
+                # pages of the old version only stay if they may be served
+                # stale, as on ``bump``; a page stored meanwhile changes the
+                # hash and retries the update
+                pages = (
+                    []
+                    if keep_stale
+                    else [
+                        field
+                        for field in await pipe.hkeys(key)
+                        if field.startswith(PAGE_PREFIX)
+                    ]
+                )
+                new_version = uuid4().hex.encode()
+                pipe.multi()
+                queue(pipe)
+                if pages:
+                    pipe.hdel(key, *pages)
+                pipe.hset(
+                    key,
+                    mapping={
+                        VERSION: new_version,
+                        FEED_VERSION: new_version,
+                        FEED_TOTAL: total,
+                        FEED_SIZE: size,
+                    },
+                )
+                pipe.expire(key, NOTIFICATIONS_CACHE_TTL)
+                pipe.expire(feed_key, NOTIFICATIONS_CACHE_TTL)
+                pipe.publish(
+                    INVALIDATION_CHANNEL, invalidation_message(cache_name, str(uid))
+                )
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+            finally:
+                await pipe.reset()
+    await bump(uid, cache_name, keep_stale)
+
+
+async def prepend_to_window(
+    uid: int, item: bytes, window: int, cache_name: str, keep_stale: bool
+) -> None:
+    """Put a newly created notification at the head of the window."""
+    position = item_cursor(item)
+    feed_key = _feed_key(uid)
+
+    async def change(pipe: Pipeline, total: int, size: int):
+        head = await pipe.lindex(feed_key, 0)
+        if head is not None:
+            head = decode_payload(head)
+            # a concurrent write that committed later got in first
+            if head is None or item_cursor(head) >= position:
+                return None
+
+        def queue(pipe: Pipeline) -> None:
+            pipe.lpush(feed_key, encode_payload(item))
+            pipe.ltrim(feed_key, 0, window - 1)
+
+        return queue, total + 1, min(size + 1, window)
+
+    await _update_window(uid, change, cache_name, keep_stale)
+
+
+async def remove_from_window(
+    uid: int, notification_id: int, cache_name: str, keep_stale: bool
+) -> None:
+    """Drop a deleted notification from the window."""
+    feed_key = _feed_key(uid)
+
+    async def change(pipe: Pipeline, total: int, size: int):
+        for entry in await pipe.lrange(feed_key, 0, -1):
+            item = decode_payload(entry)
+            if item is None:
+                return None
+            if loads(item)["id"] == notification_id:
+
+                def queue(pipe: Pipeline) -> None:
+                    pipe.lrem(feed_key, 1, entry)
+
+                return queue, total - 1, size - 1
+        if size == total:
+            # a complete window must have contained the row
+            return None
+        # the row was older than the window, which stays a valid prefix
+        return (lambda pipe: None), total - 1, size
+
+    await _update_window(uid, change, cache_name, keep_stale)
+
+
+async def get_unread(uid: int) -> Tuple[Optional[int], Optional[bytes]]:
+    """Return the cached unread count and the generation to seed it with.
+
+    Read the generation before counting in the database, so that a write
+    committed after the count has bumped it by the time of the seed.
+    """
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        pipe.get(_unread_key(uid))
+        pipe.get(_unread_generation_key(uid))
+        unread, generation = await pipe.execute()
+    return None if unread is None else int(unread), generation
+
+
+async def set_unread(uid: int, unread: int, generation: Optional[bytes]) -> None:
+    """Seed the count unless a writer changed it since ``generation``."""
+    generation_key = _unread_generation_key(uid)
+    async with cache_redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(generation_key)
+            if await pipe.get(generation_key) != generation:
+                return
+            pipe.multi()
+            # nx: a writer that got in first knows better than a database read
+            pipe.set(_unread_key(uid), unread, ex=NOTIFICATIONS_CACHE_TTL, nx=True)
+            await pipe.execute()
+        except WatchError:
+            # the next read seeds it again
+            pass
+
+
+def _bump_unread_generation(pipe: Pipeline, uid: int) -> None:
+    pipe.incr(_unread_generation_key(uid))
+    pipe.expire(_unread_generation_key(uid), NOTIFICATIONS_CACHE_TTL)
+
+
+async def change_unread(deltas: Dict[int, int]) -> None:
+    """Move the users' cached unread counts by ``deltas``.
+
+    INCRBY starts a missing key from zero, so a count that ends up no
+    higher than its own change may not have existed before. Those are
+    dropped and seeded from the database again on the next read.
+    """
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        for uid, delta in deltas.items():
+            pipe.incrby(_unread_key(uid), delta)
+            _bump_unread_generation(pipe, uid)
+        results = await pipe.execute()
+    suspect = [
+        _unread_key(uid)
+        for (uid, delta), unread in zip(deltas.items(), results[::3])
+        if int(unread) <= max(delta, 0)
+    ]
+    if suspect:
+        await cache_redis.delete(*suspect)
+
+
+async def forget_unread(uids: Iterable[int]) -> None:
+    """Drop cached unread counts whose change isn't known exactly."""
+    uids = list(uids)
+    if not uids:
+        return
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        pipe.delete(*(_unread_key(uid) for uid in uids))
+        for uid in uids:
+            _bump_unread_generation(pipe, uid)
+        await pipe.execute()
+
+
+async def acquire_lock(uid: int, name: str, timeout_ms: int) -> bool:
+    return bool(
+        await cache_redis.set(_lock_key(uid, name), b"1", nx=True, px=timeout_ms)
+    )
+
+
+async def is_locked(uid: int, name: str) -> bool:
+    return bool(await cache_redis.exists(_lock_key(uid, name)))
+
+
+async def release_lock(uid: int, name: str) -> None:
+    # the lock expires on its own if its holder dies, so releasing it
+    # unconditionally is safe enough
+    await cache_redis.delete(_lock_key(uid, name))
@@ -0,0 +1,40 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+from base.enums import Error
+from base.exceptions import BadRequestError
+from base.serialization import loads
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(created_at: datetime, notification_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{notification_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at_raw, notification_id_raw = raw.split("|")
+        created_at = datetime.fromisoformat(created_at_raw)
+        notification_id = int(notification_id_raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequestError(
+            code="invalid_cursor",
+            message=Error.INVALID_CURSOR.value,
+        )
+    if created_at.tzinfo is None:
+        raise BadRequestError(
+            code="invalid_cursor",
+            message=Error.INVALID_CURSOR.value,
+        )
+    return created_at, notification_id
+
+
+def item_cursor(item: bytes) -> Cursor:
+    """Position of a serialized NotificationInstanceSchema in the feed."""
+    data = loads(item)
+    return datetime.fromisoformat(data["created_at"]), data["id"]
@@ -0,0 +1,21 @@
+import hmac
+
+from fastapi import Header
+
+from base.exceptions import ForbiddenError
+from base.settings import NOTIFICATIONS_SERVICE_TOKEN
+
+
+async def require_service_token(
+    x_service_token: str | None = Header(default=None),
+) -> None:
+    if not NOTIFICATIONS_SERVICE_TOKEN or not x_service_token:
+        raise ForbiddenError(
+            code="service_token_required", message="Service token required"
+        )
+    if not hmac.compare_digest(
+        x_service_token.encode(), NOTIFICATIONS_SERVICE_TOKEN.encode()
+    ):
+        raise ForbiddenError(
+            code="service_token_invalid", message="Invalid service token"
+        )
@@ -0,0 +1,182 @@
+"""Redis stream that POST /notifications writes to in write-behind mode.
+
+Producers ``XADD`` one entry per notification; consumers of one group read
+batches, write them to the database and only then ``XACK`` + ``XDEL`` them,
+so a row is written at least once. Idempotency keys make redelivered and
+retried entries no-ops. Acked entries are deleted, so the stream length is
+the backlog and the oldest entry id tells the lag.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+
+from base.enums import Error, NotificationType
+from base.exceptions import ServiceUnavailableError
+from base.settings import (
+    NOTIFICATIONS_IDEMPOTENCY_TTL,
+    NOTIFICATIONS_INGEST_CLAIM_IDLE_MS,
+    NOTIFICATIONS_INGEST_MAX_BACKLOG,
+    redis,
+)
+
+INGEST_STREAM = "notifications:ingest"
+INGEST_GROUP = "notifications-writers"
+
+Entry = Tuple[str, Dict[str, str]]
+# (entry id, idempotency key, uid, type, text, created_at, group key)
+IngestRow = Tuple[
+    str, str, int, NotificationType, Optional[str], datetime, Optional[str]
+]
+
+ingest_metrics: Dict[str, int] = {
+    "enqueued": 0,
+    "duplicates": 0,
+    "rejected": 0,
+    "ingested": 0,
+    "batches": 0,
+    "failed_batches": 0,
+    "dropped": 0,
+}
+# shared state of the stream as last seen by this worker's consumer, for
+# /metrics, which can't query Redis
+ingest_backlog: Dict[str, float] = {"backlog": 0, "pending": 0, "lag_seconds": 0.0}
+
+
+def _idempotency_key(key: str) -> str:
+    return f"notifications:idempotency:{key}"
+
+
+def _entry_time(entry_id: str) -> datetime:
+    # entry ids are "<unix ms>-<seq>", the time the row was accepted
+    return datetime.fromtimestamp(int(entry_id.split("-")[0]) / 1000, timezone.utc)
+
+
+async def enqueue(
+    uid: int,
+    type_: NotificationType,
+    text: Optional[str],
+    idempotency_key: str,
+    group_key: Optional[str] = None,
+) -> bool:
+    """Queue a notification, ``False`` if the key was already queued.
+
+    Raises ServiceUnavailableError while the backlog is full, so producers
+    back off instead of growing the stream without bound.
+    """
+    marker = _idempotency_key(idempotency_key)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xlen(INGEST_STREAM)
+        pipe.set(marker, 1, nx=True, ex=NOTIFICATIONS_IDEMPOTENCY_TTL)
+        backlog, fresh = await pipe.execute()
+    if backlog >= NOTIFICATIONS_INGEST_MAX_BACKLOG:
+        if fresh:
+            await redis.delete(marker)
+        ingest_metrics["rejected"] += 1
+        raise ServiceUnavailableError(
+            code="ingest_overloaded", message=Error.INGEST_OVERLOADED.value
+        )
+    if not fresh:
+        ingest_metrics["duplicates"] += 1
+        return False
+    fields = {"key": idempotency_key, "uid": uid, "type": type_.value}
+    if text is not None:
+        fields["text"] = text
+    if group_key is not None:
+        fields["group"] = group_key
+    try:
+        await redis.xadd(INGEST_STREAM, fields)
+    except Exception:
+        # let the client's retry through
+        await redis.delete(marker)
+        raise
+    ingest_metrics["enqueued"] += 1
+    return True
+
+
+async def ensure_group() -> None:
+    try:
+        await redis.xgroup_create(INGEST_STREAM, INGEST_GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+async def read_batch(
+    consumer: str, count: int, block_ms: int, pending: bool = False
+) -> List[Entry]:
+    """Read new entries, or with ``pending`` the ones this consumer holds."""
+    response = await redis.xreadgroup(
+        INGEST_GROUP,
+        consumer,
+        {INGEST_STREAM: "0" if pending else ">"},
+        count=count,
+        block=None if pending else block_ms,
+    )
+    return response[0][1] if response else []
+
+
+async def claim_stale(consumer: str, count: int) -> List[Entry]:
+    """Take over entries a dead consumer read but never acknowledged."""
+    _, entries, *_ = await redis.xautoclaim(
+        INGEST_STREAM,
+        INGEST_GROUP,
+        consumer,
+        NOTIFICATIONS_INGEST_CLAIM_IDLE_MS,
+        count=count,
+    )
+    return entries
+
+
+async def ack(entry_ids: List[str]) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.xack(INGEST_STREAM, INGEST_GROUP, *entry_ids)
+        pipe.xdel(INGEST_STREAM, *entry_ids)
+        await pipe.execute()
+
+
+def parse_entries(entries: List[Entry]) -> Tuple[List[IngestRow], List[str]]:
+    """Split entries into rows and ids of entries that can't be parsed."""
+    rows: List[IngestRow] = []
+    invalid: List[str] = []
+    for entry_id, fields in entries:
+        try:
+            rows.append(
+                (
+                    entry_id,
+                    fields["key"],
+                    int(fields["uid"]),
+                    NotificationType(fields["type"]),
+                    fields.get("text"),
+                    _entry_time(entry_id),
+                    fields.get("group"),
+                )
+            )
+        except (KeyError, ValueError):
+            invalid.append(entry_id)
+    return rows, invalid
+
+
+async def refresh_backlog() -> Dict[str, float]:
+    """Read the shared backlog, pending count and lag into ``ingest_backlog``."""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xlen(INGEST_STREAM)
+        pipe.xrange(INGEST_STREAM, count=1)
+        backlog, oldest = await pipe.execute()
+    try:
+        pending = (await redis.xpending(INGEST_STREAM, INGEST_GROUP))["pending"]
+    except ResponseError:
+        # no consumer has created the group yet
+        pending = 0
+    lag = 0.0
+    if oldest:
+        lag = max(0.0, time.time() - _entry_time(oldest[0][0]).timestamp())
+    ingest_backlog.update(backlog=backlog, pending=pending, lag_seconds=lag)
+    return ingest_backlog
+
+
+async def ingest_stats() -> Dict[str, float]:
+    """Counters of this worker plus the shared backlog, pending and lag."""
+    return {**ingest_metrics, **await refresh_backlog()}
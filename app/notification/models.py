@@ -9,3 +9,47 @@ class Notification(BaseModel):
     user = fields.ForeignKeyField(model_name="models.User", on_delete=OnDelete.CASCADE)
     type = fields.CharEnumField(NotificationType, default=NotificationType.LIKE)
     text = fields.TextField(null=True)  # поставил null потому что context не известен
+    # "{uid}:{client key}", makes retried and redelivered creates no-ops
+    idempotency_key = fields.CharField(max_length=128, null=True, unique=True)
+    is_read = fields.BooleanField(default=False)
+    # what the notification is about, e.g. "post:42"; rows of one type and
+    # group collapse into one whose count says how many it stands for
+    group_key = fields.CharField(max_length=128, null=True)
+    count = fields.IntField(default=1)
+    # snapshot of who caused the notification, so feed reads need no join;
+    # not a foreign key, the snapshot outlives the actor
+    actor_id = fields.IntField(null=True)
+    actor_username = fields.CharField(max_length=32, null=True)
+    actor_avatar_url = fields.TextField(null=True)
+
+    class Meta:
+        # serves the feed ordering (-created_at, -id) via a backward index scan
+        indexes = (
+            ("user_id", "created_at", "id"),
+            ("user_id", "group_key", "created_at"),
+            # lets the retention job find expired rows without a full scan
+            ("created_at",),
+        )
+
+
+class NotificationCounter(BaseModel):
+    # maintained in the same transaction as notification writes,
+    # so page totals don't need a COUNT(*) over the whole feed
+    user = fields.OneToOneField(
+        model_name="models.User",
+        on_delete=OnDelete.CASCADE,
+        related_name="notification_counter",
+    )
+    total = fields.IntField(default=0)
+    unread = fields.IntField(default=0)
+
+
+class NotificationKey(BaseModel):
+    # idempotency keys of rows folded into an aggregate, which only keeps
+    # its own; a retried or redelivered key finds the aggregate through here
+    key = fields.CharField(max_length=128, unique=True)
+    notification = fields.ForeignKeyField(
+        model_name="models.Notification",
+        on_delete=OnDelete.CASCADE,
+        related_name="folded_keys",
+    )
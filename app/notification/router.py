@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, Response, status
+from fastapi import APIRouter, Depends, Header, Response, status
+from fastapi.responses import StreamingResponse
 
-from notification.schemas import CreateNotificationSchema, GetNotificationsSchema, Page
+from notification.dependencies import require_service_token
+from notification.schemas import (
+    BulkNotificationsResponseSchema,
+    CreateNotificationsBulkSchema,
+    CreateNotificationSchema,
+    GetNotificationsSchema,
+    MarkReadResponseSchema,
+    MarkReadSchema,
+    Page,
+    UnreadCountSchema,
+)
 from notification.services import NotificationService
-from user.dependencies import get_uid, get_user
-from user.models import User
+from user.cache import UserStatus
+from user.dependencies import get_active_user, get_uid
 from user.schemas import NotificationInstanceSchema
 
 notification_router = APIRouter()
@@ -13,8 +24,33 @@ notification_router = APIRouter()
 async def get_notifications(
     uid: int = Depends(get_uid), params: GetNotificationsSchema = Depends()
 ):
-    data, meta = await NotificationService.get_notifications(uid, params)
-    return Page(data=data, meta=meta)
+    # the page comes back already serialized; returning it as a raw response
+    # skips response_model validation, which only documents the schema here
+    body = await NotificationService.get_notifications_page(uid, params)
+    return Response(content=body, media_type="application/json")
+
+
+@notification_router.get("/stream", response_class=StreamingResponse)
+async def stream_notifications(
+    uid: int = Depends(get_uid),
+    last_event_id: str | None = Header(default=None, max_length=128),
+):
+    events = await NotificationService.open_stream(uid, last_event_id)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@notification_router.get("/unread-count", response_model=UnreadCountSchema)
+async def get_unread_count(uid: int = Depends(get_uid)):
+    return await NotificationService.get_unread_count(uid)
+
+
+@notification_router.post("/mark-read", response_model=MarkReadResponseSchema)
+async def mark_read(body: MarkReadSchema, uid: int = Depends(get_uid)):
+    return await NotificationService.mark_read(uid, body)
 
 
 @notification_router.delete(
@@ -28,9 +64,22 @@ async def delete_notification(notification_id: int, uid: int = Depends(get_uid))
 @notification_router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"description": "Queued for writing"}},
 )
 async def create_notification(
-    body: CreateNotificationSchema, user: User = Depends(get_user)
+    body: CreateNotificationSchema,
+    user: UserStatus = Depends(get_active_user),
+    idempotency_key: str | None = Header(default=None, max_length=64),
 ):
-    await NotificationService.create_notification(user, body)
-    return Response(status_code=status.HTTP_201_CREATED)
+    # 201 once written, 202 once queued in write-behind mode
+    return await NotificationService.create_notification(user, body, idempotency_key)
+
+
+@notification_router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=BulkNotificationsResponseSchema,
+    dependencies=[Depends(require_service_token)],
+)
+async def create_notifications_bulk(body: CreateNotificationsBulkSchema):
+    return await NotificationService.create_notifications_bulk(body)
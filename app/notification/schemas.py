@@ -1,9 +1,10 @@
 from typing import Generic, List, Optional, TypeVar
 
 from fastapi.params import Query
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from base.enums import NotificationType
+from base.settings import NOTIFICATIONS_BULK_MAX_ITEMS
 
 T = TypeVar("T")
 MAX_LIMIT = 100
@@ -21,6 +22,7 @@ class PageMeta(BaseModel):
     total_pages: int
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None
 
 
 class Page(BaseModel, Generic[T]):
@@ -29,9 +31,53 @@ class Page(BaseModel, Generic[T]):
 
 
 class GetNotificationsSchema(BasePaginationSchema):
-    pass
+    # keyset mode: when set, offset is ignored and the page starts after the cursor
+    cursor: Optional[str] = Query(default=None, max_length=128)
+    # skip the counter lookup; total_items becomes a lower bound
+    approximate_total: bool = Query(default=False)
 
 
 class CreateNotificationSchema(BaseModel):
     type: NotificationType
     text: Optional[str] = None
+    # notifications of the same type and group_key are aggregated
+    group_key: Optional[str] = Field(default=None, max_length=128)
+
+
+class MarkReadSchema(BaseModel):
+    # marks the row at the cursor and everything older; all rows when unset
+    cursor: Optional[str] = Field(default=None, max_length=128)
+
+
+class MarkReadResponseSchema(BaseModel):
+    updated: int
+
+
+class UnreadCountSchema(BaseModel):
+    unread: int
+
+
+class BulkNotificationItemSchema(CreateNotificationSchema):
+    user_id: int
+    # the user who caused the notification, shown with it
+    actor_id: Optional[int] = None
+
+
+class CreateNotificationsBulkSchema(BaseModel):
+    items: List[BulkNotificationItemSchema] = Field(
+        min_length=1, max_length=NOTIFICATIONS_BULK_MAX_ITEMS
+    )
+
+
+class BulkNotificationResultSchema(BaseModel):
+    # position of the item in the request
+    index: int
+    user_id: int
+    created: bool
+    error: Optional[str] = None
+
+
+class BulkNotificationsResponseSchema(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkNotificationResultSchema]
@@ -1,48 +1,207 @@
-import json
+import asyncio
+import logging
 import math
-from typing import List, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from uuid import uuid4
 
 from fastapi import Response
+from pydantic_core import to_json
 
+from base.cache import LocalCache
 from base.enums import Error
-from base.exceptions import NotFoundError
-from base.settings import redis
+from base.exceptions import NotFoundError, ServiceUnavailableError
+from base.serialization import loads
+from base.settings import (
+    LOCAL_CACHE_NOTIFICATIONS_MAX_BYTES,
+    LOCAL_CACHE_NOTIFICATIONS_SIZE,
+    LOCAL_CACHE_NOTIFICATIONS_TTL,
+    NOTIFICATIONS_CACHE_LOCK_TIMEOUT_MS,
+    NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+    NOTIFICATIONS_CACHE_WINDOW,
+    NOTIFICATIONS_GROUP_WINDOW,
+    NOTIFICATIONS_STREAM_BACKFILL_LIMIT,
+    NOTIFICATIONS_STREAM_BUFFER,
+    NOTIFICATIONS_STREAM_HEARTBEAT,
+    NOTIFICATIONS_STREAM_MAX_CONNECTIONS,
+    NOTIFICATIONS_WRITE_BEHIND,
+)
+from notification import cache as notification_cache
+from notification import ingest as notification_ingest
+from notification import stream as notification_stream
+from notification.cache import FeedWindow
+from notification.cursor import Cursor, decode_cursor, encode_cursor, item_cursor
+from notification.ingest import Entry
 from notification.schemas import (
+    BulkNotificationResultSchema,
+    BulkNotificationsResponseSchema,
+    CreateNotificationsBulkSchema,
     CreateNotificationSchema,
     GetNotificationsSchema,
+    MarkReadResponseSchema,
+    MarkReadSchema,
+    Page,
     PageMeta,
+    UnreadCountSchema,
+)
+from notification.services_db import (
+    count_notifications,
+    count_unread_notifications,
+    create_grouped_notification,
 )
 from notification.services_db import create_notification as create_notification_db
+from notification.services_db import (
+    create_notifications_bulk as create_notifications_bulk_db,
+)
+from notification.services_db import (
+    delete_excess_notifications,
+    delete_expired_notifications,
+)
 from notification.services_db import delete_notification as delete_notification_db
-from notification.services_db import fetch_notifications, get_notification_by_user
-from user.models import User
-from user.schemas import NotificationInstanceSchema, UserMetaSchema
+from notification.services_db import (
+    fetch_notifications,
+    fetch_notifications_since,
+    get_existing_user_ids,
+    get_notification_by_user,
+    ingest_notifications,
+    mark_notifications_read,
+)
+from user.cache import UserStatus
+from user.schemas import ActorSchema, NotificationInstanceSchema, UserMetaSchema
+from user.services import UserService
+
+logger = logging.getLogger("app")
+
+NOTIFICATIONS_CACHE_LOCK_POLL_INTERVAL = 0.05
+# positions of recently streamed rows kept per connection to drop duplicates
+NOTIFICATIONS_STREAM_SENT_IDS = 1000
+FEED_START: Cursor = (datetime.min.replace(tzinfo=timezone.utc), 0)
+
+# serialized pages keyed by (uid, field) and tagged by uid
+notification_pages = LocalCache(
+    "notifications",
+    maxsize=LOCAL_CACHE_NOTIFICATIONS_SIZE,
+    max_bytes=LOCAL_CACHE_NOTIFICATIONS_MAX_BYTES,
+    ttl=LOCAL_CACHE_NOTIFICATIONS_TTL,
+)
+
+# how notification pages were served: from this worker's copy, fresh from
+# Redis, stale from Redis while another request rebuilds, or rebuilt
+page_cache_metrics: Dict[str, int] = {
+    "local_hits": 0,
+    "hits": 0,
+    "stale": 0,
+    "misses": 0,
+}
+
+T = TypeVar("T")
 
 
 class NotificationService:
     _create_notification = staticmethod(create_notification_db)
+    _create_grouped_notification = staticmethod(create_grouped_notification)
+    _create_notifications_bulk = staticmethod(create_notifications_bulk_db)
+    _get_existing_user_ids = staticmethod(get_existing_user_ids)
+    _ingest_notifications = staticmethod(ingest_notifications)
     _delete_notification = staticmethod(delete_notification_db)
     _fetch_notifications = staticmethod(fetch_notifications)
+    _fetch_notifications_since = staticmethod(fetch_notifications_since)
+    _count_notifications = staticmethod(count_notifications)
+    _count_unread_notifications = staticmethod(count_unread_notifications)
+    _mark_notifications_read = staticmethod(mark_notifications_read)
+    _delete_expired_notifications = staticmethod(delete_expired_notifications)
+    _delete_excess_notifications = staticmethod(delete_excess_notifications)
     _get_notification_by_user = staticmethod(get_notification_by_user)
+    _rebuilds: Dict[str, "asyncio.Future"] = {}
 
     @staticmethod
-    async def _notifications_cache_version(uid: int) -> int:
-        version = await redis.get(f"notifications:ver:{uid}")
-        if version is None:
-            return 0
-        try:
-            return int(version)
-        except (TypeError, ValueError):
-            return 0
+    def _in_window(params: GetNotificationsSchema) -> bool:
+        return (
+            not params.cursor
+            and params.offset + params.limit <= NOTIFICATIONS_CACHE_WINDOW
+        )
 
-    @classmethod
-    async def _notifications_cache_key(cls, uid: int, offset: int, limit: int) -> str:
-        version = await cls._notifications_cache_version(uid)
-        return f"notifications:{uid}:{version}:{offset}:{limit}"
+    @staticmethod
+    def _notifications_cache_field(params: GetNotificationsSchema) -> str:
+        page = f"c:{params.cursor}" if params.cursor else params.offset
+        field = f"page:{page}:{params.limit}"
+        return f"{field}:a" if params.approximate_total else field
 
     @staticmethod
     async def _bump_notifications_cache(uid: int) -> None:
-        await redis.incr(f"notifications:ver:{uid}")
+        notification_pages.invalidate_tag(str(uid))
+        await notification_cache.bump(
+            uid,
+            notification_pages.name,
+            keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+        )
+
+    @staticmethod
+    async def _recipient(uid: int) -> UserMetaSchema:
+        """The feed owner's metadata, the same on every item of the feed."""
+        status = await UserService.get_user_status(uid)
+        if status is None:
+            raise NotFoundError(
+                code="user_not_found", message=Error.USER_NOT_FOUND.value
+            )
+        return UserMetaSchema(username=status.username, avatar_url=status.avatar_url)
+
+    @staticmethod
+    def _actor(
+        actor_id: int | None, username: str | None, avatar_url: str | None
+    ) -> ActorSchema | None:
+        if actor_id is None:
+            return None
+        return ActorSchema(id=actor_id, username=username, avatar_url=avatar_url)
+
+    @classmethod
+    def _notification_item(
+        cls, row: dict, user: UserMetaSchema
+    ) -> NotificationInstanceSchema:
+        return NotificationInstanceSchema(
+            id=row["id"],
+            type=row["type"].value,
+            text=row.get("text"),
+            created_at=row["created_at"],
+            user=user,
+            is_read=row.get("is_read", False),
+            group_key=row.get("group_key"),
+            count=row.get("count", 1),
+            actor=cls._actor(
+                row.get("actor_id"),
+                row.get("actor_username"),
+                row.get("actor_avatar_url"),
+            ),
+        )
+
+    @staticmethod
+    def _page_meta(
+        offset: int,
+        limit: int,
+        total_items: int,
+        has_next: bool,
+        has_prev: bool,
+        next_cursor: str | None,
+    ) -> PageMeta:
+        return PageMeta(
+            offset=offset,
+            limit=limit,
+            total_items=total_items,
+            total_pages=math.ceil(total_items / limit) if total_items else 0,
+            has_next=has_next,
+            has_prev=has_prev,
+            next_cursor=next_cursor if has_next else None,
+        )
 
     @classmethod
     async def get_notifications(
@@ -50,48 +209,221 @@ class NotificationService:
         uid: int,
         params: GetNotificationsSchema,
     ) -> Tuple[List[NotificationInstanceSchema], PageMeta]:
-        offset = params.offset
-        limit = params.limit
+        page = Page[NotificationInstanceSchema].model_validate_json(
+            await cls.get_notifications_page(uid, params)
+        )
+        return page.data, page.meta
 
-        redis_key = await cls._notifications_cache_key(uid, offset, limit)
-        data = await redis.get(redis_key)
-        if data:
-            payload = json.loads(data)
-            cached = [
-                NotificationInstanceSchema.model_validate(item)
-                for item in payload["data"]
-            ]
-            meta = PageMeta.model_validate(payload["meta"])
-            return cached, meta
-        rows, total_items = await cls._fetch_notifications(uid, offset, limit)
-        total_pages = math.ceil(total_items / limit) if total_items else 0
-        meta = PageMeta(
-            offset=offset,
-            limit=limit,
-            total_items=total_items,
-            total_pages=total_pages,
-            has_next=offset + limit < total_items,
-            has_prev=offset > 0,
-        )
-        result = [
-            NotificationInstanceSchema(
-                id=i["id"],
-                type=i["type"].value,
-                text=i.get("text"),
-                created_at=i["created_at"],
-                user=UserMetaSchema(
-                    username=i["user__username"],
-                    avatar_url=i.get("user__avatar_url"),
-                ),
+    @classmethod
+    async def get_notifications_page(
+        cls,
+        uid: int,
+        params: GetNotificationsSchema,
+    ) -> bytes:
+        """Return the serialized ``Page[NotificationInstanceSchema]`` body.
+
+        Offset pages within the newest NOTIFICATIONS_CACHE_WINDOW rows are
+        sliced from one cached window per user, other pages are cached one
+        by one. Either way a hit is returned without parsing or validation.
+        """
+        field = cls._notifications_cache_field(params)
+        body = notification_pages.get((uid, field))
+        if body is not None:
+            page_cache_metrics["local_hits"] += 1
+            return body
+        epoch = notification_pages.epoch(str(uid))
+        if cls._in_window(params):
+            body, fresh = await cls._get_window_page(uid, params)
+        else:
+            body, fresh = await cls._get_page(uid, params, field)
+        if fresh:
+            notification_pages.set(
+                (uid, field), body, tag=str(uid), size=len(body), epoch=epoch
             )
-            for i in rows
-        ]
-        payload = {
-            "data": [item.model_dump(mode="json") for item in result],
-            "meta": meta.model_dump(),
-        }
-        await redis.set(redis_key, json.dumps(payload), ex=60 * 60)
-        return result, meta
+        return body
+
+    @classmethod
+    async def _get_window_page(
+        cls, uid: int, params: GetNotificationsSchema
+    ) -> Tuple[bytes, bool]:
+        offset, limit = params.offset, params.limit
+        version, window = await notification_cache.get_window(
+            uid, offset, offset + limit
+        )
+        if window is not None and window.covers(offset, limit):
+            if window.fresh:
+                page_cache_metrics["hits"] += 1
+                return cls._window_page(window, offset, limit), True
+            if NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE:
+                stale = cls._window_page(window, offset, limit)
+                if cls._rebuilds.get(f"{uid}:window") is not None or not (
+                    await cls._can_rebuild(uid, "window")
+                ):
+                    page_cache_metrics["stale"] += 1
+                    return stale, False
+        page_cache_metrics["misses"] += 1
+
+        async def poll() -> FeedWindow | None:
+            _, window = await notification_cache.get_window(uid, offset, offset + limit)
+            return window if window and window.fresh else None
+
+        window = await cls._single_flight(
+            uid, "window", lambda: cls._build_window(uid, version), poll
+        )
+        return cls._window_page(window, offset, limit), True
+
+    @classmethod
+    async def _get_page(
+        cls, uid: int, params: GetNotificationsSchema, field: str
+    ) -> Tuple[bytes, bool]:
+        version, body, fresh = await notification_cache.get_page(uid, field)
+        if body and fresh:
+            page_cache_metrics["hits"] += 1
+            return body, True
+        if body and NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE:
+            if cls._rebuilds.get(f"{uid}:{field}") is not None or not (
+                await cls._can_rebuild(uid, field)
+            ):
+                page_cache_metrics["stale"] += 1
+                return body, False
+        page_cache_metrics["misses"] += 1
+
+        async def poll() -> bytes | None:
+            _, body, fresh = await notification_cache.get_page(uid, field)
+            return body if fresh else None
+
+        body = await cls._single_flight(
+            uid, field, lambda: cls._build_page(uid, params, field, version), poll
+        )
+        return body, True
+
+    @staticmethod
+    async def _can_rebuild(uid: int, name: str) -> bool:
+        # stale content is only worth serving while someone else rebuilds
+        if NOTIFICATIONS_CACHE_LOCK_TIMEOUT_MS <= 0:
+            return True
+        return not await notification_cache.is_locked(uid, name)
+
+    @classmethod
+    async def _single_flight(
+        cls,
+        uid: int,
+        name: str,
+        build: Callable[[], Awaitable[T]],
+        poll: Callable[[], Awaitable[T | None]],
+    ) -> T:
+        """Run ``build`` once per worker and, with the lock, once per cluster.
+
+        Concurrent callers in this worker share one rebuild; callers in
+        other workers wait for the lock holder's result via ``poll`` and
+        only rebuild themselves if it doesn't show up in time.
+        """
+        flight_key = f"{uid}:{name}"
+        flight = cls._rebuilds.get(flight_key)
+        if flight is None:
+            flight = asyncio.ensure_future(cls._locked_rebuild(uid, name, build, poll))
+            cls._rebuilds[flight_key] = flight
+            flight.add_done_callback(lambda _: cls._rebuilds.pop(flight_key, None))
+        return await asyncio.shield(flight)
+
+    @staticmethod
+    async def _locked_rebuild(
+        uid: int,
+        name: str,
+        build: Callable[[], Awaitable[T]],
+        poll: Callable[[], Awaitable[T | None]],
+    ) -> T:
+        if NOTIFICATIONS_CACHE_LOCK_TIMEOUT_MS <= 0:
+            return await build()
+        if await notification_cache.acquire_lock(
+            uid, name, NOTIFICATIONS_CACHE_LOCK_TIMEOUT_MS
+        ):
+            try:
+                return await build()
+            finally:
+                await notification_cache.release_lock(uid, name)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + NOTIFICATIONS_CACHE_LOCK_TIMEOUT_MS / 1000
+        while loop.time() < deadline:
+            await asyncio.sleep(NOTIFICATIONS_CACHE_LOCK_POLL_INTERVAL)
+            result = await poll()
+            if result is not None:
+                return result
+        return await build()
+
+    @classmethod
+    def _window_page(cls, window: FeedWindow, offset: int, limit: int) -> bytes:
+        start = offset - window.start
+        items = window.items[start : start + limit]
+        has_next = offset + limit < window.total
+        next_cursor = None
+        if has_next and items:
+            last = loads(items[-1])
+            next_cursor = encode_cursor(
+                datetime.fromisoformat(last["created_at"]), last["id"]
+            )
+        meta = cls._page_meta(
+            offset, limit, window.total, has_next, offset > 0, next_cursor
+        )
+        # the same bytes Page[NotificationInstanceSchema] would serialize to
+        return b'{"data":[' + b",".join(items) + b'],"meta":' + to_json(meta) + b"}"
+
+    @classmethod
+    async def _build_window(cls, uid: int, version: bytes) -> FeedWindow:
+        rows = await cls._fetch_notifications(uid, 0, NOTIFICATIONS_CACHE_WINDOW + 1)
+        if len(rows) > NOTIFICATIONS_CACHE_WINDOW:
+            rows = rows[:NOTIFICATIONS_CACHE_WINDOW]
+            total = await cls._count_notifications(uid)
+        else:
+            total = len(rows)
+        items = []
+        if rows:
+            user = await cls._recipient(uid)
+            items = [to_json(cls._notification_item(row, user)) for row in rows]
+        await notification_cache.set_window(uid, version, items, total)
+        return FeedWindow(
+            items=items, start=0, total=total, size=len(items), fresh=True
+        )
+
+    @classmethod
+    async def _build_page(
+        cls,
+        uid: int,
+        params: GetNotificationsSchema,
+        field: str,
+        version: bytes,
+    ) -> bytes:
+        limit = params.limit
+        after = decode_cursor(params.cursor) if params.cursor else None
+        offset = 0 if after else params.offset
+
+        # one extra row tells whether another page follows
+        rows = await cls._fetch_notifications(uid, offset, limit + 1, after=after)
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        if params.approximate_total:
+            total_items = offset + len(rows) + int(has_next)
+        else:
+            total_items = await cls._count_notifications(uid)
+        next_cursor = None
+        if rows:
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        meta = cls._page_meta(
+            offset,
+            limit,
+            total_items,
+            has_next,
+            offset > 0 or after is not None,
+            next_cursor,
+        )
+        result = []
+        if rows:
+            user = await cls._recipient(uid)
+            result = [cls._notification_item(row, user) for row in rows]
+        body = to_json(Page[NotificationInstanceSchema](data=result, meta=meta))
+        await notification_cache.set_page(uid, field, version, body)
+        return body
 
     @classmethod
     async def delete_notification(cls, uid: int, notification_id: int) -> Response:
@@ -101,13 +433,298 @@ class NotificationService:
                 code="notification_not_found",
                 message=Error.NOT_FOUND.value,
             )
-        await cls._delete_notification(notification)
-        await cls._bump_notifications_cache(uid)
+        unread = await cls._delete_notification(notification)
+        notification_pages.invalidate_tag(str(uid))
+        await notification_cache.remove_from_window(
+            uid,
+            notification_id,
+            notification_pages.name,
+            keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+        )
+        if unread:
+            await notification_cache.change_unread({uid: -unread})
         return Response(status_code=204)
 
+    @classmethod
+    async def get_unread_count(cls, uid: int) -> UnreadCountSchema:
+        unread, generation = await notification_cache.get_unread(uid)
+        if unread is None:
+            unread = await cls._count_unread_notifications(uid)
+            await notification_cache.set_unread(uid, unread, generation)
+        return UnreadCountSchema(unread=unread)
+
+    @classmethod
+    async def mark_read(cls, uid: int, body: MarkReadSchema) -> MarkReadResponseSchema:
+        until = decode_cursor(body.cursor) if body.cursor else None
+        updated = await cls._mark_notifications_read(uid, until)
+        if updated:
+            # cached items carry is_read, so the whole feed goes
+            await cls._bump_notifications_cache(uid)
+            await notification_cache.change_unread({uid: -updated})
+        return MarkReadResponseSchema(updated=updated)
+
     @classmethod
     async def create_notification(
-        cls, user: User, body: CreateNotificationSchema
-    ) -> None:
-        await cls._create_notification(user, body.type, body.text)
-        await cls._bump_notifications_cache(user.id)
+        cls,
+        user: UserStatus,
+        body: CreateNotificationSchema,
+        idempotency_key: str | None = None,
+    ) -> Response:
+        key = f"{user.id}:{idempotency_key}" if idempotency_key else None
+        if NOTIFICATIONS_WRITE_BEHIND:
+            key = key or f"{user.id}:{uuid4().hex}"
+            await notification_ingest.enqueue(
+                user.id, body.type, body.text, key, group_key=body.group_key
+            )
+            # accepted; a key queued before is accepted again as is
+            return Response(status_code=202)
+
+        existed = False
+        if body.group_key is not None and NOTIFICATIONS_GROUP_WINDOW > 0:
+            notification, existed, unread = await cls._create_grouped_notification(
+                user.id,
+                body.type,
+                body.text,
+                body.group_key,
+                NOTIFICATIONS_GROUP_WINDOW,
+                idempotency_key=key,
+            )
+        else:
+            notification = await cls._create_notification(
+                user.id,
+                body.type,
+                body.text,
+                idempotency_key=key,
+                group_key=body.group_key,
+            )
+            # a retried create may have inserted nothing
+            unread = 1 if key is None else None
+        item = NotificationInstanceSchema(
+            id=notification.id,
+            type=notification.type,
+            text=notification.text,
+            created_at=notification.created_at,
+            user=UserMetaSchema(username=user.username, avatar_url=user.avatar_url),
+            is_read=notification.is_read,
+            group_key=notification.group_key,
+            count=notification.count,
+            actor=cls._actor(
+                notification.actor_id,
+                notification.actor_username,
+                notification.actor_avatar_url,
+            ),
+        )
+        item = to_json(item)
+        notification_pages.invalidate_tag(str(user.id))
+        if existed:
+            # an aggregate moves from its old position to the head
+            await notification_cache.remove_from_window(
+                user.id,
+                notification.id,
+                notification_pages.name,
+                keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+            )
+        await notification_cache.prepend_to_window(
+            user.id,
+            item,
+            NOTIFICATIONS_CACHE_WINDOW,
+            notification_pages.name,
+            keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+        )
+        if unread is None:
+            await notification_cache.forget_unread([user.id])
+        elif unread:
+            await notification_cache.change_unread({user.id: unread})
+        await notification_stream.publish_item(user.id, item)
+        return Response(status_code=201)
+
+    @classmethod
+    async def ingest_batch(cls, entries: List[Entry]) -> int:
+        """Write a batch read from the ingest stream and acknowledge it.
+
+        Nothing is acknowledged when the write fails, so the batch is read
+        again. Returns the number of entries handled.
+        """
+        rows, invalid = notification_ingest.parse_entries(entries)
+        if invalid:
+            logger.warning("Dropping %s malformed ingest entries", len(invalid))
+            notification_ingest.ingest_metrics["dropped"] += len(invalid)
+        uids = await cls._ingest_notifications(
+            [row[1:] for row in rows], group_window=NOTIFICATIONS_GROUP_WINDOW
+        )
+        if uids:
+            for uid in uids:
+                notification_pages.invalidate_tag(str(uid))
+            await notification_cache.bump_many(
+                uids,
+                notification_pages.name,
+                keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+            )
+            # redelivered rows were skipped or counted again, so the
+            # deltas aren't known
+            await notification_cache.forget_unread(uids)
+            await notification_stream.publish_sync(uids)
+        await notification_ingest.ack([entry_id for entry_id, _ in entries])
+        notification_ingest.ingest_metrics["ingested"] += len(rows)
+        notification_ingest.ingest_metrics["batches"] += 1
+        return len(entries)
+
+    @classmethod
+    async def create_notifications_bulk(
+        cls, body: CreateNotificationsBulkSchema
+    ) -> BulkNotificationsResponseSchema:
+        """Create notifications for many users with one insert per batch.
+
+        Items addressed to unknown users or naming unknown actors are
+        reported back and skipped, the rest are created together. Actors
+        are looked up together in the user status cache and snapshotted
+        onto the rows. Each affected user's cache is bumped once, however
+        many of the items are theirs.
+        """
+        existing = await cls._get_existing_user_ids(
+            {item.user_id for item in body.items}
+        )
+        actors = await UserService.get_user_statuses(
+            {item.actor_id for item in body.items} - {None}
+        )
+        rows = []
+        results = []
+        for index, item in enumerate(body.items):
+            actor = actors.get(item.actor_id)
+            error = None
+            if item.user_id not in existing:
+                error = "user_not_found"
+            elif item.actor_id is not None and actor is None:
+                error = "actor_not_found"
+            else:
+                rows.append((item.user_id, item.type, item.text, item.group_key, actor))
+            results.append(
+                BulkNotificationResultSchema(
+                    index=index,
+                    user_id=item.user_id,
+                    created=error is None,
+                    error=error,
+                )
+            )
+        if rows:
+            unread = await cls._create_notifications_bulk(
+                rows, group_window=NOTIFICATIONS_GROUP_WINDOW
+            )
+            uids = {row[0] for row in rows}
+            for uid in uids:
+                notification_pages.invalidate_tag(str(uid))
+            await notification_cache.bump_many(
+                uids,
+                notification_pages.name,
+                keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+            )
+            await notification_cache.change_unread(unread)
+            await notification_stream.publish_sync(uids)
+        return BulkNotificationsResponseSchema(
+            created=len(rows), failed=len(results) - len(rows), results=results
+        )
+
+    @classmethod
+    async def prune_notifications(cls, retention_days: int, max_per_user: int) -> int:
+        """Delete expired rows and rows beyond the per-user cap.
+
+        Returns the number of users that lost rows; their caches and unread
+        counts are dropped, since their totals changed.
+        """
+        users: Set[int] = set()
+        if retention_days > 0:
+            before = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            users |= await cls._delete_expired_notifications(before)
+        if max_per_user > 0:
+            users |= await cls._delete_excess_notifications(max_per_user)
+        if users:
+            for uid in users:
+                notification_pages.invalidate_tag(str(uid))
+            await notification_cache.bump_many(
+                users,
+                notification_pages.name,
+                keep_stale=NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE,
+            )
+            await notification_cache.forget_unread(users)
+        return len(users)
+
+    @classmethod
+    async def open_stream(
+        cls, uid: int, last_event_id: str | None = None
+    ) -> AsyncIterator[bytes]:
+        """Subscribe to the user's new notifications as server-sent events.
+
+        Events carry the row's cursor as their id, so a client reconnecting
+        with Last-Event-ID first gets what it missed. Without one the
+        stream starts after the newest existing row.
+        """
+        if notification_stream.hub.connections >= NOTIFICATIONS_STREAM_MAX_CONNECTIONS:
+            raise ServiceUnavailableError(
+                code="stream_overloaded", message=Error.STREAM_OVERLOADED.value
+            )
+        if last_event_id:
+            since = decode_cursor(last_event_id)
+        else:
+            rows = await cls._fetch_notifications(uid, 0, 1)
+            since = (rows[0]["created_at"], rows[0]["id"]) if rows else FEED_START
+        return cls._stream_events(uid, since)
+
+    @staticmethod
+    def _stream_event(position: Cursor, item: bytes) -> bytes:
+        event_id = encode_cursor(*position).encode()
+        return b"id: " + event_id + b"\nevent: notification\ndata: " + item + b"\n\n"
+
+    @classmethod
+    async def _stream_events(cls, uid: int, since: Cursor) -> AsyncIterator[bytes]:
+        # subscribed once the body is iterated, so a response that never
+        # starts leaves nothing behind; the first catch-up query covers
+        # rows written since ``since`` was taken
+        subscriber = notification_stream.hub.subscribe(uid, NOTIFICATIONS_STREAM_BUFFER)
+        subscriber.resync = True
+        # live messages still in flight when we subscribed can be older
+        # than the starting point, the client already has those
+        start = since
+        # rows can reach us twice, live and through a catch-up query; an
+        # aggregate that took new rows comes again under a new position
+        sent: "OrderedDict[Cursor, None]" = OrderedDict()
+
+        def fresh(position: Cursor) -> bool:
+            if position <= start or position in sent:
+                return False
+            sent[position] = None
+            if len(sent) > NOTIFICATIONS_STREAM_SENT_IDS:
+                sent.popitem(last=False)
+            return True
+
+        try:
+            while True:
+                while subscriber.resync:
+                    subscriber.resync = False
+                    rows = await cls._fetch_notifications_since(
+                        uid, since, NOTIFICATIONS_STREAM_BACKFILL_LIMIT
+                    )
+                    user = await cls._recipient(uid) if rows else None
+                    for row in rows:
+                        position = (row["created_at"], row["id"])
+                        since = max(since, position)
+                        if fresh(position):
+                            item = to_json(cls._notification_item(row, user))
+                            yield cls._stream_event(position, item)
+                    if len(rows) == NOTIFICATIONS_STREAM_BACKFILL_LIMIT:
+                        subscriber.resync = True
+                try:
+                    message = await asyncio.wait_for(
+                        subscriber.queue.get(), NOTIFICATIONS_STREAM_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if message == notification_stream.SYNC:
+                    subscriber.resync = True
+                    continue
+                position = item_cursor(message)
+                since = max(since, position)
+                if fresh(position):
+                    yield cls._stream_event(position, message)
+        finally:
+            notification_stream.hub.unsubscribe(subscriber)
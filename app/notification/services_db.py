@@ -1,11 +1,394 @@
-from typing import List, Optional, Tuple
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from notification.models import Notification
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F, Q
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+from tortoise.utils import chunk
+
+from base.enums import NotificationType
+from notification.cursor import Cursor
+from notification.models import Notification, NotificationCounter, NotificationKey
+from user.cache import UserStatus
 from user.models import User
 
 
-async def create_notification(user: User, type_, text: Optional[str]) -> Notification:
-    return await Notification.create(type=type_, text=text, user=user)
+async def _seed_counter(uid: int) -> NotificationCounter:
+    counter, _ = await NotificationCounter.get_or_create(
+        user_id=uid,
+        defaults={
+            "total": await Notification.filter(user_id=uid).count(),
+            "unread": await Notification.filter(user_id=uid, is_read=False).count(),
+        },
+    )
+    return counter
+
+
+async def _change_counter(uid: int, delta: int, unread_delta: int) -> None:
+    updated = await NotificationCounter.filter(user_id=uid).update(
+        total=F("total") + delta, unread=F("unread") + unread_delta
+    )
+    if not updated:
+        # first write for this user: seed the counter from the table itself
+        await _seed_counter(uid)
+
+
+async def _count_rows(uids: List[int]) -> Dict[int, Tuple[int, int]]:
+    """Actual (total, unread) row counts of the given users."""
+    counts = await (
+        Notification.filter(user_id__in=uids)
+        .annotate(total=Count("id"), unread=Count("id", _filter=Q(is_read=False)))
+        .group_by("user_id")
+        .values_list("user_id", "total", "unread")
+    )
+    totals: Dict[int, Tuple[int, int]] = {uid: (0, 0) for uid in uids}
+    totals.update((uid, (total, unread)) for uid, total, unread in counts)
+    return totals
+
+
+async def _change_counters(deltas: Dict[int, int], batch_size: int) -> None:
+    """Apply many counter changes with a handful of statements.
+
+    Users that got the same number of rows share one UPDATE, which is
+    usually a single statement for a whole batch. New rows are unread, so
+    both counters move by the same amount.
+    """
+    for uids in chunk(list(deltas), batch_size):
+        existing = set(
+            await NotificationCounter.filter(user_id__in=uids).values_list(
+                "user_id", flat=True
+            )
+        )
+        by_delta: Dict[int, List[int]] = defaultdict(list)
+        for uid in existing:
+            by_delta[deltas[uid]].append(uid)
+        for delta, delta_uids in by_delta.items():
+            await NotificationCounter.filter(user_id__in=delta_uids).update(
+                total=F("total") + delta, unread=F("unread") + delta
+            )
+        missing = [uid for uid in uids if uid not in existing]
+        if missing:
+            totals = await _count_rows(missing)
+            # a counter seeded concurrently already counts these rows
+            await NotificationCounter.bulk_create(
+                [
+                    NotificationCounter(
+                        user_id=uid, total=totals[uid][0], unread=totals[uid][1]
+                    )
+                    for uid in missing
+                ],
+                ignore_conflicts=True,
+            )
+
+
+# (user_id, type, group_key)
+Group = Tuple[int, NotificationType, str]
+
+
+async def _written_keys(keys: List[str]) -> Set[str]:
+    """The keys that already have a row, their own or one they were folded into."""
+    written = set(
+        await Notification.filter(idempotency_key__in=keys).values_list(
+            "idempotency_key", flat=True
+        )
+    )
+    written.update(
+        await NotificationKey.filter(key__in=keys).values_list("key", flat=True)
+    )
+    return written
+
+
+async def _get_by_key(key: str) -> Optional[Notification]:
+    notification = await Notification.get_or_none(idempotency_key=key)
+    if notification is None:
+        folded = await NotificationKey.get_or_none(key=key)
+        if folded is not None:
+            notification = await Notification.get_or_none(id=folded.notification_id)
+    return notification
+
+
+async def _save_folded_keys(folded: Dict[str, List[str]]) -> None:
+    """Record keys folded into newly inserted rows, found by the row's own key."""
+    if not folded:
+        return
+    ids = dict(
+        await Notification.filter(idempotency_key__in=list(folded)).values_list(
+            "idempotency_key", "id"
+        )
+    )
+    await NotificationKey.bulk_create(
+        [
+            NotificationKey(key=key, notification_id=ids[head_key])
+            for head_key, keys in folded.items()
+            if head_key in ids
+            for key in keys
+        ],
+        ignore_conflicts=True,
+    )
+
+
+async def _aggregate(
+    notifications: List[Notification], group_window: int
+) -> Tuple[List[Notification], List[int], Dict[int, int], Dict[str, List[str]]]:
+    """Fold grouped notifications into the users' recent aggregates.
+
+    Notifications sharing a group collapse into one row counting them all.
+    When the group already has a row from the last ``group_window``
+    seconds, that row takes them instead, becomes unread and moves to the
+    head of the feed. Returns the rows still to insert, the ids of the
+    aggregates that took rows, per user how many of those had been read,
+    and per key of a row to insert the keys folded into it.
+
+    A row keeps its own idempotency key; keys of rows folded into it go to
+    NotificationKey, so a retried or redelivered one is not counted again.
+    Those of rows to insert are saved by ``_save_folded_keys`` once the
+    rows exist.
+    """
+    if group_window <= 0:
+        return notifications, [], {}, {}
+    rows: List[Notification] = []
+    groups: Dict[Group, Notification] = {}
+    folded: Dict[Group, List[str]] = defaultdict(list)
+    for notification in notifications:
+        if notification.group_key is None:
+            rows.append(notification)
+            continue
+        group = (notification.user_id, notification.type, notification.group_key)
+        head = groups.get(group)
+        if head is None:
+            groups[group] = notification
+            continue
+        head.count += 1
+        head.text = notification.text
+        head.created_at = notification.created_at
+        if head.idempotency_key is None:
+            head.idempotency_key = notification.idempotency_key
+        elif notification.idempotency_key is not None:
+            folded[group].append(notification.idempotency_key)
+        if notification.actor_id is not None:
+            head.actor_id = notification.actor_id
+            head.actor_username = notification.actor_username
+            head.actor_avatar_url = notification.actor_avatar_url
+    if not groups:
+        return rows, [], {}, {}
+
+    now = datetime.now(timezone.utc)
+    # instances rather than .values(), which drops the FOR UPDATE
+    recent = (
+        await Notification.filter(
+            user_id__in={uid for uid, _, _ in groups},
+            group_key__in={key for _, _, key in groups},
+            created_at__gte=now - timedelta(seconds=group_window),
+        )
+        .select_for_update()
+        .order_by("created_at", "id")
+        .only("id", "user_id", "type", "group_key", "is_read")
+    )
+    # ascending order, so the newest row of a group wins
+    aggregates = {(row.user_id, row.type, row.group_key): row for row in recent}
+    merged: List[int] = []
+    reopened: Dict[int, int] = defaultdict(int)
+    pending: Dict[str, List[str]] = {}
+    keys: List[NotificationKey] = []
+    for group, head in groups.items():
+        aggregate = aggregates.get(group)
+        if aggregate is None:
+            rows.append(head)
+            if folded.get(group):
+                pending[head.idempotency_key] = folded[group]
+            continue
+        changes = {
+            "count": F("count") + head.count,
+            "text": head.text,
+            "created_at": head.created_at or now,
+            "is_read": False,
+        }
+        if head.idempotency_key is not None:
+            keys.append(
+                NotificationKey(key=head.idempotency_key, notification_id=aggregate.id)
+            )
+        keys.extend(
+            NotificationKey(key=key, notification_id=aggregate.id)
+            for key in folded.get(group, ())
+        )
+        if head.actor_id is not None:
+            changes["actor_id"] = head.actor_id
+            changes["actor_username"] = head.actor_username
+            changes["actor_avatar_url"] = head.actor_avatar_url
+        await Notification.filter(id=aggregate.id).update(**changes)
+        merged.append(aggregate.id)
+        if aggregate.is_read:
+            reopened[head.user_id] += 1
+    if keys:
+        await NotificationKey.bulk_create(keys)
+    for uid, unread in reopened.items():
+        await NotificationCounter.filter(user_id=uid).update(
+            unread=F("unread") + unread
+        )
+    return rows, merged, reopened, pending
+
+
+async def create_notification(
+    uid: int,
+    type_,
+    text: Optional[str],
+    idempotency_key: Optional[str] = None,
+    group_key: Optional[str] = None,
+) -> Notification:
+    """Create a notification, or return the one created under the same key."""
+    try:
+        async with in_transaction():
+            notification = await Notification.create(
+                type=type_,
+                text=text,
+                user_id=uid,
+                idempotency_key=idempotency_key,
+                group_key=group_key,
+            )
+            await _change_counter(uid, 1, 1)
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        return await Notification.get(idempotency_key=idempotency_key)
+    return notification
+
+
+async def create_grouped_notification(
+    uid: int,
+    type_,
+    text: Optional[str],
+    group_key: str,
+    group_window: int,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[Notification, bool, int]:
+    """Create a notification or fold it into the group's recent aggregate.
+
+    Returns the row, whether it existed before and the change of the
+    user's unread count. A key that was written before returns its row
+    unchanged.
+    """
+    if idempotency_key is not None:
+        existing = await _get_by_key(idempotency_key)
+        if existing is not None:
+            return existing, True, 0
+    notification = Notification(
+        user_id=uid,
+        type=type_,
+        text=text,
+        group_key=group_key,
+        idempotency_key=idempotency_key,
+    )
+    try:
+        async with in_transaction():
+            rows, merged, reopened, _ = await _aggregate([notification], group_window)
+            if rows:
+                await notification.save()
+                await _change_counter(uid, 1, 1)
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        existing = await _get_by_key(idempotency_key)
+        if existing is None:
+            raise
+        return existing, True, 0
+    if rows:
+        return notification, False, 1
+    return await Notification.get(id=merged[0]), True, reopened.get(uid, 0)
+
+
+async def get_existing_user_ids(
+    uids: Iterable[int], batch_size: int = 1000
+) -> Set[int]:
+    existing: Set[int] = set()
+    for batch in chunk(list(uids), batch_size):
+        existing.update(await User.filter(id__in=batch).values_list("id", flat=True))
+    return existing
+
+
+async def _insert_notifications(
+    notifications: List[Notification], batch_size: int, group_window: int
+) -> Dict[int, int]:
+    """Insert the rows and return the change of each user's unread count."""
+    notifications, _, reopened, folded = await _aggregate(notifications, group_window)
+    deltas: Dict[int, int] = defaultdict(int)
+    for notification in notifications:
+        deltas[notification.user_id] += 1
+    # ignore_conflicts: a duplicate key inserted concurrently is skipped
+    # rather than failing the whole batch
+    await Notification.bulk_create(
+        notifications, batch_size=batch_size, ignore_conflicts=True
+    )
+    await _save_folded_keys(folded)
+    await _change_counters(deltas, batch_size)
+    unread = dict(deltas)
+    for uid, count in reopened.items():
+        unread[uid] = unread.get(uid, 0) + count
+    return unread
+
+
+async def create_notifications_bulk(
+    items: List[
+        Tuple[int, NotificationType, Optional[str], Optional[str], Optional[UserStatus]]
+    ],
+    batch_size: int = 1000,
+    group_window: int = 0,
+) -> Dict[int, int]:
+    """Insert (user_id, type, text, group_key, actor) rows in one transaction.
+
+    The users must exist. Returns the change of each user's unread count.
+    """
+    async with in_transaction():
+        return await _insert_notifications(
+            [
+                Notification(
+                    user_id=uid,
+                    type=type_,
+                    text=text,
+                    group_key=group_key,
+                    actor_id=actor.id if actor else None,
+                    actor_username=actor.username if actor else None,
+                    actor_avatar_url=actor.avatar_url if actor else None,
+                )
+                for uid, type_, text, group_key, actor in items
+            ],
+            batch_size,
+            group_window,
+        )
+
+
+async def ingest_notifications(
+    rows: List[
+        Tuple[str, int, NotificationType, Optional[str], datetime, Optional[str]]
+    ],
+    batch_size: int = 1000,
+    group_window: int = 0,
+) -> Set[int]:
+    """Insert queued (key, user_id, type, text, created_at, group_key) rows.
+
+    Rows whose key was already written, e.g. redelivered ones, and rows for
+    users deleted meanwhile are skipped. Returns the users that got rows.
+    """
+    unique = {row[0]: row for row in rows}
+    async with in_transaction():
+        for key in await _written_keys(list(unique)):
+            del unique[key]
+        users = await get_existing_user_ids({row[1] for row in unique.values()})
+        notifications = [
+            Notification(
+                idempotency_key=key,
+                user_id=uid,
+                type=type_,
+                text=text,
+                created_at=created_at,
+                group_key=group_key,
+            )
+            for key, uid, type_, text, created_at, group_key in unique.values()
+            if uid in users
+        ]
+        await _insert_notifications(notifications, batch_size, group_window)
+    return {notification.user_id for notification in notifications}
 
 
 async def get_notification_by_user(
@@ -14,25 +397,247 @@ async def get_notification_by_user(
     return await Notification.get_or_none(user_id=uid, id=notification_id)
 
 
-async def delete_notification(notification: Notification) -> None:
-    await notification.delete()
+async def delete_notification(notification: Notification) -> int:
+    """Delete the row and return how many unread rows went with it."""
+    async with in_transaction():
+        # deleting on is_read, not on the loaded instance, stays correct
+        # when the row was marked read in the meantime
+        unread = await Notification.filter(id=notification.id, is_read=False).delete()
+        deleted = unread or await Notification.filter(id=notification.id).delete()
+        if deleted:
+            await _change_counter(notification.user_id, -deleted, -unread)
+    return unread
+
+
+async def count_notifications(uid: int) -> int:
+    total = (
+        await NotificationCounter.filter(user_id=uid)
+        .first()
+        .values_list("total", flat=True)
+    )
+    if total is None:
+        total = (await _seed_counter(uid)).total
+    return total
+
+
+async def count_unread_notifications(uid: int) -> int:
+    unread = (
+        await NotificationCounter.filter(user_id=uid)
+        .first()
+        .values_list("unread", flat=True)
+    )
+    if unread is None:
+        unread = (await _seed_counter(uid)).unread
+    return unread
+
+
+async def mark_notifications_read(uid: int, until: Optional[Cursor] = None) -> int:
+    """Mark the user's unread rows read, all or those up to ``until``.
+
+    The rows change in a single UPDATE; returns how many of them did.
+    """
+    qs = Notification.filter(user_id=uid, is_read=False)
+    if until is not None:
+        created_at, notification_id = until
+        qs = qs.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, id__lte=notification_id)
+        )
+    async with in_transaction():
+        updated = await qs.update(is_read=True)
+        if updated:
+            await _change_counter(uid, 0, -updated)
+    return updated
 
 
 async def fetch_notifications(
-    uid: int, offset: int, limit: int
-) -> Tuple[List[dict], int]:
-    qs = Notification.filter(user_id=uid).order_by("-created_at", "-id")
-    items = (
-        await qs.offset(offset)
+    uid: int, offset: int, limit: int, after: Optional[Cursor] = None
+) -> List[dict]:
+    qs = Notification.filter(user_id=uid)
+    if after is not None:
+        created_at, notification_id = after
+        qs = qs.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, id__lt=notification_id)
+        )
+    return (
+        await qs.order_by("-created_at", "-id")
+        .offset(offset)
         .limit(limit)
         .values(
             "id",
             "type",
             "text",
-            "user__username",
-            "user__avatar_url",
+            "actor_id",
+            "actor_username",
+            "actor_avatar_url",
             "created_at",
+            "is_read",
+            "group_key",
+            "count",
         )
     )
-    total = await qs.count()
-    return items, total
+
+
+async def fetch_notifications_since(uid: int, since: Cursor, limit: int) -> List[dict]:
+    """Rows newer than ``since``, oldest first."""
+    created_at, notification_id = since
+    return (
+        await Notification.filter(
+            Q(created_at__gt=created_at)
+            | Q(created_at=created_at, id__gt=notification_id),
+            user_id=uid,
+        )
+        .order_by("created_at", "id")
+        .limit(limit)
+        .values(
+            "id",
+            "type",
+            "text",
+            "actor_id",
+            "actor_username",
+            "actor_avatar_url",
+            "created_at",
+            "is_read",
+            "group_key",
+            "count",
+        )
+    )
+
+
+async def _delete_rows(rows: List[Notification]) -> None:
+    """Delete loaded rows and take them off their users' counters."""
+    await Notification.filter(id__in=[row.id for row in rows]).delete()
+    counts: Dict[int, Tuple[int, int]] = {}
+    for row in rows:
+        total, unread = counts.get(row.user_id, (0, 0))
+        counts[row.user_id] = (total + 1, unread + (not row.is_read))
+    # as in _change_counters, users with the same change share an UPDATE
+    by_change: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for uid, change in counts.items():
+        by_change[change].append(uid)
+    for (total, unread), uids in by_change.items():
+        await NotificationCounter.filter(user_id__in=uids).update(
+            total=F("total") - total, unread=F("unread") - unread
+        )
+
+
+async def delete_expired_notifications(
+    before: datetime, batch_size: int = 1000
+) -> Set[int]:
+    """Delete rows created before ``before``, one batch per transaction.
+
+    Rows another worker is already deleting are skipped rather than waited
+    for. Returns the users that lost rows.
+    """
+    users: Set[int] = set()
+    while True:
+        async with in_transaction():
+            rows = (
+                await Notification.filter(created_at__lt=before)
+                .select_for_update(skip_locked=True)
+                .order_by("created_at")
+                .limit(batch_size)
+                .only("id", "user_id", "is_read")
+            )
+            if rows:
+                await _delete_rows(rows)
+        users.update(row.user_id for row in rows)
+        if len(rows) < batch_size:
+            return users
+
+
+async def delete_excess_notifications(
+    max_per_user: int, batch_size: int = 1000
+) -> Set[int]:
+    """Keep only the newest ``max_per_user`` rows of every user.
+
+    Users over the cap are found through their counters. Returns the users
+    that lost rows.
+    """
+    users: Set[int] = set()
+    last_uid = 0
+    while True:
+        uids = (
+            await NotificationCounter.filter(
+                user_id__gt=last_uid, total__gt=max_per_user
+            )
+            .order_by("user_id")
+            .limit(batch_size)
+            .values_list("user_id", flat=True)
+        )
+        if not uids:
+            return users
+        for uid in uids:
+            while True:
+                async with in_transaction():
+                    rows = (
+                        await Notification.filter(user_id=uid)
+                        .select_for_update()
+                        .order_by("-created_at", "-id")
+                        .offset(max_per_user)
+                        .limit(batch_size)
+                        .only("id", "user_id", "is_read")
+                    )
+                    if rows:
+                        await _delete_rows(rows)
+                if rows:
+                    users.add(uid)
+                if len(rows) < batch_size:
+                    break
+        last_uid = uids[-1]
+
+
+async def _repair_counter(uid: int) -> bool:
+    """Recount one user under the counter's row lock and fix it if needed.
+
+    Writers update the counter in the transaction that changes the rows,
+    so with the row locked no write falls between the count and the fix.
+    """
+    async with in_transaction():
+        # an instance rather than .values(), which drops the FOR UPDATE
+        counter = (
+            await NotificationCounter.filter(user_id=uid)
+            .select_for_update()
+            .only("id", "total", "unread")
+            .first()
+        )
+        if counter is None:
+            return False
+        total, unread = (await _count_rows([uid]))[uid]
+        if (counter.total, counter.unread) == (total, unread):
+            return False
+        await NotificationCounter.filter(id=counter.id).update(
+            total=total, unread=unread
+        )
+        return True
+
+
+async def reconcile_notification_counters(batch_size: int = 1000) -> int:
+    """Repair counters that drifted from the actual row counts.
+
+    Batches are compared without locks, so writers are never held up by
+    the scan. A mismatch there may just be a write in flight, so only
+    those users are counted again under their counter's lock and fixed.
+
+    Returns the number of counters that were corrected.
+    """
+    repaired = 0
+    last_uid = 0
+    while True:
+        counters: Dict[int, Tuple[int, int]] = {
+            uid: (total, unread)
+            for uid, total, unread in await NotificationCounter.filter(
+                user_id__gt=last_uid
+            )
+            .order_by("user_id")
+            .limit(batch_size)
+            .values_list("user_id", "total", "unread")
+        }
+        if not counters:
+            return repaired
+        actual = await _count_rows(list(counters))
+        for uid, counts in counters.items():
+            if counts != actual[uid] and await _repair_counter(uid):
+                repaired += 1
+        last_uid = max(counters)
@@ -0,0 +1,122 @@
+"""Fan-out of new notifications to open /notifications/stream connections.
+
+Writers publish on ``notifications:events:{uid}`` either the serialized
+item or ``SYNC``, a hint that rows were written without their items at
+hand (bulk and write-behind inserts). Each worker holds a single pattern
+subscription and hands messages to the local connections of that user.
+
+Every connection has a bounded buffer. When a slow client lets it fill up,
+further messages are dropped and the connection catches up from the
+database instead, so a stalled client costs bounded memory.
+"""
+
+import asyncio
+from typing import Dict, Iterable, Set
+
+from base import pubsub
+from base.settings import cache_redis
+
+EVENTS_PATTERN = "notifications:events:*"
+SYNC = b"sync"
+
+
+def _events_channel(uid: int) -> str:
+    return f"notifications:events:{uid}"
+
+
+class Subscriber:
+    def __init__(self, uid: int, buffer_size: int) -> None:
+        self.uid = uid
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=buffer_size)
+        # set when messages were dropped and the feed must be re-read
+        self.resync = False
+
+    def push(self, message: bytes) -> bool:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.resync = True
+            return False
+        return True
+
+
+class StreamHub:
+    def __init__(self) -> None:
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self.connections = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, uid: int, buffer_size: int) -> Subscriber:
+        subscriber = Subscriber(uid, buffer_size)
+        self._subscribers.setdefault(uid, set()).add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.uid)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.uid]
+        self.connections -= 1
+
+    def dispatch(self, uid: int, message: bytes) -> None:
+        for subscriber in self._subscribers.get(uid, ()):
+            if subscriber.push(message):
+                self.delivered += 1
+            else:
+                self.overflows += 1
+
+    def resync_all(self) -> None:
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.resync = True
+                # wake up connections idling on an empty buffer
+                subscriber.push(SYNC)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": self.connections,
+            "users": len(self._subscribers),
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+
+hub = StreamHub()
+
+
+async def publish_item(uid: int, item: bytes) -> None:
+    await cache_redis.publish(_events_channel(uid), item)
+
+
+async def publish_sync(uids: Iterable[int]) -> None:
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        for uid in uids:
+            pipe.publish(_events_channel(uid), SYNC)
+        await pipe.execute()
+
+
+def _dispatch(message: dict) -> None:
+    channel = message["channel"]
+    if isinstance(channel, bytes):
+        channel = channel.decode()
+    hub.dispatch(int(channel.rpartition(":")[2]), message["data"])
+
+
+async def _resync_all() -> None:
+    hub.resync_all()
+
+
+async def listen_for_events(reconnect_delay: float = 1.0) -> None:
+    """Feed the hub from Redis for as long as the worker runs."""
+    await pubsub.listen(
+        cache_redis,
+        "Notification event",
+        _dispatch,
+        _resync_all,
+        patterns=[EVENTS_PATTERN],
+        reconnect_delay=reconnect_delay,
+    )
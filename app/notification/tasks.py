@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+from notification import ingest as notification_ingest
+from notification.services import NotificationService
+from notification.services_db import reconcile_notification_counters
+
+logger = logging.getLogger("app")
+
+
+async def run_counter_reconciliation(interval: int) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            repaired = await reconcile_notification_counters()
+        except Exception:
+            logger.exception("Notification counter reconciliation failed")
+            continue
+        if repaired:
+            logger.warning("Repaired %s drifted notification counters", repaired)
+
+
+async def run_notification_pruning(
+    interval: int, retention_days: int, max_per_user: int
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            users = await NotificationService.prune_notifications(
+                retention_days, max_per_user
+            )
+        except Exception:
+            logger.exception("Notification pruning failed")
+            continue
+        if users:
+            logger.info("Pruned notifications of %s users", users)
+
+
+async def run_ingest_consumer(
+    consumer: str,
+    batch_size: int,
+    block_ms: int,
+    claim_interval: float,
+    retry_delay: float = 1.0,
+    stats_interval: float = 5.0,
+) -> None:
+    """Write notifications queued on the ingest stream in batches.
+
+    Entries this consumer read before a restart or a failed write are
+    retried first; entries abandoned by dead consumers are claimed every
+    ``claim_interval`` seconds. The backlog exported at /metrics is
+    refreshed every ``stats_interval`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    pending = True
+    next_claim = loop.time()
+    next_stats = loop.time()
+    while True:
+        try:
+            await notification_ingest.ensure_group()
+            while True:
+                entries = []
+                if pending:
+                    entries = await notification_ingest.read_batch(
+                        consumer, batch_size, block_ms, pending=True
+                    )
+                    pending = bool(entries)
+                if not entries and loop.time() >= next_claim:
+                    entries = await notification_ingest.claim_stale(
+                        consumer, batch_size
+                    )
+                    next_claim = loop.time() + claim_interval
+                if not entries:
+                    entries = await notification_ingest.read_batch(
+                        consumer, batch_size, block_ms
+                    )
+                if entries:
+                    await NotificationService.ingest_batch(entries)
+                if loop.time() >= next_stats:
+                    await notification_ingest.refresh_backlog()
+                    next_stats = loop.time() + stats_interval
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            notification_ingest.ingest_metrics["failed_batches"] += 1
+            logger.exception("Notification ingest failed, retrying")
+            pending = True
+            await asyncio.sleep(retry_delay)
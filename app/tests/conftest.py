@@ -1,52 +1,440 @@
 from __future__ import annotations
 
+import asyncio
 import sys
+import time
 from contextlib import asynccontextmanager
+from copy import deepcopy
+from fnmatch import fnmatch
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+from uuid import uuid4
 
 import pytest
 from fastapi import FastAPI
 from httpx import ASGITransport, AsyncClient
+from redis.exceptions import ResponseError, WatchError
 from tortoise.contrib.fastapi import register_tortoise
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT_DIR))
 
-from notification import services as notification_services
+from base import cache as base_cache
+from notification import cache as notification_cache
+from notification import ingest as notification_ingest
+from notification import stream as notification_stream
 from notification.router import notification_router
+from user import cache as user_cache
+from user import revocation as user_revocation
 from user import services as user_services
 from user.router import auth_router
 
 
+def _encode(value):
+    # like a real client, numbers come back from Redis as bytes
+    if isinstance(value, (int, float)):
+        return str(value).encode()
+    return value
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self._redis = redis
+        self._commands: List[tuple] = []
+        # between WATCH and MULTI commands run immediately
+        self._watching = False
+        self._watched: Dict[str, object] = {}
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.reset()
+
+    def __getattr__(self, name: str):
+        if self._watching:
+            return getattr(self._redis, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def watch(self, *keys: str) -> None:
+        self._redis.calls += 1
+        self._watching = True
+        self._watched = {key: deepcopy(self._redis._store.get(key)) for key in keys}
+
+    def multi(self) -> None:
+        self._watching = False
+
+    async def reset(self) -> None:
+        self._commands.clear()
+        self._watching = False
+        self._watched = {}
+
+    async def execute(self) -> List[object]:
+        calls = self._redis.calls
+        commands, self._commands = self._commands, []
+        watched, self._watched = self._watched, {}
+        if any(self._redis._store.get(key) != value for key, value in watched.items()):
+            self._redis.calls = calls + 1
+            raise WatchError("Watched variable changed.")
+        results = []
+        for name, args, kwargs in commands:
+            results.append(await getattr(self._redis, name)(*args, **kwargs))
+        self._redis.calls = calls + 1
+        return results
+
+
+class FakePubSub:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self._redis = redis
+        self._channels: set = set()
+        self._patterns: set = set()
+        self._messages: "asyncio.Queue[dict]" = asyncio.Queue()
+        redis._pubsubs.add(self)
+
+    async def subscribe(self, *channels: str) -> None:
+        self._channels.update(channels)
+
+    async def psubscribe(self, *patterns: str) -> None:
+        self._patterns.update(patterns)
+
+    def deliver(self, channel: str, message) -> int:
+        if channel in self._channels:
+            self._messages.put_nowait(
+                {"type": "message", "channel": channel, "data": message}
+            )
+            return 1
+        for pattern in self._patterns:
+            if fnmatch(channel, pattern):
+                self._messages.put_nowait(
+                    {
+                        "type": "pmessage",
+                        "pattern": pattern,
+                        "channel": channel,
+                        "data": message,
+                    }
+                )
+                return 1
+        return 0
+
+    async def get_message(
+        self, ignore_subscribe_messages: bool = False, timeout: float = 0.0
+    ):
+        try:
+            return await asyncio.wait_for(self._messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self) -> None:
+        self._redis._pubsubs.discard(self)
+
+
 class FakeRedis:
     def __init__(self) -> None:
         self._store: Dict[str, object] = {}
+        self._streams: Dict[str, dict] = {}
+        self._pubsubs: set = set()
+        # round trips to the server; a pipeline counts as one
+        self.calls = 0
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
 
     async def get(self, key: str):
+        self.calls += 1
         return self._store.get(key)
 
-    async def set(self, key: str, value, ex: Optional[int] = None):
+    async def mget(self, keys: List[str]) -> List[object]:
+        self.calls += 1
+        return [self._store.get(key) for key in keys]
+
+    async def set(
+        self,
+        key: str,
+        value,
+        ex: Optional[int] = None,
+        px: Optional[int] = None,
+        nx: bool = False,
+    ):
+        self.calls += 1
+        if nx and key in self._store:
+            return None
         self._store[key] = value
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        self.calls += 1
+        return sum(self._store.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        self.calls += 1
+        return key in self._store
 
     async def incr(self, key: str) -> int:
+        return await self.incrby(key, 1)
+
+    async def incrby(self, key: str, amount: int) -> int:
+        self.calls += 1
         value = self._store.get(key, 0)
         try:
             current = int(value)
         except (TypeError, ValueError):
             current = 0
-        current += 1
+        current += amount
         self._store[key] = current
         return current
 
+    async def publish(self, channel: str, message) -> int:
+        self.calls += 1
+        return sum(pubsub.deliver(channel, message) for pubsub in list(self._pubsubs))
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
+
+    async def exists(self, *keys: str) -> int:
+        self.calls += 1
+        return sum(key in self._store for key in keys)
+
+    async def hset(
+        self,
+        key: str,
+        field: Optional[str] = None,
+        value=None,
+        mapping: Optional[dict] = None,
+    ) -> int:
+        self.calls += 1
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        stored = self._store.setdefault(key, {})
+        created = len(set(items) - set(stored))
+        stored.update({name: _encode(item) for name, item in items.items()})
+        return created
+
+    async def hkeys(self, key: str) -> List[bytes]:
+        self.calls += 1
+        return [field.encode() for field in self._store.get(key, {})]
+
+    async def hdel(self, key: str, *fields) -> int:
+        self.calls += 1
+        mapping = self._store.get(key, {})
+        names = [f.decode() if isinstance(f, bytes) else f for f in fields]
+        return sum(mapping.pop(name, None) is not None for name in names)
+
+    async def hmget(self, key: str, *fields: str) -> List[object]:
+        self.calls += 1
+        mapping = self._store.get(key, {})
+        return [mapping.get(field) for field in fields]
+
+    async def lpush(self, key: str, *values) -> int:
+        self.calls += 1
+        items = self._store.setdefault(key, [])
+        for value in values:
+            items.insert(0, _encode(value))
+        return len(items)
+
+    async def ltrim(self, key: str, start: int, end: int) -> bool:
+        self.calls += 1
+        if key in self._store:
+            self._store[key] = self._store[key][start : None if end == -1 else end + 1]
+        return True
+
+    async def lrem(self, key: str, count: int, value) -> int:
+        self.calls += 1
+        items = self._store.get(key, [])
+        if value not in items:
+            return 0
+        items.remove(value)
+        return 1
+
+    async def lindex(self, key: str, index: int):
+        self.calls += 1
+        items = self._store.get(key, [])
+        return items[index] if -len(items) <= index < len(items) else None
+
+    async def rpush(self, key: str, *values) -> int:
+        self.calls += 1
+        items = self._store.setdefault(key, [])
+        items.extend(_encode(value) for value in values)
+        return len(items)
+
+    async def lrange(self, key: str, start: int, end: int) -> List[object]:
+        self.calls += 1
+        items = self._store.get(key, [])
+        return items[start : None if end == -1 else end + 1]
+
+    # streams: entries are kept in insertion order, ids are "<ms>-<seq>"
+
+    def _stream(self, name: str) -> dict:
+        return self._streams.setdefault(name, {"entries": {}, "groups": {}})
+
+    async def xadd(self, name: str, fields: dict) -> str:
+        self.calls += 1
+        stream = self._stream(name)
+        entry_id = f"{int(time.time() * 1000)}-{len(stream['entries'])}"
+        while entry_id in stream["entries"]:
+            ms, seq = entry_id.split("-")
+            entry_id = f"{ms}-{int(seq) + 1}"
+        stream["entries"][entry_id] = {key: str(value) for key, value in fields.items()}
+        return entry_id
+
+    async def xlen(self, name: str) -> int:
+        self.calls += 1
+        return len(self._streams.get(name, {}).get("entries", {}))
+
+    async def xrange(self, name: str, count: Optional[int] = None) -> list:
+        self.calls += 1
+        entries = list(self._streams.get(name, {}).get("entries", {}).items())
+        return entries[:count] if count is not None else entries
+
+    async def xgroup_create(
+        self, name: str, groupname: str, id: str = "$", mkstream: bool = False
+    ) -> bool:
+        self.calls += 1
+        stream = self._stream(name)
+        if groupname in stream["groups"]:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        stream["groups"][groupname] = {"delivered": set(), "pending": {}}
+        return True
+
+    async def xreadgroup(
+        self,
+        groupname: str,
+        consumername: str,
+        streams: dict,
+        count: Optional[int] = None,
+        block: Optional[int] = None,
+    ) -> list:
+        self.calls += 1
+        ((name, start),) = streams.items()
+        stream = self._stream(name)
+        group = stream["groups"][groupname]
+        if start == ">":
+            ids = [
+                entry_id
+                for entry_id in stream["entries"]
+                if entry_id not in group["delivered"]
+            ]
+        else:
+            ids = [
+                entry_id
+                for entry_id, (consumer, _) in group["pending"].items()
+                if consumer == consumername and entry_id in stream["entries"]
+            ]
+        ids = ids[:count] if count is not None else ids
+        now = time.time() * 1000
+        for entry_id in ids:
+            group["delivered"].add(entry_id)
+            group["pending"][entry_id] = (consumername, now)
+        if not ids:
+            if block:
+                await asyncio.sleep(block / 1000)
+            return []
+        return [[name, [(entry_id, stream["entries"][entry_id]) for entry_id in ids]]]
+
+    async def xautoclaim(
+        self,
+        name: str,
+        groupname: str,
+        consumername: str,
+        min_idle_time: int,
+        count: Optional[int] = None,
+    ) -> list:
+        self.calls += 1
+        stream = self._stream(name)
+        group = stream["groups"][groupname]
+        now = time.time() * 1000
+        ids = [
+            entry_id
+            for entry_id, (_, delivered_at) in group["pending"].items()
+            if now - delivered_at >= min_idle_time and entry_id in stream["entries"]
+        ]
+        ids = ids[:count] if count is not None else ids
+        for entry_id in ids:
+            group["pending"][entry_id] = (consumername, now)
+        return [
+            "0-0",
+            [(entry_id, stream["entries"][entry_id]) for entry_id in ids],
+            [],
+        ]
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        self.calls += 1
+        pending = self._stream(name)["groups"][groupname]["pending"]
+        return sum(pending.pop(entry_id, None) is not None for entry_id in ids)
+
+    async def xdel(self, name: str, *ids: str) -> int:
+        self.calls += 1
+        entries = self._stream(name)["entries"]
+        return sum(entries.pop(entry_id, None) is not None for entry_id in ids)
+
+    async def xpending(self, name: str, groupname: str) -> dict:
+        self.calls += 1
+        groups = self._streams.get(name, {}).get("groups", {})
+        if groupname not in groups:
+            raise ResponseError("NOGROUP No such key or consumer group")
+        return {"pending": len(groups[groupname]["pending"])}
+
+    async def zadd(self, key: str, mapping: dict) -> int:
+        self.calls += 1
+        scores = self._store.setdefault(key, {})
+        added = len(set(mapping) - set(scores))
+        scores.update({member: float(score) for member, score in mapping.items()})
+        return added
+
+    async def zremrangebyscore(self, key: str, low, high) -> int:
+        self.calls += 1
+        scores = self._store.get(key, {})
+        removed = [
+            member
+            for member, score in scores.items()
+            if float(low) <= score <= float(high)
+        ]
+        for member in removed:
+            del scores[member]
+        return len(removed)
+
+    async def zrangebyscore(self, key: str, low, high, withscores: bool = False):
+        self.calls += 1
+        items = sorted(
+            (score, member)
+            for member, score in self._store.get(key, {}).items()
+            if float(low) <= score <= float(high)
+        )
+        if withscores:
+            return [(member, score) for score, member in items]
+        return [member for _, member in items]
+
 
 @pytest.fixture(autouse=True)
 def fake_redis(monkeypatch):
     fake = FakeRedis()
-    monkeypatch.setattr(notification_services, "redis", fake)
+    monkeypatch.setattr(notification_cache, "cache_redis", fake)
+    monkeypatch.setattr(base_cache, "redis", fake)
+    monkeypatch.setattr(notification_ingest, "redis", fake)
+    monkeypatch.setattr(notification_stream, "cache_redis", fake)
+    monkeypatch.setattr(user_cache, "cache_redis", fake)
+    monkeypatch.setattr(user_revocation, "redis", fake)
     return fake
 
 
+@pytest.fixture(autouse=True)
+def local_caches():
+    for cache in base_cache.local_caches.values():
+        cache.clear()
+    yield base_cache.local_caches
+
+
+@pytest.fixture(autouse=True)
+def revocations():
+    user_revocation.revocations.replace({}, set())
+    yield user_revocation.revocations
+
+
 @pytest.fixture(autouse=True)
 def jwt_secret(monkeypatch):
     monkeypatch.setattr(user_services, "JWT_SECRET", "test-secret")
@@ -99,3 +487,25 @@ async def client(app):
     async with app.router.lifespan_context(app):
         async with AsyncClient(transport=transport, base_url="http://test") as client:
             yield client
+
+
+@pytest.fixture()
+def register(client):
+    """Register a new user, returning their id and auth headers."""
+
+    async def register_user():
+        response = await client.post(
+            "/auth/register",
+            json={
+                "username": f"user_{uuid4().hex[:8]}",
+                "password": "StrongPass1!",
+                "avatar_url": None,
+            },
+        )
+        assert response.status_code == 201
+        body = response.json()
+        return body["user_id"], {
+            "Authorization": f"Bearer {body['tokens']['access_token']}"
+        }
+
+    return register_user
@@ -3,7 +3,12 @@ from uuid import uuid4
 import pytest
 from httpx import AsyncClient
 
+from base.exceptions import ForbiddenError, UnauthorizedError
+from user import revocation
+from user.models import User
+from user.revocation import revocations
 from user.schemas import AccessTokenResponse, RegisterResponse, TokenPair
+from user.services import UserService
 
 
 @pytest.mark.asyncio
@@ -38,3 +43,60 @@ async def test_register_login_refresh(client: AsyncClient):
     )
     assert response.status_code == 200
     AccessTokenResponse.model_validate(response.json())
+
+
+@pytest.mark.asyncio
+async def test_logout_and_blocking_revoke_tokens(client: AsyncClient):
+    async def register():
+        response = await client.post(
+            "/auth/register",
+            json={
+                "username": f"user_{uuid4().hex[:8]}",
+                "password": "StrongPass1!",
+                "avatar_url": None,
+            },
+        )
+        assert response.status_code == 201
+        return RegisterResponse.model_validate(response.json())
+
+    first = await register()
+    headers = {"Authorization": f"Bearer {first.tokens.access_token}"}
+    response = await client.get("/notifications/", headers=headers)
+    assert response.status_code == 200
+
+    response = await client.post(
+        "/auth/logout",
+        json={"refresh_token": first.tokens.refresh_token},
+        headers=headers,
+    )
+    assert response.status_code == 204
+    with pytest.raises(UnauthorizedError):
+        await client.get("/notifications/", headers=headers)
+    with pytest.raises(ForbiddenError):
+        await client.post(
+            "/auth/refresh",
+            headers={"Authorization": f"Bearer {first.tokens.refresh_token}"},
+        )
+
+    second = await register()
+    headers = {"Authorization": f"Bearer {second.tokens.access_token}"}
+    await UserService.set_blocked(second.user_id, True)
+    with pytest.raises(UnauthorizedError):
+        await client.get("/notifications/", headers=headers)
+
+    # another worker learns about both from Redis
+    revocations.replace({}, set())
+    await revocation.sync()
+    assert second.user_id in revocations.blocked
+    assert len(revocations.revoked) == 2
+
+    await UserService.set_blocked(second.user_id, False)
+    response = await client.get("/notifications/", headers=headers)
+    assert response.status_code == 200
+
+    # the column is what counts, however it was set
+    await User.filter(id=second.user_id).update(blocked=True)
+    await revocation.sync()
+    assert second.user_id in revocations.blocked
+    with pytest.raises(UnauthorizedError):
+        await client.get("/notifications/", headers=headers)
@@ -0,0 +1,23 @@
+import pytest
+
+from base import codec
+
+BODY = b'{"data":[' + b",".join([b'{"id":1,"type":"like"}'] * 200) + b'],"meta":{}}'
+
+
+@pytest.mark.parametrize("codec_name", sorted(codec.codecs))
+def test_payload_roundtrip(codec_name):
+    encoded = codec.encode_payload(BODY, codec_name)
+
+    assert encoded[:1] == codec.codecs[codec_name].tag
+    assert codec.decode_payload(encoded) == BODY
+
+
+def test_small_payload_stays_raw():
+    assert codec.encode_payload(b"{}", "zlib") == b"J{}"
+
+
+def test_legacy_and_unknown_payloads():
+    assert codec.decode_payload(BODY) == BODY
+    assert codec.decode_payload(b"?garbage") is None
+    assert codec.decode_payload(b"Znot-zlib") is None
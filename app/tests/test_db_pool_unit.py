@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from base.db import InstrumentedPool, database_config
+from base.exceptions import ServiceUnavailableError
+
+
+class FakeAsyncpgPool:
+    def __init__(self, size: int) -> None:
+        self._free = asyncio.Queue()
+        for i in range(size):
+            self._free.put_nowait(f"conn-{i}")
+        self._size = size
+
+    async def acquire(self, timeout=None):
+        return await asyncio.wait_for(self._free.get(), timeout)
+
+    async def release(self, connection) -> None:
+        self._free.put_nowait(connection)
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get_max_size(self) -> int:
+        return self._size
+
+    def get_idle_size(self) -> int:
+        return self._free.qsize()
+
+
+@pytest.mark.asyncio
+async def test_pool_reports_usage_and_times_out():
+    pool = InstrumentedPool(FakeAsyncpgPool(1), acquire_timeout=0.01)
+
+    connection = await pool.acquire()
+    assert pool.stats()["in_use"] == 1
+    with pytest.raises(ServiceUnavailableError) as exc_info:
+        await pool.acquire()
+    assert exc_info.value.code == "database_busy"
+    await pool.release(connection)
+
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["acquired"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["waiting"] == 0
+    assert stats["wait_seconds"] >= 0.01
+    # anything else is the wrapped pool's
+    assert pool.get_max_size() == 1
+
+
+def test_database_config():
+    config = database_config("postgres://u:p@db:5432/app", minsize=2, maxsize=8)
+    assert config["engine"] == "base.db"
+    assert config["credentials"]["host"] == "db"
+    assert config["credentials"]["maxsize"] == 8
+
+    assert database_config("sqlite://:memory:", minsize=2) == "sqlite://:memory:"
@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from httpx import AsyncClient
+
+from base.enums import NotificationType
+from base.exceptions import ServiceUnavailableError
+from notification import ingest as notification_ingest
+from notification import services as notification_services
+from notification.ingest import INGEST_STREAM
+from notification.models import Notification
+from notification.services import NotificationService
+from notification.services_db import count_notifications
+from notification.tasks import run_ingest_consumer
+
+
+@pytest.mark.asyncio
+async def test_idempotent_create(client: AsyncClient, register):
+    uid, headers = await register()
+    for _ in range(2):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like"},
+            headers={**headers, "Idempotency-Key": "retry-1"},
+        )
+        assert response.status_code == 201
+    assert await Notification.filter(user_id=uid).count() == 1
+    assert await count_notifications(uid) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotent_grouped_create(client: AsyncClient, register):
+    uid, headers = await register()
+    for key in ("k1", "k2", "k1", "k2"):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like", "group_key": "post:1"},
+            headers={**headers, "Idempotency-Key": key},
+        )
+        assert response.status_code == 201
+    # retries of keys folded into the aggregate, not only the latest one
+    aggregate = await Notification.get(user_id=uid)
+    assert aggregate.count == 2
+    assert await count_notifications(uid) == 1
+
+
+@pytest.mark.asyncio
+async def test_redelivered_grouped_entries_are_counted_once(register):
+    uid, _ = await register()
+    rows = [
+        (
+            f"{uid}:{key}",
+            uid,
+            NotificationType.LIKE,
+            None,
+            datetime.now(timezone.utc),
+            "post:1",
+        )
+        for key in ("a", "b", "c")
+    ]
+    # a and b fold into a new row, c into the existing aggregate
+    await NotificationService._ingest_notifications(rows[:2], group_window=3600)
+    await NotificationService._ingest_notifications(rows[2:], group_window=3600)
+    for _ in range(2):
+        await NotificationService._ingest_notifications(rows, group_window=3600)
+    assert [row.count for row in await Notification.filter(user_id=uid)] == [3]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_ingestion(
+    client: AsyncClient, register, fake_redis, monkeypatch
+):
+    monkeypatch.setattr(notification_services, "NOTIFICATIONS_WRITE_BEHIND", True)
+    uid, headers = await register()
+
+    for key in ("a", "a", None):
+        extra = {"Idempotency-Key": key} if key else {}
+        response = await client.post(
+            "/notifications/",
+            json={"type": "comment", "text": "queued"},
+            headers={**headers, **extra},
+        )
+        assert response.status_code == 202
+    assert await fake_redis.xlen(INGEST_STREAM) == 2
+    assert await Notification.filter(user_id=uid).count() == 0
+
+    stats = await notification_ingest.ingest_stats()
+    assert stats["backlog"] == 2
+    assert stats["lag_seconds"] >= 0
+    assert notification_ingest.ingest_backlog["backlog"] == 2
+
+    consumer = asyncio.create_task(
+        run_ingest_consumer("test", batch_size=10, block_ms=10, claim_interval=60)
+    )
+    try:
+        for _ in range(100):
+            if not await fake_redis.xlen(INGEST_STREAM):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+
+    response = await client.get("/notifications/", headers=headers)
+    assert response.json()["meta"]["total_items"] == 2
+    assert await count_notifications(uid) == 2
+    # refreshed by the consumer for /metrics
+    assert notification_ingest.ingest_backlog["backlog"] == 0
+    stats = await notification_ingest.ingest_stats()
+    assert stats["backlog"] == 0
+    assert stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_redelivered_entries_are_written_once(register, monkeypatch):
+    monkeypatch.setattr(notification_ingest, "NOTIFICATIONS_INGEST_CLAIM_IDLE_MS", 0)
+    uid, _ = await register()
+    await notification_ingest.ensure_group()
+    await notification_ingest.enqueue(uid, NotificationType.LIKE, None, f"{uid}:k")
+    entries = await notification_ingest.read_batch("crashed", 10, 0)
+    # the first consumer wrote the batch but died before acknowledging it
+    await NotificationService._ingest_notifications(
+        [row[1:] for row in notification_ingest.parse_entries(entries)[0]]
+    )
+
+    assert await notification_ingest.claim_stale("next", 10) == entries
+    await NotificationService.ingest_batch(entries)
+    assert await Notification.filter(user_id=uid).count() == 1
+    assert await count_notifications(uid) == 1
+
+
+@pytest.mark.asyncio
+async def test_enqueue_backpressure(fake_redis, monkeypatch):
+    monkeypatch.setattr(notification_ingest, "NOTIFICATIONS_INGEST_MAX_BACKLOG", 1)
+    assert await notification_ingest.enqueue(1, NotificationType.LIKE, None, "1:a")
+    with pytest.raises(ServiceUnavailableError):
+        await notification_ingest.enqueue(1, NotificationType.LIKE, None, "1:b")
+
+    # the rejected key can be retried once the backlog drains
+    await fake_redis.delete(INGEST_STREAM)
+    fake_redis._streams.clear()
+    assert await notification_ingest.enqueue(1, NotificationType.LIKE, None, "1:b")
@@ -0,0 +1,76 @@
+import time
+
+from base.cache import LocalCache
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache("test_lru", maxsize=2, max_bytes=1024, ttl=60)
+    cache.set("a", 1, size=1)
+    cache.set("b", 2, size=1)
+    assert cache.get("a") == 1
+    cache.set("c", 3, size=1)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_local_cache_respects_memory_limit_and_ttl(monkeypatch):
+    cache = LocalCache("test_bytes", maxsize=10, max_bytes=10, ttl=5)
+    cache.set("a", "x", size=6)
+    cache.set("b", "y", size=6)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("b") is None
+
+
+def test_local_cache_invalidates_by_tag():
+    cache = LocalCache("test_tags", maxsize=10, max_bytes=1024, ttl=60)
+    cache.set((1, "page:0:20"), "p1", tag="1", size=1)
+    cache.set((1, "page:20:20"), "p2", tag="1", size=1)
+    cache.set((2, "page:0:20"), "p3", tag="2", size=1)
+    epoch = cache.epoch("1")
+    other_epoch = cache.epoch("2")
+
+    cache.invalidate_tag("1")
+    cache.set((1, "page:0:20"), "late", tag="1", size=1, epoch=epoch)
+    # another tag's invalidation doesn't spoil a fill
+    cache.invalidate_tag("3")
+    cache.set((2, "page:20:20"), "p4", tag="2", size=1, epoch=other_epoch)
+
+    assert cache.get((1, "page:0:20")) is None
+    assert cache.get((1, "page:20:20")) is None
+    assert cache.get((2, "page:0:20")) == "p3"
+    assert cache.get((2, "page:20:20")) == "p4"
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "evictions": 0,
+        "entries": 2,
+        "bytes": 2,
+    }
+
+    # a clear spoils fills of every tag
+    epoch = cache.epoch("2")
+    cache.clear()
+    cache.set((2, "page:0:20"), "late", tag="2", size=1, epoch=epoch)
+    assert cache.get((2, "page:0:20")) is None
+
+
+def test_local_cache_entry_ttl_only_shortens(monkeypatch):
+    cache = LocalCache("test_entry_ttl", maxsize=10, max_bytes=1024, ttl=60)
+    cache.set("short", 1, size=1, ttl=5)
+    cache.set("long", 2, size=1, ttl=600)
+    cache.set("expired", 3, size=1, ttl=0)
+    assert cache.get("expired") is None
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("long") is None
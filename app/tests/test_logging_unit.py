@@ -0,0 +1,89 @@
+import json
+import logging
+import queue
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from base.logging import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    RequestContextMiddleware,
+    RequestIdFilter,
+    SamplingFilter,
+    request_id_var,
+)
+
+
+def make_record(level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("app", level, __file__, 1, "hello %s", ("world",), None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extras():
+    token = request_id_var.set("req-1")
+    try:
+        record = make_record(duration_ms=12.5)
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload["message"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["request_id"] == "req-1"
+    assert payload["duration_ms"] == 12.5
+    assert "args" not in payload
+
+
+def test_sampling_filter_keeps_warnings_and_whole_requests():
+    drop_all = SamplingFilter(0)
+    assert not drop_all.filter(make_record(request_id="a"))
+    assert drop_all.filter(make_record(logging.WARNING, request_id="a"))
+
+    half = SamplingFilter(0.5)
+    kept = {
+        request_id: half.filter(make_record(request_id=request_id))
+        for request_id in (f"req-{i}" for i in range(200))
+    }
+    assert 0 < sum(kept.values()) < 200
+    for request_id, decision in kept.items():
+        record = make_record(logging.DEBUG, request_id=request_id)
+        assert half.filter(record) is decision
+
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_request_context_middleware(caplog):
+    caplog.set_level(logging.WARNING, logger="app")
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware, slow_request_seconds=1e-9)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"request_id": request_id_var.get()}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/items/1", headers={"X-Request-ID": "abc-1"})
+        assert response.headers["X-Request-ID"] == "abc-1"
+        assert response.json() == {"request_id": "abc-1"}
+
+        response = await client.get("/items/2", headers={"X-Request-ID": "bad id!"})
+        request_id = response.headers["X-Request-ID"]
+        assert request_id != "bad id!"
+        assert response.json() == {"request_id": request_id}
+
+    slow = [r for r in caplog.records if r.getMessage() == "Slow request"]
+    assert [(r.route, r.status) for r in slow] == [("/items/{item_id}", 200)] * 2
+    assert request_id_var.get() is None
@@ -0,0 +1,61 @@
+from uuid import uuid4
+
+import pytest
+from httpx import AsyncClient
+
+from base import metrics
+from notification.services import page_cache_metrics
+from user.schemas import TokenPair
+
+
+@pytest.fixture()
+def metrics_enabled(app, monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(metrics, "tracking", True)
+    monkeypatch.setattr(metrics, "stats_sources", {})
+    metrics.register_stats("notification_page_cache", lambda: page_cache_metrics)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.metrics_router, prefix="/metrics")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient, metrics_enabled):
+    metrics.instrument_tortoise()
+    username = f"user_{uuid4().hex[:8]}"
+    password = "StrongPass1!"
+    response = await client.post(
+        "/auth/register",
+        json={"username": username, "password": password, "avatar_url": None},
+    )
+    assert response.status_code == 201
+    response = await client.post(
+        "/auth/login", json={"username": username, "password": password}
+    )
+    tokens = TokenPair.model_validate(response.json())
+    auth_headers = {"Authorization": f"Bearer {tokens.access_token}"}
+
+    misses = page_cache_metrics["misses"]
+    local_hits = page_cache_metrics["local_hits"]
+    for _ in range(2):
+        response = await client.get("/notifications/", headers=auth_headers)
+        assert response.status_code == 200
+    assert page_cache_metrics["misses"] == misses + 1
+    assert page_cache_metrics["local_hits"] == local_hits + 1
+    await client.get("/no-such-path")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    feed = 'method="GET",route="/notifications/"'
+    assert f'http_request_duration_seconds_count{{{feed},status="200"}}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert f"app_notification_page_cache_misses {misses + 1}" in body
+
+    # the first page load queried the database, the local cache hit did not
+    series = metrics.request_db_queries._series[
+        (("method", "GET"), ("route", "/notifications/"))
+    ]
+    assert series[-1] == 2
+    assert series[0] == 1
+    assert series[-2] > 0
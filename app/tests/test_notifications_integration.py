@@ -1,37 +1,24 @@
-from uuid import uuid4
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from httpx import AsyncClient
 
+from notification import dependencies as notification_dependencies
+from notification import services as notification_services
+from notification.models import Notification, NotificationCounter
 from notification.schemas import Page
-from user.schemas import NotificationInstanceSchema, TokenPair
+from notification.services import NotificationService
+from notification.services_db import (
+    count_notifications,
+    count_unread_notifications,
+    reconcile_notification_counters,
+)
+from user.schemas import NotificationInstanceSchema
 
 
 @pytest.mark.asyncio
-async def test_notifications_flow(client: AsyncClient):
-    username = f"user_{uuid4().hex[:8]}"
-    password = "StrongPass1!"
-
-    response = await client.post(
-        "/auth/register",
-        json={
-            "username": username,
-            "password": password,
-            "avatar_url": None,
-        },
-    )
-    assert response.status_code == 201
-
-    response = await client.post(
-        "/auth/login",
-        json={
-            "username": username,
-            "password": password,
-        },
-    )
-    assert response.status_code == 200
-    tokens = TokenPair.model_validate(response.json())
-    auth_headers = {"Authorization": f"Bearer {tokens.access_token}"}
+async def test_notifications_flow(client: AsyncClient, register):
+    _, auth_headers = await register()
 
     response = await client.post(
         "/notifications/",
@@ -73,3 +60,297 @@ async def test_notifications_flow(client: AsyncClient):
     assert page.meta.total_items == 0
     assert page.meta.total_pages == 0
     assert page.meta.has_next is False
+
+
+@pytest.mark.asyncio
+async def test_notifications_cursor_pagination(client: AsyncClient, register):
+    _, auth_headers = await register()
+
+    for i in range(5):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "comment", "text": f"n{i}"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 201
+
+    response = await client.get(
+        "/notifications/", params={"limit": 2}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    seen = [item.text for item in page.data]
+    assert page.meta.next_cursor is not None
+
+    while page.meta.next_cursor:
+        response = await client.get(
+            "/notifications/",
+            params={"limit": 2, "cursor": page.meta.next_cursor},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        page = Page[NotificationInstanceSchema].model_validate(response.json())
+        assert page.meta.has_prev is True
+        seen.extend(item.text for item in page.data)
+
+    assert seen == ["n4", "n3", "n2", "n1", "n0"]
+    assert page.meta.has_next is False
+    assert page.meta.total_items == 5
+
+
+@pytest.mark.asyncio
+async def test_notification_counter_tracks_writes(client: AsyncClient, register):
+    uid, auth_headers = await register()
+
+    for _ in range(3):
+        response = await client.post(
+            "/notifications/", json={"type": "like"}, headers=auth_headers
+        )
+        assert response.status_code == 201
+    assert await count_notifications(uid) == 3
+
+    response = await client.get(
+        "/notifications/",
+        params={"limit": 2, "approximate_total": True},
+        headers=auth_headers,
+    )
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert page.meta.has_next is True
+    assert page.meta.total_items == 3
+
+    response = await client.delete(
+        f"/notifications/{page.data[0].id}", headers=auth_headers
+    )
+    assert response.status_code == 204
+    assert await count_notifications(uid) == 2
+
+    await NotificationCounter.filter(user_id=uid).update(total=42)
+    assert await reconcile_notification_counters() >= 1
+    assert await count_notifications(uid) == 2
+
+
+@pytest.mark.asyncio
+async def test_notifications_bulk_create(client: AsyncClient, register, monkeypatch):
+    monkeypatch.setattr(
+        notification_dependencies, "NOTIFICATIONS_SERVICE_TOKEN", "service-secret"
+    )
+    first_uid, first_headers = await register()
+    second_uid, second_headers = await register()
+
+    # cache the empty feed so the batch has to invalidate it
+    response = await client.get("/notifications/", headers=first_headers)
+    assert response.json()["meta"]["total_items"] == 0
+
+    response = await client.post(
+        "/notifications/bulk",
+        json={
+            "items": [
+                {"user_id": first_uid, "type": "like"},
+                {"user_id": second_uid, "type": "comment", "text": "hi"},
+                {"user_id": 10**9, "type": "like"},
+                {"user_id": first_uid, "type": "repost"},
+            ]
+        },
+        headers={"X-Service-Token": "service-secret"},
+    )
+    assert response.status_code == 201
+    result = response.json()
+    assert result["created"] == 3
+    assert result["failed"] == 1
+    assert [item["created"] for item in result["results"]] == [
+        True,
+        True,
+        False,
+        True,
+    ]
+    assert result["results"][2]["error"] == "user_not_found"
+
+    response = await client.get("/notifications/", headers=first_headers)
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert sorted(item.type for item in page.data) == ["like", "repost"]
+    assert page.meta.total_items == 2
+    assert await count_notifications(first_uid) == 2
+    assert await count_notifications(second_uid) == 1
+
+    response = await client.get("/notifications/", headers=second_headers)
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert [item.text for item in page.data] == ["hi"]
+
+
+@pytest.mark.asyncio
+async def test_notifications_unread_and_mark_read(
+    client: AsyncClient, register, fake_redis
+):
+    uid, auth_headers = await register()
+
+    for i in range(4):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like", "text": f"n{i}"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 201
+
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 4}
+    # seeded once, then served from the maintained counter
+    fake_redis.calls = 0
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 4}
+    assert fake_redis.calls == 1
+
+    response = await client.get(
+        "/notifications/", params={"limit": 2}, headers=auth_headers
+    )
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert [item.is_read for item in page.data] == [False, False]
+
+    # everything up to the second newest row, i.e. n2, n1 and n0
+    response = await client.post(
+        "/notifications/mark-read",
+        json={"cursor": page.meta.next_cursor},
+        headers=auth_headers,
+    )
+    assert response.json() == {"updated": 3}
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 1}
+
+    response = await client.get("/notifications/", headers=auth_headers)
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert [item.is_read for item in page.data] == [False, True, True, True]
+
+    response = await client.delete(
+        f"/notifications/{page.data[0].id}", headers=auth_headers
+    )
+    assert response.status_code == 204
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 0}
+
+    response = await client.post(
+        "/notifications/", json={"type": "like"}, headers=auth_headers
+    )
+    response = await client.post(
+        "/notifications/mark-read", json={}, headers=auth_headers
+    )
+    assert response.json() == {"updated": 1}
+    assert await count_unread_notifications(uid) == 0
+
+    await NotificationCounter.filter(user_id=uid).update(unread=7)
+    assert await reconcile_notification_counters() >= 1
+    assert await count_unread_notifications(uid) == 0
+
+
+@pytest.mark.asyncio
+async def test_grouped_notifications_are_aggregated(
+    client: AsyncClient, register, monkeypatch
+):
+    monkeypatch.setattr(
+        notification_dependencies, "NOTIFICATIONS_SERVICE_TOKEN", "service-secret"
+    )
+    uid, auth_headers = await register()
+
+    for text in ("alice", "bob"):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like", "text": text, "group_key": "post:1"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 201
+    response = await client.post(
+        "/notifications/", json={"type": "comment", "text": "hi"}, headers=auth_headers
+    )
+    assert response.status_code == 201
+    response = await client.post(
+        "/notifications/mark-read", json={}, headers=auth_headers
+    )
+    assert response.json() == {"updated": 2}
+
+    response = await client.post(
+        "/notifications/bulk",
+        json={
+            "items": [
+                {
+                    "user_id": uid,
+                    "type": "like",
+                    "text": t,
+                    "group_key": "post:1",
+                    "actor_id": uid,
+                }
+                for t in ("carol", "dave", "erin")
+            ]
+            + [
+                {"user_id": uid, "type": "like", "group_key": "post:2"},
+                {"user_id": uid, "type": "like", "actor_id": 10**9},
+            ]
+        },
+        headers={"X-Service-Token": "service-secret"},
+    )
+    result = response.json()
+    assert (result["created"], result["failed"]) == (4, 1)
+    assert result["results"][-1]["error"] == "actor_not_found"
+
+    response = await client.get("/notifications/", headers=auth_headers)
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert {(item.group_key, item.count, item.is_read) for item in page.data} == {
+        ("post:1", 5, False),
+        ("post:2", 1, False),
+        (None, 1, True),
+    }
+    aggregate = next(item for item in page.data if item.group_key == "post:1")
+    assert aggregate.actor is not None and aggregate.actor.id == uid
+    assert {item.user.username for item in page.data} == {aggregate.actor.username}
+    # the aggregate that took new rows moved above the older comment
+    assert page.data[-1].group_key is None
+    assert next(item.text for item in page.data if item.group_key == "post:1") == (
+        "erin"
+    )
+    assert page.meta.total_items == 3
+    assert await count_notifications(uid) == 3
+    assert await count_unread_notifications(uid) == 2
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 2}
+
+
+@pytest.mark.asyncio
+async def test_group_key_kept_without_grouping(
+    client: AsyncClient, register, monkeypatch
+):
+    monkeypatch.setattr(notification_services, "NOTIFICATIONS_GROUP_WINDOW", 0)
+    uid, headers = await register()
+    for _ in range(2):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like", "group_key": "post:1"},
+            headers=headers,
+        )
+        assert response.status_code == 201
+    rows = await Notification.filter(user_id=uid).values_list("group_key", "count")
+    assert rows == [("post:1", 1), ("post:1", 1)]
+
+
+@pytest.mark.asyncio
+async def test_prune_notifications(client: AsyncClient, register):
+    uid, auth_headers = await register()
+
+    for i in range(5):
+        response = await client.post(
+            "/notifications/",
+            json={"type": "like", "text": f"n{i}"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 201
+    response = await client.get("/notifications/", headers=auth_headers)
+    assert response.json()["meta"]["total_items"] == 5
+
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    await Notification.filter(user_id=uid, text="n0").update(created_at=old)
+    assert await NotificationService.prune_notifications(30, 3) >= 1
+
+    response = await client.get("/notifications/", headers=auth_headers)
+    page = Page[NotificationInstanceSchema].model_validate(response.json())
+    assert [item.text for item in page.data] == ["n4", "n3", "n2"]
+    assert page.meta.total_items == 3
+    assert await count_notifications(uid) == 3
+    response = await client.get("/notifications/unread-count", headers=auth_headers)
+    assert response.json() == {"unread": 3}
+    assert await count_unread_notifications(uid) == 3
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from base import pubsub
+
+
+class FlakyRedis:
+    """Hands out the fake's pub/sub, failing the first subscription."""
+
+    def __init__(self, redis) -> None:
+        self.redis = redis
+        self.failures = 1
+
+    def pubsub(self):
+        connection = self.redis.pubsub()
+        if self.failures:
+            self.failures -= 1
+
+            async def subscribe(*channels: str) -> None:
+                raise ConnectionError("connection refused")
+
+            connection.subscribe = subscribe
+        return connection
+
+
+@pytest.mark.asyncio
+async def test_listen_reconnects_and_resyncs(fake_redis):
+    messages = []
+    syncs = []
+
+    async def on_subscribe() -> None:
+        syncs.append(asyncio.get_running_loop().time())
+
+    listener = asyncio.create_task(
+        pubsub.listen(
+            FlakyRedis(fake_redis),
+            "Test",
+            lambda message: messages.append(message["data"]),
+            on_subscribe,
+            channels=["test:channel"],
+            resync_interval=0.05,
+            reconnect_delay=0.01,
+        )
+    )
+    try:
+        for _ in range(100):
+            if syncs:
+                break
+            await asyncio.sleep(0.01)
+        await fake_redis.publish("test:channel", "hello")
+        await fake_redis.publish("test:other", "ignored")
+        await asyncio.sleep(0.12)
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    assert messages == ["hello"]
+    # once after subscribing, then on every interval
+    assert len(syncs) >= 2
+    assert not fake_redis._pubsubs
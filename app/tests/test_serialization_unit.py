@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import Request
+from pydantic import BaseModel, ValidationError, field_validator
+
+from base import serialization
+from base.error_handlers import pydantic_validation_exception_handler
+
+
+@pytest.mark.parametrize("library", sorted(serialization.dumpers))
+def test_dumps_roundtrip(library):
+    created_at = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+    data = {"id": 1, "text": "héllo", "created_at": created_at, "tags": None}
+
+    encoded = serialization.dumpers[library](data)
+
+    assert b" " not in encoded
+    decoded = serialization.loaders[library](encoded)
+    assert datetime.fromisoformat(decoded["created_at"]) == created_at
+    assert decoded["text"] == "héllo"
+
+
+class Model(BaseModel):
+    value: int
+
+    @field_validator("value")
+    @classmethod
+    def positive(cls, value: int) -> int:
+        if value < 0:
+            raise ValueError("must be positive")
+        return value
+
+
+@pytest.mark.asyncio
+async def test_validation_error_with_exception_context_renders():
+    with pytest.raises(ValidationError) as exc_info:
+        Model(value=-1)
+    request = Request({"type": "http", "headers": [], "state": {}})
+
+    response = await pydantic_validation_exception_handler(request, exc_info.value)
+
+    assert response.status_code == 422
+    (detail,) = json.loads(response.body)["error"]["details"]
+    assert detail["ctx"]["error"] == "must be positive"
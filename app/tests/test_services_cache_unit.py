@@ -1,44 +1,326 @@
-from datetime import datetime, timezone
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
 
 import pytest
 
 from base.enums import NotificationType
-from notification.schemas import GetNotificationsSchema
+from notification import services as notification_services
+from notification.schemas import CreateNotificationSchema, GetNotificationsSchema
 from notification.services import NotificationService
 from user.schemas import NotificationInstanceSchema
+from user.services import UserService
+
+
+@pytest.fixture(autouse=True)
+def user_status(monkeypatch):
+    # feed items carry their owner's metadata, looked up once per page
+    async def fake_get_user_status(uid: int):
+        return {
+            "id": uid,
+            "username": f"user_{uid}",
+            "avatar_url": None,
+            "blocked": False,
+        }
+
+    monkeypatch.setattr(UserService, "_get_user_status", fake_get_user_status)
+
+
+def _row(notification_id: int, text: str) -> dict:
+    return {
+        "id": notification_id,
+        "type": NotificationType.LIKE,
+        "text": text,
+        "actor_id": None,
+        "actor_username": None,
+        "actor_avatar_url": None,
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "is_read": False,
+        "group_key": None,
+        "count": 1,
+    }
 
 
 @pytest.mark.asyncio
-async def test_get_notifications_uses_cache(monkeypatch, fake_redis):
+async def test_get_notifications_uses_cache(monkeypatch, fake_redis, local_caches):
     calls = {"count": 0}
 
-    async def fake_fetch_notifications(uid: int, offset: int, limit: int):
+    async def fake_fetch_notifications(uid: int, offset: int, limit: int, after=None):
         calls["count"] += 1
-        return (
-            [
-                {
-                    "id": 1,
-                    "type": NotificationType.LIKE,
-                    "text": "Hello",
-                    "user__username": "user_1",
-                    "user__avatar_url": None,
-                    "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
-                }
-            ],
-            1,
-        )
+        return [_row(1, "Hello")]
+
+    async def fake_count_notifications(uid: int):
+        return 1
 
     monkeypatch.setattr(
         NotificationService, "_fetch_notifications", fake_fetch_notifications
     )
+    monkeypatch.setattr(
+        NotificationService, "_count_notifications", fake_count_notifications
+    )
 
     params = GetNotificationsSchema(offset=0, limit=20)
     data_first, meta_first = await NotificationService.get_notifications(1, params)
+    fake_redis.calls = 0
+    await NotificationService.get_notifications(1, params)
+    assert fake_redis.calls == 0
+
+    local_caches["notifications"].clear()
     data_second, meta_second = await NotificationService.get_notifications(1, params)
 
     assert calls["count"] == 1
+    assert fake_redis.calls == 1
     assert meta_first.total_items == 1
     assert meta_first.total_pages == 1
     assert meta_second.total_items == 1
     assert isinstance(data_first[0], NotificationInstanceSchema)
     assert data_first[0].id == data_second[0].id
+
+
+@pytest.mark.asyncio
+async def test_bump_invalidates_cached_pages(monkeypatch, fake_redis):
+    calls = {"count": 0}
+
+    async def fake_fetch_notifications(uid: int, offset: int, limit: int, after=None):
+        calls["count"] += 1
+        return []
+
+    async def fake_count_notifications(uid: int):
+        return 0
+
+    monkeypatch.setattr(
+        NotificationService, "_fetch_notifications", fake_fetch_notifications
+    )
+    monkeypatch.setattr(
+        NotificationService, "_count_notifications", fake_count_notifications
+    )
+
+    params = GetNotificationsSchema(offset=0, limit=20)
+    await NotificationService.get_notifications(1, params)
+    fake_redis.calls = 0
+    await NotificationService._bump_notifications_cache(1)
+    assert fake_redis.calls == 1
+
+    await NotificationService.get_notifications(1, params)
+    await NotificationService.get_notifications(1, params)
+    assert calls["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced(monkeypatch, fake_redis):
+    calls = {"count": 0}
+
+    async def slow_fetch_notifications(uid: int, offset: int, limit: int, after=None):
+        calls["count"] += 1
+        await asyncio.sleep(0.01)
+        return [_row(1, "Hello")]
+
+    async def fake_count_notifications(uid: int):
+        return 1
+
+    monkeypatch.setattr(
+        NotificationService, "_fetch_notifications", slow_fetch_notifications
+    )
+    monkeypatch.setattr(
+        NotificationService, "_count_notifications", fake_count_notifications
+    )
+
+    params = GetNotificationsSchema(offset=0, limit=20)
+    pages = await asyncio.gather(
+        *(NotificationService.get_notifications(1, params) for _ in range(10))
+    )
+
+    assert calls["count"] == 1
+    assert all(data[0].id == 1 for data, _ in pages)
+
+
+@pytest.mark.asyncio
+async def test_stale_page_served_while_rebuild_locked(monkeypatch, fake_redis):
+    rows = [_row(1, "old")]
+
+    async def fake_fetch_notifications(uid: int, offset: int, limit: int, after=None):
+        return list(rows)
+
+    async def fake_count_notifications(uid: int):
+        return len(rows)
+
+    monkeypatch.setattr(
+        NotificationService, "_fetch_notifications", fake_fetch_notifications
+    )
+    monkeypatch.setattr(
+        NotificationService, "_count_notifications", fake_count_notifications
+    )
+    monkeypatch.setattr(
+        notification_services, "NOTIFICATIONS_CACHE_STALE_WHILE_REVALIDATE", True
+    )
+
+    params = GetNotificationsSchema(offset=0, limit=20)
+    await NotificationService.get_notifications(1, params)
+    rows.insert(0, _row(2, "new"))
+    await NotificationService._bump_notifications_cache(1)
+
+    # another worker holds the rebuild lock
+    await fake_redis.set("notifications:lock:1:window", "1", nx=True)
+    data, meta = await NotificationService.get_notifications(1, params)
+    assert [item.text for item in data] == ["old"]
+
+    await fake_redis.delete("notifications:lock:1:window")
+    data, meta = await NotificationService.get_notifications(1, params)
+    assert [item.text for item in data] == ["new", "old"]
+    assert meta.total_items == 2
+
+
+@pytest.mark.asyncio
+async def test_window_serves_any_offset_and_limit(monkeypatch, fake_redis):
+    rows = [_row(i, f"n{i}") for i in range(30, 0, -1)]
+    calls = []
+
+    async def fake_fetch_notifications(uid: int, offset: int, limit: int, after=None):
+        calls.append((offset, limit))
+        return rows[offset : offset + limit]
+
+    async def fake_count_notifications(uid: int):
+        return len(rows)
+
+    monkeypatch.setattr(
+        NotificationService, "_fetch_notifications", fake_fetch_notifications
+    )
+    monkeypatch.setattr(
+        NotificationService, "_count_notifications", fake_count_notifications
+    )
+    monkeypatch.setattr(notification_services, "NOTIFICATIONS_CACHE_WINDOW", 10)
+
+    data, meta = await NotificationService.get_notifications(
+        1, GetNotificationsSchema(offset=0, limit=5)
+    )
+    assert [item.id for item in data] == [30, 29, 28, 27, 26]
+    data, meta = await NotificationService.get_notifications(
+        1, GetNotificationsSchema(offset=4, limit=6)
+    )
+    assert [item.id for item in data] == [26, 25, 24, 23, 22, 21]
+    assert meta.total_items == 30
+    assert meta.has_next is True
+    assert meta.has_prev is True
+    assert calls == [(0, 11)]
+
+    data, meta = await NotificationService.get_notifications(
+        1, GetNotificationsSchema(offset=8, limit=5)
+    )
+    assert [item.id for item in data] == [22, 21, 20, 19, 18]
+    assert calls == [(0, 11), (8, 6)]
+
+
+@pytest.mark.asyncio
+async def test_writes_update_cached_window_in_place(monkeypatch, fake_redis):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = [dict(_row(i, f"n{i}"), created_at=base + timedelta(i)) for i in (2, 1)]
+    calls = {"fetch": 0}
+
+    async def fake_fetch_notifications(uid: int, offset: int, limit: int, after=None):
+        calls["fetch"] += 1
+        return rows[offset : offset + limit]
+
+    async def fake_create_notification(
+        uid, type_, text, idempotency_key=None, group_key=None
+    ):
+        return SimpleNamespace(
+            id=3,
+            type=type_,
+            text=text,
+            created_at=base + timedelta(3),
+            is_read=False,
+            group_key=group_key,
+            count=1,
+            actor_id=None,
+            actor_username=None,
+            actor_avatar_url=None,
+        )
+
+    async def fake_get_notification_by_user(uid: int, notification_id: int):
+        return SimpleNamespace(id=notification_id, user_id=uid)
+
+    async def fake_delete_notification(notification):
+        return 1
+
+    monkeypatch.setattr(
+        NotificationService, "_fetch_notifications", fake_fetch_notifications
+    )
+    monkeypatch.setattr(
+        NotificationService, "_create_notification", fake_create_notification
+    )
+    monkeypatch.setattr(
+        NotificationService, "_get_notification_by_user", fake_get_notification_by_user
+    )
+    monkeypatch.setattr(
+        NotificationService, "_delete_notification", fake_delete_notification
+    )
+
+    params = GetNotificationsSchema(offset=0, limit=20)
+    await NotificationService.get_notifications(1, params)
+    # a page outside the window, cached under the version before the write
+    cache = notification_services.notification_cache
+    version, _, _ = await cache.get_page(1, "page:c:old:20")
+    await cache.set_page(1, "page:c:old:20", version, b"[]")
+    user = SimpleNamespace(id=1, username="user_1", avatar_url=None)
+    await NotificationService.create_notification(
+        user, CreateNotificationSchema(type=NotificationType.LIKE, text="n3")
+    )
+    # updated in place, without keeping pages that can't be served stale
+    assert not [f for f in fake_redis._store["notifications:1"] if f[:5] == "page:"]
+    data, meta = await NotificationService.get_notifications(1, params)
+    assert [item.id for item in data] == [3, 2, 1]
+    assert meta.total_items == 3
+
+    await NotificationService.delete_notification(1, 2)
+    data, meta = await NotificationService.get_notifications(1, params)
+    assert [item.id for item in data] == [3, 1]
+    assert meta.total_items == 2
+    assert calls["fetch"] == 1
+
+    # a write older than the window head can't be prepended in place
+    async def late_create_notification(
+        uid, type_, text, idempotency_key=None, group_key=None
+    ):
+        return SimpleNamespace(
+            id=4,
+            type=type_,
+            text=text,
+            created_at=base,
+            is_read=False,
+            group_key=group_key,
+            count=1,
+            actor_id=None,
+            actor_username=None,
+            actor_avatar_url=None,
+        )
+
+    monkeypatch.setattr(
+        NotificationService, "_create_notification", late_create_notification
+    )
+    await NotificationService.create_notification(
+        user, CreateNotificationSchema(type=NotificationType.LIKE, text="n4")
+    )
+    await NotificationService.get_notifications(1, params)
+    assert calls["fetch"] == 2
+
+
+@pytest.mark.asyncio
+async def test_unread_seed_racing_a_write_is_dropped(monkeypatch, fake_redis):
+    counts = [2, 3, 3]
+
+    async def count_unread_notifications(uid):
+        count = counts.pop(0)
+        if count == 2:
+            # a write commits and updates the cache while this count is
+            # in flight
+            await notification_services.notification_cache.change_unread({uid: 1})
+        return count
+
+    monkeypatch.setattr(
+        NotificationService, "_count_unread_notifications", count_unread_notifications
+    )
+    assert (await NotificationService.get_unread_count(1)).unread == 2
+    # the stale count wasn't stored, the next read counts again and seeds
+    assert (await NotificationService.get_unread_count(1)).unread == 3
+    assert (await NotificationService.get_unread_count(1)).unread == 3
+    assert counts == [3]
@@ -57,3 +57,88 @@ async def test_register_user_creates(monkeypatch):
 
     assert user.username == body.username
     assert captured["password"] != body.password
+
+
+@pytest.mark.asyncio
+async def test_user_status_is_cached(monkeypatch, fake_redis, local_caches):
+    queries = []
+
+    async def fake_get_user_status(uid: int):
+        queries.append(uid)
+        if uid == 1:
+            return {"id": 1, "username": "user_1", "avatar_url": None, "blocked": False}
+        return None
+
+    monkeypatch.setattr(UserService, "_get_user_status", fake_get_user_status)
+
+    status = await UserService.get_user_status(1)
+    assert status.username == "user_1" and status.blocked is False
+    assert await UserService.get_user_status(2) is None
+    assert await UserService.get_user_status(1) == status
+    assert await UserService.get_user_status(2) is None
+    assert queries == [1, 2]
+
+    # other workers only have Redis, which caches the missing user too
+    local_caches["users"].clear()
+    assert await UserService.get_user_status(2) is None
+    assert queries == [1, 2]
+
+    await UserService.invalidate_user(1)
+    await UserService.get_user_status(1)
+    assert queries == [1, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_user_statuses_are_read_in_batches(monkeypatch, fake_redis, local_caches):
+    queries = []
+
+    async def fake_get_user_statuses(uids):
+        queries.append(sorted(uids))
+        return [
+            {"id": uid, "username": f"user_{uid}", "avatar_url": None, "blocked": False}
+            for uid in uids
+            if uid < 100
+        ]
+
+    monkeypatch.setattr(UserService, "_get_user_statuses", fake_get_user_statuses)
+
+    statuses = await UserService.get_user_statuses(range(1, 6))
+    assert queries == [[1, 2, 3, 4, 5]]
+    assert statuses[3].username == "user_3"
+    # one MGET and one pipelined write, not a round trip per user
+    assert fake_redis.calls == 2
+
+    local_caches["users"].clear()
+    fake_redis.calls = 0
+    statuses = await UserService.get_user_statuses([4, 5, 6, 100])
+    assert queries == [[1, 2, 3, 4, 5], [6, 100]]
+    assert statuses[4].username == "user_4" and statuses[100] is None
+    assert fake_redis.calls == 2
+    assert await UserService.get_user_status(100) is None
+    assert await UserService.get_user_statuses([4, 100]) == {
+        4: statuses[4],
+        100: None,
+    }
+    assert fake_redis.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_verified_tokens_are_cached_until_invalidated(monkeypatch, fake_redis):
+    decoded = []
+    decode_jwt = UserService.decode_jwt
+
+    def counting_decode_jwt(token: str):
+        decoded.append(token)
+        return decode_jwt(token)
+
+    monkeypatch.setattr(UserService, "decode_jwt", staticmethod(counting_decode_jwt))
+    token = UserService.create_jwt_token(7, "access_token")
+
+    for _ in range(3):
+        assert UserService.decode_jwt_cached(token)["pk"] == 7
+    assert len(decoded) == 1
+    assert UserService.decode_jwt_cached(token + "x") is None
+
+    await UserService.invalidate_user(7)
+    assert UserService.decode_jwt_cached(token)["pk"] == 7
+    assert len(decoded) == 3
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from notification import services as notification_services
+from notification import stream as notification_stream
+from notification.cursor import decode_cursor
+from notification.schemas import CreateNotificationsBulkSchema
+from notification.services import NotificationService
+
+
+@pytest.fixture()
+async def event_listener():
+    task = asyncio.create_task(notification_stream.listen_for_events())
+    await asyncio.sleep(0)
+    yield
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def _post(client: AsyncClient, headers: dict, text: str) -> None:
+    response = await client.post(
+        "/notifications/", json={"type": "like", "text": text}, headers=headers
+    )
+    assert response.status_code == 201
+
+
+async def _next_event(events) -> tuple:
+    raw = await asyncio.wait_for(events.__anext__(), 1)
+    fields = dict(line.split(": ", 1) for line in raw.decode().strip().split("\n"))
+    return fields["id"], json.loads(fields["data"])
+
+
+@pytest.mark.asyncio
+async def test_stream_delivers_and_resumes(
+    client: AsyncClient, register, event_listener
+):
+    uid, headers = await register()
+    await _post(client, headers, "before")
+
+    events = await NotificationService.open_stream(uid)
+    try:
+        await _post(client, headers, "live")
+        event_id, data = await _next_event(events)
+        assert data["text"] == "live"
+        assert decode_cursor(event_id)[1] == data["id"]
+
+        # rows written in bulk arrive through a catch-up query
+        await NotificationService.create_notifications_bulk(
+            CreateNotificationsBulkSchema.model_validate(
+                {"items": [{"user_id": uid, "type": "comment", "text": "bulk"}]}
+            )
+        )
+        _, data = await _next_event(events)
+        assert data["text"] == "bulk"
+    finally:
+        await events.aclose()
+    assert notification_stream.hub.connections == 0
+
+    # a response that never started its body holds no subscription
+    events = await NotificationService.open_stream(uid)
+    await events.aclose()
+    assert notification_stream.hub.connections == 0
+
+    # a client that saw "live" gets what it missed on reconnect
+    events = await NotificationService.open_stream(uid, last_event_id=event_id)
+    try:
+        _, data = await _next_event(events)
+        assert data["text"] == "bulk"
+    finally:
+        await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_overflow_and_heartbeat(
+    client: AsyncClient, register, event_listener, monkeypatch
+):
+    monkeypatch.setattr(notification_services, "NOTIFICATIONS_STREAM_BUFFER", 1)
+    monkeypatch.setattr(notification_services, "NOTIFICATIONS_STREAM_HEARTBEAT", 0.05)
+    uid, headers = await register()
+
+    events = await NotificationService.open_stream(uid)
+    try:
+        await _post(client, headers, "n0")
+        assert (await _next_event(events))[1]["text"] == "n0"
+        for i in range(1, 4):
+            await _post(client, headers, f"n{i}")
+        # the buffer held one event, the rest comes from the database once
+        texts = [(await _next_event(events))[1]["text"] for _ in range(3)]
+        assert texts == ["n1", "n2", "n3"]
+        assert notification_stream.hub.overflows >= 1
+
+        assert await asyncio.wait_for(events.__anext__(), 1) == b": ping\n\n"
+    finally:
+        await events.aclose()
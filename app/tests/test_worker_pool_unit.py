@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from base.exceptions import ServiceUnavailableError
+from base.workers import WorkerPool
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_off_the_event_loop():
+    pool = WorkerPool("test_offload", size=2, max_queue=4, queue_timeout=1)
+    loop_thread = threading.get_ident()
+    assert await pool.run(threading.get_ident) != loop_thread
+    assert pool.stats()["completed"] == 1
+    assert pool.stats()["busy"] == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_rejects_when_saturated():
+    pool = WorkerPool("test_saturated", size=1, max_queue=1, queue_timeout=0.05)
+    release = threading.Event()
+    running = asyncio.ensure_future(pool.run(release.wait))
+    await asyncio.sleep(0.01)
+    assert pool.stats()["saturation"] == 1
+
+    # one caller may queue, but times out waiting for the busy slot
+    with pytest.raises(ServiceUnavailableError):
+        await pool.run(lambda: None)
+
+    queued = asyncio.ensure_future(pool.run(lambda: "done"))
+    await asyncio.sleep(0)
+    # the queue is full, so this one is turned away at once
+    with pytest.raises(ServiceUnavailableError):
+        await pool.run(lambda: None)
+
+    release.set()
+    assert await running is True
+    assert await queued == "done"
+    stats = pool.stats()
+    assert stats["rejected"] == 2
+    assert stats["completed"] == 2
+    assert stats["waiting"] == 0
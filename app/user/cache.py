@@ -0,0 +1,81 @@
+"""Redis cache of the few user fields that authenticated writes need.
+
+One key per user, ``users:status:{uid}``, holding the JSON
+``[username, avatar_url, blocked]`` or ``-`` for a user that doesn't exist.
+Missing users are cached for a shorter time, so probing unknown ids can't
+turn into a query per request.
+"""
+
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from base.serialization import dumps, loads
+from base.settings import cache_redis
+
+USER_STATUS_TTL = 5 * 60
+USER_MISSING_TTL = 60
+MISSING = b"-"
+
+
+class UserStatus(NamedTuple):
+    id: int
+    username: str
+    avatar_url: Optional[str]
+    blocked: bool
+
+
+def _status_key(uid: int) -> str:
+    return f"users:status:{uid}"
+
+
+def _decode(uid: int, entry: bytes) -> Optional[UserStatus]:
+    if entry == MISSING:
+        return None
+    username, avatar_url, blocked = loads(entry)
+    return UserStatus(uid, username, avatar_url, blocked)
+
+
+def _encode(status: Optional[UserStatus]) -> Tuple[bytes, int]:
+    if status is None:
+        return MISSING, USER_MISSING_TTL
+    entry = dumps([status.username, status.avatar_url, status.blocked])
+    return entry, USER_STATUS_TTL
+
+
+async def get_status(uid: int) -> Tuple[bool, Optional[UserStatus]]:
+    """Return whether the user was cached and, if they exist, their status."""
+    entry = await cache_redis.get(_status_key(uid))
+    if entry is None:
+        return False, None
+    return True, _decode(uid, entry)
+
+
+async def get_statuses(uids: Iterable[int]) -> Dict[int, Optional[UserStatus]]:
+    """Cached statuses of the users in one MGET; uncached users are left out."""
+    uids = list(uids)
+    if not uids:
+        return {}
+    entries = await cache_redis.mget([_status_key(uid) for uid in uids])
+    return {
+        uid: _decode(uid, entry)
+        for uid, entry in zip(uids, entries)
+        if entry is not None
+    }
+
+
+async def set_status(uid: int, status: Optional[UserStatus]) -> None:
+    entry, ttl = _encode(status)
+    await cache_redis.set(_status_key(uid), entry, ex=ttl)
+
+
+async def set_statuses(statuses: Dict[int, Optional[UserStatus]]) -> None:
+    if not statuses:
+        return
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        for uid, status in statuses.items():
+            entry, ttl = _encode(status)
+            pipe.set(_status_key(uid), entry, ex=ttl)
+        await pipe.execute()
+
+
+async def delete_status(uid: int) -> None:
+    await cache_redis.delete(_status_key(uid))
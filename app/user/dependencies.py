@@ -1,29 +1,33 @@
 from fastapi import Request, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from base.exceptions import UnauthorizedError
+from base.exceptions import ForbiddenError, UnauthorizedError
+from user.cache import UserStatus
 from user.services import UserService
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
-async def get_user(
+async def get_uid(
     request: Request,
     credentials: HTTPAuthorizationCredentials | None = Security(bearer_scheme),
 ):
     if credentials is None:
         raise UnauthorizedError(code="auth_required", message="Authorization required")
-    uid = UserService.get_uid_or_raise(request)
-    user = await UserService.get_user_by_id(uid)
-    if not user:
-        raise UnauthorizedError(code="auth_invalid", message="Invalid user")
-    return user
+    return UserService.get_uid_or_raise(request)
 
 
-async def get_uid(
+async def get_active_user(
     request: Request,
     credentials: HTTPAuthorizationCredentials | None = Security(bearer_scheme),
-):
+) -> UserStatus:
+    """Authenticate without loading the user row: the cached status is enough."""
     if credentials is None:
         raise UnauthorizedError(code="auth_required", message="Authorization required")
-    return UserService.get_uid_or_raise(request)
+    uid = UserService.get_uid_or_raise(request)
+    status = await UserService.get_user_status(uid)
+    if status is None:
+        raise UnauthorizedError(code="auth_invalid", message="Invalid user")
+    if status.blocked:
+        raise ForbiddenError(code="user_blocked", message="User is blocked")
+    return status
@@ -7,4 +7,5 @@ class User(BaseModel):
     username: str = fields.CharField(max_length=32, unique=True)
     avatar_url: str = fields.TextField(null=True)
     password: str = fields.CharField(max_length=255)
-    blocked: bool = fields.BooleanField(default=False)
+    # indexed for the blocked user list every worker reloads
+    blocked: bool = fields.BooleanField(default=False, db_index=True)
@@ -0,0 +1,99 @@
+"""Revoked tokens and blocked users, checked on every authenticated request.
+
+Revoked token ids live in Redis, in the ``auth:revoked`` sorted set scored
+by their ``exp`` so entries can be pruned once the token would have expired
+anyway. Blocked users are the ``User.blocked`` column, so a user blocked by
+any means is cut off and a Redis flush unblocks nobody.
+
+Each worker mirrors both in memory and checks the mirror, so enforcement
+costs two hash lookups and no round trip. Changes are published on
+``auth:revocations``; the mirror is reloaded in full on (re)subscribe and
+every ``resync_interval`` seconds in case a message was missed.
+"""
+
+import time
+from typing import Dict, Set
+
+from base import pubsub
+from base.settings import redis
+from user.models import User
+
+REVOKED_KEY = "auth:revoked"
+REVOCATION_CHANNEL = "auth:revocations"
+
+
+class RevocationList:
+    def __init__(self) -> None:
+        self.revoked: Dict[str, float] = {}
+        self.blocked: Set[int] = set()
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload["pk"] in self.blocked:
+            return True
+        jti = payload.get("jti")
+        return jti is not None and jti in self.revoked
+
+    def apply(self, message: str) -> None:
+        action, _, value = message.partition(":")
+        if action == "revoke":
+            jti, _, exp = value.partition(":")
+            self.revoked[jti] = float(exp)
+        elif action == "block":
+            self.blocked.add(int(value))
+        elif action == "unblock":
+            self.blocked.discard(int(value))
+
+    def replace(self, revoked: Dict[str, float], blocked: Set[int]) -> None:
+        self.revoked = revoked
+        self.blocked = blocked
+
+    def prune(self) -> None:
+        now = time.time()
+        self.revoked = {jti: exp for jti, exp in self.revoked.items() if exp > now}
+
+
+revocations = RevocationList()
+
+
+async def sync() -> None:
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zremrangebyscore(REVOKED_KEY, "-inf", now)
+        pipe.zrangebyscore(REVOKED_KEY, now, "+inf", withscores=True)
+        _, revoked = await pipe.execute()
+    blocked = await User.filter(blocked=True).values_list("id", flat=True)
+    revocations.replace(dict(revoked), set(blocked))
+
+
+async def _publish(message: str) -> None:
+    revocations.apply(message)
+    await redis.publish(REVOCATION_CHANNEL, message)
+
+
+async def revoke_token(jti: str, exp: float) -> None:
+    await redis.zadd(REVOKED_KEY, {jti: exp})
+    await _publish(f"revoke:{jti}:{exp}")
+
+
+async def block_user(uid: int) -> None:
+    """Tell every worker now; ``User.blocked`` must already be set."""
+    await _publish(f"block:{uid}")
+
+
+async def unblock_user(uid: int) -> None:
+    await _publish(f"unblock:{uid}")
+
+
+async def listen_for_revocations(
+    resync_interval: float = 60.0, reconnect_delay: float = 1.0
+) -> None:
+    """Keep the local mirror in step with revocations made by any worker."""
+    await pubsub.listen(
+        redis,
+        "Revocation",
+        lambda message: revocations.apply(message["data"]),
+        sync,
+        channels=[REVOCATION_CHANNEL],
+        resync_interval=resync_interval,
+        reconnect_delay=reconnect_delay,
+    )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Security, status
+from fastapi import APIRouter, Request, Response, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from base.exceptions import UnauthorizedError
@@ -6,6 +6,7 @@ from user.schemas import (
     AccessTokenResponse,
     CreateUserSchemaSchema,
     LoginUserSchema,
+    LogoutSchema,
     RegisterResponse,
     TokenPair,
 )
@@ -42,3 +43,15 @@ async def refresh(
         raise UnauthorizedError(code="auth_required", message="Authorization required")
     new_access_token = await UserService.refresh_access_token(request)
     return {"access_token": new_access_token}
+
+
+@auth_router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    request: Request,
+    body: LogoutSchema,
+    credentials: HTTPAuthorizationCredentials | None = Security(bearer_scheme),
+):
+    if credentials is None:
+        raise UnauthorizedError(code="auth_required", message="Authorization required")
+    await UserService.logout(request, body)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -11,12 +11,22 @@ class UserMetaSchema(BaseModel):
     avatar_url: Optional[str] = None
 
 
+class ActorSchema(UserMetaSchema):
+    id: int
+
+
 class NotificationInstanceSchema(BaseModel):
     id: int
     type: NotificationType
     text: Optional[str] = None
     created_at: datetime
     user: UserMetaSchema
+    is_read: bool = False
+    group_key: Optional[str] = None
+    # how many notifications an aggregate stands for
+    count: int = 1
+    # who caused it; the latest one for an aggregate
+    actor: Optional[ActorSchema] = None
 
 
 class CreateUserSchemaSchema(BaseModel):
@@ -30,6 +40,10 @@ class LoginUserSchema(BaseModel):
     password: str = Field(..., max_length=32, min_length=8)
 
 
+class LogoutSchema(BaseModel):
+    refresh_token: Optional[str] = None
+
+
 class TokenPair(BaseModel):
     access_token: str
     refresh_token: str
@@ -1,11 +1,15 @@
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Literal
+from typing import Dict, Iterable, Literal
+from uuid import uuid4
 
 import bcrypt
 import jwt
 from fastapi import Request
 from password_validator import PasswordValidator
 
+from base.cache import LocalCache, publish_invalidation
 from base.enums import Error
 from base.exceptions import (
     BadRequestError,
@@ -13,11 +17,34 @@ from base.exceptions import (
     ForbiddenError,
     UnauthorizedError,
 )
-from base.settings import JWT_SECRET
+from base.settings import (
+    JWT_SECRET,
+    LOCAL_CACHE_TOKENS_MAX_BYTES,
+    LOCAL_CACHE_TOKENS_SIZE,
+    LOCAL_CACHE_TOKENS_TTL,
+    LOCAL_CACHE_USERS_MAX_BYTES,
+    LOCAL_CACHE_USERS_SIZE,
+    LOCAL_CACHE_USERS_TTL,
+    PASSWORD_HASH_QUEUE_SIZE,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+    PASSWORD_HASH_WORKERS,
+)
+from base.workers import WorkerPool
+from user import cache as user_cache
+from user import revocation
+from user.cache import UserStatus
 from user.models import User
-from user.schemas import CreateUserSchemaSchema, LoginUserSchema
+from user.revocation import revocations
+from user.schemas import CreateUserSchemaSchema, LoginUserSchema, LogoutSchema
 from user.services_db import create_user as create_user_db
-from user.services_db import get_user_by_id, get_user_by_username, user_exists
+from user.services_db import (
+    get_user_by_id,
+    get_user_by_username,
+    get_user_status,
+    get_user_statuses,
+    set_user_blocked,
+    user_exists,
+)
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 1
@@ -25,20 +52,51 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7
 password_schema = PasswordValidator()
 password_schema.min(8).has().lowercase().uppercase().digits().symbols()
 
+cached_users = LocalCache(
+    "users",
+    maxsize=LOCAL_CACHE_USERS_SIZE,
+    max_bytes=LOCAL_CACHE_USERS_MAX_BYTES,
+    ttl=LOCAL_CACHE_USERS_TTL,
+)
+# verified token payloads keyed by the token's digest and tagged by uid
+verified_tokens = LocalCache(
+    "tokens",
+    maxsize=LOCAL_CACHE_TOKENS_SIZE,
+    max_bytes=LOCAL_CACHE_TOKENS_MAX_BYTES,
+    ttl=LOCAL_CACHE_TOKENS_TTL,
+)
+# cached in place of the status of a user that doesn't exist
+USER_MISSING = object()
+
+password_hashers = WorkerPool(
+    "password_hash",
+    size=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_QUEUE_SIZE,
+    queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+
 
 class UserService:
     _user_exists = staticmethod(user_exists)
     _create_user = staticmethod(create_user_db)
     _get_user_by_username = staticmethod(get_user_by_username)
     _get_user_by_id = staticmethod(get_user_by_id)
+    _get_user_status = staticmethod(get_user_status)
+    _get_user_statuses = staticmethod(get_user_statuses)
+    _set_user_blocked = staticmethod(set_user_blocked)
 
     @staticmethod
-    def _hash_password(password: str) -> str:
-        return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    async def _hash_password(password: str) -> str:
+        hashed = await password_hashers.run(
+            bcrypt.hashpw, password.encode(), bcrypt.gensalt()
+        )
+        return hashed.decode()
 
     @staticmethod
-    def _verify_password(password: str, password_hash: str) -> bool:
-        return bcrypt.checkpw(password.encode(), password_hash.encode())
+    async def _verify_password(password: str, password_hash: str) -> bool:
+        return await password_hashers.run(
+            bcrypt.checkpw, password.encode(), password_hash.encode()
+        )
 
     @classmethod
     def create_jwt_token(
@@ -57,6 +115,8 @@ class UserService:
             "type": type_,
             "iat": now_,
             "exp": expire,
+            # lets a single token be revoked
+            "jti": uuid4().hex,
         }
 
         return jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
@@ -77,6 +137,33 @@ class UserService:
         except jwt.PyJWTError:
             return None
 
+    @classmethod
+    def decode_jwt_cached(cls, token: str) -> dict | None:
+        """``decode_jwt`` that remembers tokens it has verified.
+
+        Keyed by a digest, so the cache doesn't hold usable tokens; entries
+        expire with the token and are dropped by ``invalidate_user``.
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        payload = verified_tokens.get(key)
+        if payload is not None and payload["exp"] > time.time():
+            return payload
+        # no await until the set, so no invalidation can land in between
+        payload = cls.decode_jwt(token)
+        if (
+            payload is not None
+            and isinstance(payload.get("pk"), int)
+            and isinstance(payload.get("exp"), int)
+        ):
+            verified_tokens.set(
+                key,
+                payload,
+                tag=str(payload["pk"]),
+                size=256,
+                ttl=payload["exp"] - time.time(),
+            )
+        return payload
+
     @staticmethod
     def _get_bearer_token(request: Request) -> str | None:
         auth_header = request.headers.get("Authorization")
@@ -91,9 +178,15 @@ class UserService:
     def _decode_and_validate_token(
         cls, token: str, expected_type: Literal["access", "refresh"]
     ) -> dict | None:
-        payload = cls.decode_jwt(token)
+        # access tokens are presented on every request, refresh tokens rarely
+        if expected_type == "access":
+            payload = cls.decode_jwt_cached(token)
+        else:
+            payload = cls.decode_jwt(token)
         if not payload or payload.get("type") != expected_type:
             return None
+        if revocations.is_revoked(payload):
+            return None
         return payload
 
     @classmethod
@@ -113,8 +206,70 @@ class UserService:
         return payload["pk"]
 
     @classmethod
-    async def get_user_by_id(cls, uid: int) -> User | None:
-        return await cls._get_user_by_id(uid)
+    async def get_user_status(cls, uid: int) -> UserStatus | None:
+        """Return what authenticated writes need to know about a user.
+
+        Served from the local cache, then Redis, then the database; users
+        that don't exist are cached too.
+        """
+        key = ("status", uid)
+        status = cached_users.get(key)
+        if status is not None:
+            return None if status is USER_MISSING else status
+        epoch = cached_users.epoch(str(uid))
+        cached, status = await user_cache.get_status(uid)
+        if not cached:
+            row = await cls._get_user_status(uid)
+            status = UserStatus(**row) if row else None
+            await user_cache.set_status(uid, status)
+        cached_users.set(
+            key, status or USER_MISSING, tag=str(uid), size=256, epoch=epoch
+        )
+        return status
+
+    @classmethod
+    async def get_user_statuses(
+        cls, uids: Iterable[int]
+    ) -> Dict[int, UserStatus | None]:
+        """Return ``get_user_status`` of many users at once.
+
+        Users not cached locally are read with one MGET and those missing
+        from Redis with one query per batch, not a round trip per user.
+        """
+        statuses: Dict[int, UserStatus | None] = {}
+        missing = []
+        for uid in set(uids):
+            status = cached_users.get(("status", uid))
+            if status is None:
+                missing.append(uid)
+            else:
+                statuses[uid] = None if status is USER_MISSING else status
+        if not missing:
+            return statuses
+        epochs = {uid: cached_users.epoch(str(uid)) for uid in missing}
+        found = await user_cache.get_statuses(missing)
+        loaded = {uid: None for uid in missing if uid not in found}
+        if loaded:
+            for row in await cls._get_user_statuses(loaded):
+                loaded[row["id"]] = UserStatus(**row)
+            await user_cache.set_statuses(loaded)
+        found.update(loaded)
+        for uid, status in found.items():
+            cached_users.set(
+                ("status", uid),
+                status or USER_MISSING,
+                tag=str(uid),
+                size=256,
+                epoch=epochs[uid],
+            )
+        statuses.update(found)
+        return statuses
+
+    @staticmethod
+    async def invalidate_user(uid: int) -> None:
+        await user_cache.delete_status(uid)
+        await publish_invalidation(cached_users.name, str(uid))
+        await publish_invalidation(verified_tokens.name, str(uid))
 
     @classmethod
     async def register_user(cls, body: CreateUserSchemaSchema) -> User:
@@ -128,11 +283,14 @@ class UserService:
                 code="password_weak",
                 message=Error.PASSWORD_WEAK.value,
             )
-        return await cls._create_user(
+        user = await cls._create_user(
             username=body.username,
-            password=cls._hash_password(body.password),
+            password=await cls._hash_password(body.password),
             avatar_url=body.avatar_url,
         )
+        # drop a "missing" entry cached by a request that probed this id
+        await cls.invalidate_user(user.id)
+        return user
 
     @classmethod
     async def login_user(cls, body: LoginUserSchema) -> User:
@@ -142,7 +300,7 @@ class UserService:
                 code="user_not_found",
                 message=Error.USER_NOT_FOUND.value,
             )
-        if not cls._verify_password(body.password, user.password):
+        if not await cls._verify_password(body.password, user.password):
             raise BadRequestError(
                 code="invalid_password",
                 message=Error.INVALID_PASSWORD.value,
@@ -170,3 +328,33 @@ class UserService:
                 message="Invalid user",
             )
         return cls.create_jwt_token(user.id, "access_token")
+
+    @classmethod
+    async def logout(cls, request: Request, body: LogoutSchema) -> None:
+        """Revoke the presented access token and, if given, its refresh token."""
+        token = cls._get_bearer_token(request)
+        payload = cls._decode_and_validate_token(token, "access") if token else None
+        if not payload:
+            raise UnauthorizedError(
+                code="auth_invalid",
+                message="Invalid access token",
+            )
+        revoked = [payload]
+        if body.refresh_token:
+            refresh = cls._decode_and_validate_token(body.refresh_token, "refresh")
+            if refresh and refresh["pk"] == payload["pk"]:
+                revoked.append(refresh)
+        for item in revoked:
+            # tokens issued before jti existed can only be cut off by blocking
+            if item.get("jti"):
+                await revocation.revoke_token(item["jti"], item["exp"])
+
+    @classmethod
+    async def set_blocked(cls, uid: int, blocked: bool) -> None:
+        """Block or unblock a user; their tokens stop working at once."""
+        await cls._set_user_blocked(uid, blocked)
+        if blocked:
+            await revocation.block_user(uid)
+        else:
+            await revocation.unblock_user(uid)
+        await cls.invalidate_user(uid)
@@ -1,4 +1,6 @@
-from typing import Optional
+from typing import Iterable, List, Optional
+
+from tortoise.utils import chunk
 
 from user.models import User
 
@@ -19,3 +21,26 @@ async def get_user_by_username(username: str) -> Optional[User]:
 
 async def get_user_by_id(uid: int) -> Optional[User]:
     return await User.get_or_none(id=uid)
+
+
+async def get_user_status(uid: int) -> Optional[dict]:
+    return (
+        await User.filter(id=uid)
+        .first()
+        .values("id", "username", "avatar_url", "blocked")
+    )
+
+
+async def get_user_statuses(uids: Iterable[int], batch_size: int = 1000) -> List[dict]:
+    rows: List[dict] = []
+    for batch in chunk(list(uids), batch_size):
+        rows.extend(
+            await User.filter(id__in=batch).values(
+                "id", "username", "avatar_url", "blocked"
+            )
+        )
+    return rows
+
+
+async def set_user_blocked(uid: int, blocked: bool) -> None:
+    await User.filter(id=uid).update(blocked=blocked)